@@ -14,6 +14,8 @@ from .error import MaxRetriesExceeded
 from .block import BlockGroup
 from .file import File
 from .request import Request
+from .journal import replay
+from .state import is_packed
 
 
 __all__ = [
@@ -39,6 +41,7 @@ def dlopen(request, handlers=None, *, do_async=True, executors=None):
         progress = Progress((0, None))
         source_uri = None
         resp = None
+        probe = None
         exceptions = []
 
         max_retries = request.max_retries
@@ -49,7 +52,7 @@ def dlopen(request, handlers=None, *, do_async=True, executors=None):
             for source_uri in uris:
                 try:
                     client_cls = client_policy.get_solution(source_uri.protocol)
-                    resp = await client_cls.dlopen(
+                    resp, probe = await client_cls.probe(
                         source_uri, progress, **source_uri.kwargs)
                 except BaseException as err:
                     exceptions.append(err)
@@ -82,6 +85,7 @@ def dlopen(request, handlers=None, *, do_async=True, executors=None):
             File(path, name, size),
             uris,
             block_grp,
+            probe=probe,
             **opts
         )
 
@@ -90,10 +94,15 @@ def dlopen(request, handlers=None, *, do_async=True, executors=None):
         file = request
         if not os.path.isfile(file):
             raise FileNotFoundError(f'下载数据配置文件{file}未找到。')
-        with open(file, mode='r') as fd:
-            dumpy_json = fd.read()
-        dumpy = json.loads(dumpy_json)
-        return Downloader.loads(dumpy, handlers)
+        with open(file, mode='rb') as fd:
+            dumpy = fd.read()
+        # 兼容JSON格式的下载配置文件
+        if not is_packed(dumpy):
+            dumpy = json.loads(dumpy.decode('utf-8'))
+        downloader = Downloader.loads(dumpy, handlers)
+        # 重放快照之后的下载进度日志
+        replay(f'{file}.journal', downloader.block_grp)
+        return downloader
 
     async def do_open():
         if isinstance(request, Request):
@@ -73,7 +73,11 @@ from math import ceil
 from threading import RLock
 from time import time
 from .progress import Progress
+from array import array
 import bisect
+import struct
+import zlib
+import sys
 
 
 class Chunk:
@@ -106,9 +110,16 @@ class Block:
     既然不作为实时数据，那么不需要对其进行强制与实时数据对应。
     那么对于未确定大小的进度对象Progress，即大小为inf时，不必关注其大小，关注的是其下载的量的块记录。
     """
-    __slots__ = 'client', 'progress', '_chunk_size', '_range', '_chunks', '_lock'
+    __slots__ = 'client', 'progress', '_chunk_size', '_range', '_chunks', '_packed', '_lock'
 
-    def __init__(self, progress, chunk_size, init_chunks=None):
+    def __init__(self, progress, chunk_size, init_chunks=None, packed_chunks=None):
+        """
+        Args:
+            progress: 下载进度Progress对象
+            chunk_size: 块大小
+            init_chunks: 块记录[uri_id, begin, end]的列表
+            packed_chunks: pack_chunks()打包的块记录(data, compressed)，在首次访问块记录时才解包
+        """
         self.client = None
         self.progress = progress
         self._chunk_size = chunk_size
@@ -121,9 +132,13 @@ class Block:
 
         self._range = [begin, end]
         self._chunks = []
+        self._packed = None
 
         if init_chunks is not None:
             self._chunks = [Chunk(*chunk) for chunk in init_chunks]
+        elif packed_chunks is not None:
+            self._chunks = None
+            self._packed = packed_chunks
 
         self._lock = RLock()
         self.refresh()
@@ -146,7 +161,16 @@ class Block:
     @property
     def chunks(self):
         self.refresh()
-        return self._chunks
+        return self._load_chunks()
+
+    def _load_chunks(self):
+        """ 返回块记录列表，打包的块记录在此时解包。"""
+        chunks = self._chunks
+        if chunks is None:
+            data, compressed = self._packed
+            chunks = self._chunks = unpack_chunks(data, compressed)
+            self._packed = None
+        return chunks
 
     def current_uri(self):
         return self.client and self.client.source_uri
@@ -161,8 +185,8 @@ class Block:
         if self.progress.end in (None, float('inf')):
             return float('inf') if not self.progress.is_walk_finished() else 0
         self.refresh()
-
-        return (not self._chunks and self.length) or self.length - self._chunks[-1].end
+        chunks = self._load_chunks()
+        return (not chunks and self.length) or self.length - chunks[-1].end
 
     def __getitem__(self, index):
         assert type(index) is int
@@ -206,18 +230,16 @@ class Block:
 
             self._range[1] = block_end
 
-            last_chunk = (self._chunks and self._chunks[-1]) or None
-            if last_chunk is None:
-                if cur_uri is not None:
-                    self._chunks.append(Chunk(cur_uri.id, 0, cur_walk))
+            # 没有客户端时块记录不变，不必解包块记录
+            if cur_uri is not None:
+                chunks = self._load_chunks()
+                last_chunk = (chunks and chunks[-1]) or None
+                if last_chunk is None:
+                    chunks.append(Chunk(cur_uri.id, 0, cur_walk))
+                elif last_chunk.uri_id != cur_uri.id:
+                    chunks.append(Chunk(cur_uri.id, cur_walk, cur_walk))
                 else:
-                    pass
-            else:
-                if cur_uri is not None:
-                    if last_chunk.uri_id != cur_uri.id:
-                        self._chunks.append(Chunk(cur_uri.id, cur_walk, cur_walk))
-                    else:
-                        last_chunk.end = cur_walk
+                    last_chunk.end = cur_walk
 
     def half_unused(self):
         unused_len = self.unused_length()
@@ -244,6 +266,8 @@ class Block:
         self.refresh()
         client = self.client
         await client.__aexit__(exc_type, exc_val, exc_tb)
+        # 中断或出错退出的客户端不再接收申领的范围
+        self.progress.release()
         self.client = None
         block_context.set(None)
 
@@ -251,14 +275,20 @@ class Block:
         return {
             'progress': list(self.progress),
             'range': [self.begin, self.end],
-            'chunks': [list(c) for c in self._chunks]
+            'chunks': [list(c) for c in self._load_chunks()]
         }
 
+    def pack(self, compress=False):
+        """ 返回pack_chunks()打包的块记录，未解包的块记录直接返回。"""
+        if self._chunks is None and self._packed[1] == compress:
+            return self._packed[0]
+        return pack_chunks(self._load_chunks(), compress)
+
     def __repr__(self):
         return f'<Chunk [{self.begin}-{self.end}] {self.progress.percent_complete / 100:.2%} client={self.client}>'
 
     def __iter__(self):
-        return iter([list(self.progress), self._chunk_size, [list(block) for block in self._chunks]])
+        return iter([list(self.progress), self._chunk_size, [list(block) for block in self._load_chunks()]])
 
     def __lt__(self, other):
         return self.begin < other.begin
@@ -338,6 +368,38 @@ class BlockGroup:
 
         return block
 
+    def done_offset(self, offset=0):
+        """ 返回文件从offset开始连续已写入数据的结束位置。
+
+        可在下载器运行时从其他线程调用，下载块切片的同时调用只会使结果偏小。
+        """
+        end = offset
+        for block in list(self._blocks):
+            progress = block.progress
+            if progress.end is not None and progress.end <= end:
+                continue
+            if progress.begin > end:
+                break
+            end = max(end, progress.begin + progress.done_length)
+            if not progress.is_done_finished():
+                break
+        return end
+
+    def complete(self, block):
+        """ 以已完成的下载块替换下载块block，block不再属于下载块管理器。
+
+        用于下载块的数据已由其他连接写入文件的情况，仍在使用block的客户端不会影响替换后的下载块。
+
+        Returns:
+            替换后的下载块。
+        """
+        progress = block.progress
+        length = progress.total_length
+        completed = Block(Progress(progress.range, length, length), self.chunk_size,
+                          init_chunks=[list(c) for c in block.chunks])
+        self._blocks[self._blocks.index(block)] = completed
+        return completed
+
     def unfinished_blocks(self):
         return [b for b in self._blocks if not b.progress.is_walk_finished()]
 
@@ -395,6 +457,54 @@ class BlockGroup:
             bisect.insort(block_grp._blocks, block)
         return block_grp
 
+    def pack(self, compress=False):
+        """ 打包为二进制格式。
+
+        格式: 下载块管理器头部 + 各下载块头部 + 各下载块的块记录数据，
+        加载时只解析头部，块记录在首次访问时才解包。
+        """
+        total_size = self.total_size
+        if total_size in (None, float('inf')):
+            total_size = -1
+        blocks = list(self._blocks)
+        packed_chunks = [block.pack(compress) for block in blocks]
+        parts = [_GROUP_HEADER.pack(self.chunk_size, total_size, self._duration, len(blocks))]
+        for block, data in zip(blocks, packed_chunks):
+            progress = block.progress
+            end = progress.end
+            if end is None:
+                end = -1
+            parts.append(_BLOCK_HEADER.pack(
+                progress.begin, end, progress.walk_length, progress.done_length, len(data)))
+        parts.extend(packed_chunks)
+        return b''.join(parts)
+
+    @classmethod
+    def unpack(cls, data, compressed=False):
+        """ 从pack()打包的数据加载下载块管理器。
+
+        Args:
+            data: 打包的bytes或memoryview数据，未解包的块记录引用该数据
+            compressed: 块记录是否经过压缩
+        """
+        data = memoryview(data)
+        chunk_size, total_size, duration, count = _GROUP_HEADER.unpack_from(data)
+        if total_size < 0:
+            total_size = None
+        block_grp = cls(chunk_size, total_size, duration)
+
+        pos = _GROUP_HEADER.size
+        headers = _BLOCK_HEADER.iter_unpack(data[pos:pos + _BLOCK_HEADER.size * count])
+        pos += _BLOCK_HEADER.size * count
+        for begin, end, walk_length, done_length, length in headers:
+            if end < 0:
+                end = None
+            progress = Progress((begin, end), walk_length, done_length)
+            block = Block(progress, chunk_size, packed_chunks=(data[pos:pos + length], compressed))
+            bisect.insort(block_grp._blocks, block)
+            pos += length
+        return block_grp
+
     def __iter__(self):
         """ 迭代返回下载块对象。"""
         return iter([self.chunk_size, self.total_size, [list(block) for block in self._blocks]])
@@ -402,3 +512,31 @@ class BlockGroup:
     def __repr__(self):
         return f'<BlockGroup transfer_rate={round(self.transfer_rate() / 1024)} kb/s ' \
                f'percent={round(self.percent_complete(), 2)}%>'
+
+
+# 下载块管理器头部: chunk_size, total_size(-1为未知), duration, 下载块数量
+_GROUP_HEADER = struct.Struct('<QqdI')
+# 下载块头部: begin, end(-1为未知), walk_length, done_length, 块记录数据长度
+_BLOCK_HEADER = struct.Struct('<QqQQI')
+
+
+def pack_chunks(chunks, compress=False):
+    """ 将块记录打包为小端无符号64位整数(uri_id, begin, end)数组的bytes。"""
+    values = array('Q', [value for chunk in chunks for value in (chunk.uri_id, chunk.begin, chunk.end)])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    data = values.tobytes()
+    if compress:
+        data = zlib.compress(data, 1)
+    return data
+
+
+def unpack_chunks(data, compressed=False):
+    """ 解包pack_chunks()打包的块记录。"""
+    if compressed:
+        data = zlib.decompress(data)
+    values = array('Q')
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return [Chunk(*values[i:i + 3]) for i in range(0, len(values), 3)]
@@ -1,7 +1,12 @@
 
 
-from . import aiohttp, requests
+from . import aiohttp, requests, streams
 from .abstract import AbstractClient
+try:
+    from . import httpx
+except ImportError:
+    # 可选的HTTP/2客户端，依赖httpx[http2]
+    httpx = None
 from collections import defaultdict
 
 __all__ = ['get_policy', 'ClientPolicy']
@@ -52,10 +57,30 @@ class ProtocolSolution:
     def is_async(self):
         return self._module.ASYNC_EXECUTE
 
+    def supports_multirange(self):
+        """ 返回客户端是否支持多范围请求。"""
+        return getattr(self._module.ClientHandler, 'fetch_ranges', None) is not None
+
+    def supports_address_pinning(self):
+        """ 返回客户端是否支持将连接固定到下载源对象的address地址。"""
+        return getattr(self._module, 'ADDRESS_PINNING', False)
+
     @property
     def dlopen(self):
         return self._module.ClientHandler.dlopen
 
+    async def probe(self, source, progress, **kwargs):
+        """ 打开探测连接，并尽可能将探测连接或其已接收的数据交给下载器，参见ProbeStream。
+
+        Returns:
+            (UriResponse, ProbeStream)，客户端不支持交接时ProbeStream为None。
+        """
+        handler = self._module.ClientHandler
+        handover = getattr(handler, 'dlopen_handover', None)
+        if handover is None:
+            return await handler.dlopen(source, progress, **kwargs), None
+        return await handover(source, progress, **kwargs)
+
     def get_client(self, *args, **kwargs):
         return self._module.ClientHandler(*args, **kwargs)
 
@@ -77,6 +102,7 @@ def register(module):
     3. 使用ClientHandler作为客户端的类名，或通过赋值该模块变量名实现
     4. 使用ClientSession作为客户端会话，必须存在该变量，若不需要会话则赋值noop函数，
         客户端会话创建不提供参数，若需要提供使用functions.partial传递定义
+    5. 可选的模块变量ADDRESS_PINNING=True表示客户端的连接固定使用SourceURI.address地址
 
     Args:
         module: 协议处理解决方案
@@ -92,6 +118,11 @@ def register(module):
 def main():
     # 多线程HTTP/HTTPS，使用requests库
     register(requests)
+    # 异步HTTP/1.1，基于asyncio的轻量客户端
+    register(streams)
+    # 异步HTTP/2多路复用，使用httpx库
+    if httpx is not None:
+        register(httpx)
     # 异步HTTP/HTTPS，使用aiohttp库
     register(aiohttp)
 
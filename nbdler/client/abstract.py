@@ -34,6 +34,8 @@ class AbstractClient:
         self._closed = False
         self.session = session
         self.resp = None
+        # 自适应单次读取粒度控制器ReadSizeController，在客户端获取数据时创建
+        self.read_ctrl = None
 
     async def connect(self):
         """ (可定义非异步方法)客户端连接
@@ -103,6 +105,10 @@ class AbstractClient:
     def dlopen(cls, source, progress, **kwargs):
         raise NotImplementedError
 
+    # (可选) 类方法dlopen_handover(source, progress, **kwargs)，
+    # 与dlopen相同打开探测连接，返回(UriResponse, ProbeStream或None)以将探测连接或其已接收的数据交给下载器。
+    dlopen_handover = None
+
     def __repr__(self):
         status = 'running'
         if self._closed:
@@ -115,6 +121,51 @@ class AbstractClient:
                f'async={is_async}>'
 
 
+class ProbeStream:
+    """ dlopen()探测连接的交接对象。
+
+    探测连接请求的是资源从0开始的数据，交由下载器作为起点为0的下载块的数据来源。
+    在线程池中运行的客户端（requests）交接保持连接的客户端，下载块直接继续接收响应数据。
+    异步客户端的连接属于dlopen()的事件循环，只保留已接收的数据作为下载块的前缀，
+    探测连接随即关闭，下载块从前缀之后重新连接。
+    """
+    __slots__ = 'name', 'source_uri', 'client', 'prefix', '_session'
+
+    def __init__(self, name, source_uri, client=None, prefix=b'', session=None):
+        """
+        Args:
+            name: 探测连接的客户端名称
+            source_uri: 探测连接的下载源SourceURI对象
+            client: 保持连接的客户端，可直接继续接收响应数据，不能交接连接时为None
+            prefix: 探测连接已接收的响应数据
+            session: 客户端独占的会话，随交接对象关闭
+        """
+        self.name = name
+        self.source_uri = source_uri
+        self.client = client
+        self.prefix = prefix
+        self._session = session
+
+    def detach_client(self):
+        """ 取出保持连接的客户端。"""
+        client = self.client
+        self.client = None
+        return client
+
+    def close(self):
+        """ 关闭未被使用的连接和会话。"""
+        client = self.detach_client()
+        if client is not None:
+            client.close()
+        session = self._session
+        self._session = None
+        if session is not None:
+            session.close()
+
+    def __repr__(self):
+        return f'<ProbeStream name="{self.name}" live={self.client is not None} prefix={len(self.prefix)}>'
+
+
 def noop():
     """ ignore function. """
     return None
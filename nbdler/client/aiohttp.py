@@ -2,9 +2,13 @@
 
 import aiohttp
 import asyncio
+import socket
 from urllib.parse import urlunparse, urlparse
 from nbdler.uri import URIResponse
+from .abstract import ProbeStream
 from .base_http import BaseHTTPClient, content_range_fullsize, content_type_mimetype
+from .tls import TLSContexts
+from nbdler.utils import ReadSizeController
 from traceback import format_exc
 from nbdler.handler import h
 import logging
@@ -43,6 +47,10 @@ class AIOHTTPClient(BaseHTTPClient):
         timeout = self.kwargs.get('timeout', None) or AIOHTTPClient.TIMEOUT
         timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
 
+        if source_uri.address is not None and proxy is None:
+            # 到下载源主机的连接固定使用分配的IP地址
+            session = session.for_address(source_uri.hostname, source_uri.address)
+
         try:
             resp = await session.get(
                 uri,
@@ -50,9 +58,13 @@ class AIOHTTPClient(BaseHTTPClient):
                 cookies=cookies,
                 proxy=proxy,
                 timeout=timeout,
+                ssl=session.tls_context(source_uri),
             )
         except (aiohttp.ClientError, asyncio.TimeoutError) as error:
             raise nbdler.error.TimeoutError(f"{uri}") from error
+        except asyncio.CancelledError:
+            # 竞速或暂停取消的连接不作为下载源错误
+            raise
         except BaseException as error:
             log.debug(f'{error}', format_exc())
             raise nbdler.error.FatalError() from error
@@ -64,23 +76,30 @@ class AIOHTTPClient(BaseHTTPClient):
 
         if self.resume_capability is None:
             if resp.status not in (206, 200):
-                raise nbdler.error.FatalError(f"[{resp.status} {resp.reason}] '{resp.url}'")
+                raise nbdler.error.FatalError(f"[{resp.status} {resp.reason}] '{resp.url}'", status=resp.status)
             self.resume_capability = resp.status == 206
 
         elif self.resume_capability is True:
-            if not resp.status == 206:
-                raise nbdler.error.FatalError(f"[{resp.status} {resp.reason}] '{resp.url}'")
+            # 服务器不支持多范围请求时可能返回完整的资源，交由fetch_ranges()回退处理
+            if resp.status != 206 and (self.ranges is None or resp.status != 200):
+                raise nbdler.error.FatalError(f"[{resp.status} {resp.reason}] '{resp.url}'", status=resp.status)
 
         self.session = session
         self.resp = resp
         return response
 
     async def fetch(self):
+        """ 接收响应数据到文件缓冲区的缓冲块。
+
+        aiohttp的StreamReader只提供返回bytes的read()，每次读取有一次从返回数据到缓冲块的拷贝。
+        这是aiohttp客户端接受的结果，不依赖StreamReader内部的数据段结构把数据直接读入缓冲块。
+        读取长度小于StreamReader缓冲的数据段时，read()切出返回数据还有一次拷贝。
+        需要避免拷贝时使用streams客户端，它以readinto()将数据直接接收到缓冲块。
+        """
         session, resp = self.session, self.resp
         pg = self.progress
 
         speed_adjuster = h.speed_adjuster
-        slicer = h.slicer
         uri_mgr = h.uri_mgr
         file_data = h.file_data
 
@@ -89,21 +108,24 @@ class AIOHTTPClient(BaseHTTPClient):
         uri_mgr.success(resp)
 
         receive_data = resp.content.read
-        data = b''
+        # 数据填入缓冲块，填满后将缓冲块的切片交由文件缓冲区，避免bytes拼接的重复拷贝。
+        view = file_data.acquire_view()
+        buf_size = len(view)
+        offset = 0
+        read_ctrl = self.read_ctrl = ReadSizeController(
+            max_size=file_data.SLAB_SIZE, delay=uri_mgr.connection_delay(), limit=speed_adjuster.read_limit)
+        read_size = read_ctrl.size
         while True:
             if self._closed:
                 break
 
-            await speed_adjuster.acquire()
-            await slicer.response()
+            await speed_adjuster.acquire(read_size)
 
-            previous_len = len(data)
-            remain_len = pg.total_length - pg.walk_length
+            # 申领本次接收的长度，下载进度可能已被空闲的客户端切走末尾部分
+            remain_len = pg.claim(min(read_size, buf_size - offset))
             try:
-                if remain_len >= 8192:
-                    data += await receive_data(8192)
-                elif remain_len > 0:
-                    data += await receive_data(remain_len)
+                if remain_len > 0:
+                    data = await receive_data(remain_len)
                 else:
                     break
             except asyncio.TimeoutError as err:
@@ -113,29 +135,78 @@ class AIOHTTPClient(BaseHTTPClient):
                 uri_mgr.fatal(err)
                 break
 
-            walk_len = len(data) - previous_len
+            walk_len = len(data)
             if not walk_len:
                 if resp.content_length is None:
                     pg.set_walk_finish()
                 break
 
+            view[offset:offset + walk_len] = data
+            offset += walk_len
             pg.walk(walk_len)
+            read_size = read_ctrl.update(walk_len)
 
             if pg.walk_length >= pg.total_length:
                 break
-            elif len(data) >= 65536:  # 64 KB
-                await file_data.store(data)
-                data = b''
-        if data:
-            await file_data.store(data)
+            elif offset >= buf_size:
+                await file_data.store(view[:offset])
+                view = file_data.acquire_view()
+                buf_size = len(view)
+                offset = 0
+        if offset:
+            await file_data.store(view[:offset])
+        else:
+            file_data.release_view(view)
 
         pg.stop()
 
+    async def fetch_ranges(self):
+        """ 接收多范围请求的multipart/byteranges响应，并将各部分数据分配到各自的下载进度。
+
+        服务器不支持多范围请求时直接返回，由调用方对各下载块单独请求。
+        """
+        resp = self.resp
+        ranges = self.ranges
+
+        speed_adjuster = h.speed_adjuster
+        uri_mgr = h.uri_mgr
+        file_data = h.file_data
+
+        parser = self._multipart_parser(resp.headers.get('content-type'))
+        uri_mgr.set_multirange(parser is not None)
+        if parser is None:
+            return
+
+        for pg in ranges:
+            pg.start()
+
+        uri_mgr.success(resp)
+
+        receive_data = resp.content.read
+        while not self._closed and not parser.finished:
+            await speed_adjuster.acquire(65536)
+            try:
+                data = await receive_data(65536)
+                if not data:
+                    break
+                routes = self._route_ranges(parser.feed(data))
+            except asyncio.TimeoutError as err:
+                uri_mgr.timeout(err)
+                break
+            except BaseException as err:
+                uri_mgr.fatal(err)
+                break
+
+            for pg, data in routes:
+                await file_data.store(data, pg)
+
+        for pg in ranges:
+            pg.stop()
+
     async def run(self):
         if self.resp:
             self.close()
 
-        await h.slicer.response()
         try:
             resp = await self.connect()
         except nbdler.error.UriError as err:
@@ -143,10 +214,16 @@ class AIOHTTPClient(BaseHTTPClient):
             raise
         else:
             h.uri_mgr.success(resp)
+            connection = self.resp.connection
+            if connection is not None and connection.transport is not None:
+                self._record_tls(connection.transport.get_extra_info('ssl_object'))
 
             # self.validate_token(resp)
             if not self._closed:
-                await self.fetch()
+                if self.ranges is None:
+                    await self.fetch()
+                else:
+                    await self.fetch_ranges()
 
     def close(self):
         session = self.session
@@ -159,27 +236,149 @@ class AIOHTTPClient(BaseHTTPClient):
 
     @classmethod
     async def dlopen(cls, source, progress, **kwargs):
+        resp, _ = await cls.dlopen_handover(source, progress, **kwargs)
+        return resp
+
+    @classmethod
+    async def dlopen_handover(cls, source, progress, **kwargs):
         async with ClientSession() as session:
             async with cls(session, source, progress, None, **kwargs) as cli:
                 resp = await cli.connect()
                 size = resp.length
                 progress._range = (0, size)
+                # 探测连接属于dlopen()的事件循环，无法交接到下载器的事件循环。
+                # 仅保留已缓冲的数据作为前缀，探测连接随会话关闭，起点为0的下载块从前缀之后重新连接。
+                prefix = cli.resp.content.read_nowait(-1)
 
-        return resp
+        return resp, ProbeStream(NAME, source, prefix=prefix)
 
 
 NAME = 'aiohttp'
 PROTOCOL_SUPPORT = ('http', 'https')
 ASYNC_EXECUTE = True
+ADDRESS_PINNING = True
 
 ClientHandler = AIOHTTPClient
 
 
 class ClientSession(aiohttp.ClientSession):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 不再预热的源站
+        self._unpooled = set()
+        self._pinned_sessions = {}
+        self._tls = TLSContexts()
+
+    def tls_context(self, source_uri):
+        """ 返回下载源源站的缓存TLS会话的SSLContext，非HTTPS下载源返回True使用默认设置。"""
+        if source_uri.scheme != 'https':
+            return True
+        return self._tls.get(source_uri.hostname, source_uri.port or 443, source_uri.kwargs.get('verify', True))
+
+    def for_address(self, host, address):
+        """ 返回到host的连接固定使用address地址的会话。
+
+        aiohttp的连接池不区分连接的地址，因此每个地址使用独立连接池的子会话。
+        """
+        session = self._pinned_sessions.get((host, address))
+        if session is None:
+            session = ClientSession(connector=aiohttp.TCPConnector(resolver=_PinnedResolver(host, address)))
+            # 子会话与主会话共用源站的TLS会话缓存
+            session._tls = self._tls
+            self._pinned_sessions[(host, address)] = session
+        return session
+
+    def _source_session(self, source_uri):
+        """ 返回下载源的连接所用的会话，固定地址的下载源使用该地址的子会话。"""
+        proxies = source_uri.proxies or {}
+        if source_uri.address is not None and proxies.get(source_uri.scheme) is None:
+            return self.for_address(source_uri.hostname, source_uri.address)
+        return self
+
+    def idle_count(self, source_uri):
+        """ 返回连接池中到下载源源站的空闲连接数，无法获取时返回None。"""
+        # aiohttp没有公开连接池的空闲连接
+        conns = getattr(self._source_session(source_uri).connector, '_conns', None)
+        if conns is None:
+            return None
+        port = source_uri.port or (443 if source_uri.scheme == 'https' else 80)
+        count = 0
+        for key, idle in list(conns.items()):
+            if getattr(key, 'host', None) == source_uri.hostname and getattr(key, 'port', None) == port:
+                count += len([proto for proto, _ in idle if proto.is_connected()])
+        return count
+
+    async def prewarm(self, source_uri, n, timeout=None):
+        """ 以HEAD请求预先建立到下载源的连接，使连接池的空闲连接数达到n。
+
+        响应后连接留在连接池中供客户端复用。源站不保持连接时不再预热。
+        无法获取空闲连接数时每个源站只预热一次。
+
+        Args:
+            source_uri: 下载源SourceURI对象
+            n: 期望的空闲连接数
+            timeout: 建立连接的超时时间
+
+        Returns:
+            新建立的连接数
+        """
+        key = (source_uri.scheme, source_uri.hostname, source_uri.port, source_uri.address)
+        if n <= 0 or key in self._unpooled or self.closed:
+            return 0
+        idle = self.idle_count(source_uri)
+        count = n - (idle or 0)
+        if count <= 0:
+            return 0
+        proxies = source_uri.proxies or {}
+        proxy = proxies.get(source_uri.scheme)
+        session = self._source_session(source_uri)
+        timeout = timeout or AIOHTTPClient.TIMEOUT
+
+        if idle is None:
+            self._unpooled.add(key)
+
+        async def head():
+            async with session.head(source_uri.uri,
+                                    headers=source_uri.headers.items(),
+                                    cookies=source_uri.cookies,
+                                    proxy=proxy,
+                                    allow_redirects=False,
+                                    ssl=session.tls_context(source_uri),
+                                    timeout=aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)) as resp:
+                if resp.headers.get('Connection', '').lower() == 'close':
+                    self._unpooled.add(key)
+
+        await asyncio.gather(*[head() for _ in range(count)], return_exceptions=True)
+        return count
+
     async def close(self) -> None:
-        await super().close()
+        sessions = list(self._pinned_sessions.values())
+        self._pinned_sessions.clear()
+        await asyncio.gather(super().close(), *[session.close() for session in sessions])
 
         # doc: https://docs.aiohttp.org/en/latest/client_advanced.html#graceful-shutdown
         # 会话关闭强制等待避免异常
         await asyncio.sleep(0.25)
 
+
+class _PinnedResolver(aiohttp.abc.AbstractResolver):
+    """ 将指定主机解析为固定地址的解析器，其他主机使用默认解析器。"""
+    def __init__(self, host, address):
+        self._host = host
+        self._address = address
+        self._resolver = aiohttp.DefaultResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        if host != self._host:
+            return await self._resolver.resolve(host, port, family)
+        return [{
+            'hostname': host,
+            'host': self._address,
+            'port': port,
+            'family': socket.AF_INET6 if ':' in self._address else socket.AF_INET,
+            'proto': 0,
+            'flags': socket.AI_NUMERICHOST,
+        }]
+
+    async def close(self):
+        await self._resolver.close()
@@ -3,7 +3,9 @@
 from wsgiref.headers import Headers
 from urllib.parse import urlunparse
 from .abstract import AbstractClient
+from .tls import record_handshake
 from ..utils import update_range_field
+from nbdler.handler import h
 import logging
 
 log = logging.getLogger(__name__)
@@ -15,13 +17,23 @@ class BaseHTTPClient(AbstractClient):
     ASYNC_EXECUTE = None
     TIMEOUT = 10
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 多范围请求的下载进度Progress列表，为None时仅请求progress的范围
+        self.ranges = None
+
     def _build_uri_headers(self):
         source_uri = self.source_uri
         pg = self.progress
         uri = source_uri.uri
         headers = Headers(source_uri.headers.items())
 
-        if self.resume_capability is not False:
+        if self.ranges is not None:
+            # 多范围请求仅支持标准的Range请求头
+            headers.add_header('Range', multirange_field(
+                [(p.begin + p.walk_length, p.end) for p in self.ranges]))
+            uri = uri.replace(' ', '%20')
+        elif self.resume_capability is not False:
             range_field = source_uri.range_field
             if range_field is None:
                 range_field = {
@@ -44,6 +56,69 @@ class BaseHTTPClient(AbstractClient):
 
         return uri, headers
 
+    def _record_tls(self, ssl_object):
+        """ 记录当前连接的TLS握手是否恢复了会话，复用的连接不重复记录。"""
+        if ssl_object is None:
+            return
+        resumed = record_handshake(ssl_object)
+        if resumed is not None:
+            h.uri_mgr.tls_handshake(resumed)
+
+    def _multipart_parser(self, content_type):
+        """ 若为多范围请求的multipart/byteranges响应，返回响应体的解析器，否则返回None。"""
+        if self.ranges is None or content_type is None:
+            return None
+        mimetype, _, params = content_type.partition(';')
+        if mimetype.strip().lower() != 'multipart/byteranges':
+            return None
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'boundary' and value:
+                return MultipartByterangesParser(value.strip('"'))
+        return None
+
+    def _route_ranges(self, parts):
+        """ 将多范围响应的数据部分分配到各自的下载进度。
+
+        服务器合并相距较近的范围时，一个数据部分可能跨越范围之间未请求的间隔，间隔中的数据被丢弃。
+        先确定全部数据的去向再计入下载进度，存在无法分配的数据时不改变任何下载进度，
+        避免已计入下载进度的数据随异常一起被丢弃。
+
+        Args:
+            parts: MultipartByterangesParser.feed()返回的(偏移量, 数据)列表
+
+        Returns:
+            (下载进度Progress, 数据)的列表，数据已计入下载进度的walk_length。
+        """
+        ranges = self.ranges
+        # 各下载进度下一个待接收数据的位置
+        positions = {pg: pg.begin + pg.walk_length for pg in ranges}
+        routes = []
+        for offset, data in parts:
+            while data:
+                for pg in ranges:
+                    if positions[pg] <= offset < pg.end:
+                        break
+                else:
+                    # 位于请求的范围之间的间隔中时，跳到下一个范围
+                    following = [positions[pg] for pg in ranges if offset < positions[pg] < pg.end]
+                    if not following or not any(pg.end <= offset for pg in ranges):
+                        raise ValueError(f'unexpected range part at offset {offset}.')
+                    skip = min(following) - offset
+                    offset += skip
+                    data = data[skip:]
+                    continue
+                if positions[pg] != offset:
+                    raise ValueError(f'discontinuous range part at offset {offset}, expected {pg}.')
+                length = min(len(data), pg.end - offset)
+                routes.append((pg, bytes(data[:length])))
+                positions[pg] += length
+                offset += length
+                data = data[length:]
+        for pg, data in routes:
+            pg.walk(len(data))
+        return routes
+
     def close(self):
         session = self.session
         resp = self.resp
@@ -76,6 +151,94 @@ class BaseHTTPClient(AbstractClient):
         return True
 
 
+class MultipartByterangesParser:
+    """ multipart/byteranges响应体的流式解析器。
+
+    按照各部分头部的Content-Range定位数据，不在数据部分中搜索分隔符。
+    """
+    # 部分头部的最大长度
+    MAX_HEADER_SIZE = 16384
+
+    def __init__(self, boundary):
+        self._delimiter = b'--' + boundary.encode('latin-1')
+        self._buffer = bytearray()
+        self._offset = 0
+        self._remaining = 0
+        self.finished = False
+
+    def feed(self, data):
+        """ 输入响应体数据。
+
+        Args:
+            data: 响应体的后续数据
+
+        Returns:
+            [(偏移量, 数据memoryview), ...] 数据的偏移量为资源中的字节偏移。
+        """
+        parts = []
+        data = memoryview(data)
+        while data and not self.finished:
+            if self._remaining:
+                length = min(self._remaining, len(data))
+                parts.append((self._offset, data[:length]))
+                self._offset += length
+                self._remaining -= length
+                data = data[length:]
+                continue
+
+            buffer = self._buffer
+            buffer += data
+            data = memoryview(b'')
+            index = buffer.find(self._delimiter)
+            if index < 0 or len(buffer) < index + len(self._delimiter) + 2:
+                if len(buffer) > self.MAX_HEADER_SIZE:
+                    raise ValueError('multipart boundary not found.')
+                break
+            index += len(self._delimiter)
+            if buffer[index:index + 2] == b'--':
+                self.finished = True
+                break
+            header_end = buffer.find(b'\r\n\r\n', index)
+            if header_end < 0:
+                if len(buffer) - index > self.MAX_HEADER_SIZE:
+                    raise ValueError('multipart part header too large.')
+                break
+
+            content_range = None
+            for line in bytes(buffer[index:header_end]).decode('latin-1').split('\r\n'):
+                name, _, value = line.partition(':')
+                if name.strip().lower() == 'content-range':
+                    content_range = value.strip()
+            if content_range is None:
+                raise ValueError('multipart part without Content-Range.')
+            begin, end_with = content_range_span(content_range)
+            self._offset = begin
+            self._remaining = end_with - begin + 1
+
+            data = memoryview(bytes(buffer[header_end + 4:]))
+            buffer.clear()
+        return parts
+
+
+def multirange_field(ranges):
+    """ 构造多范围请求的Range请求头的值。
+
+    Args:
+        ranges: [(begin, end), ...] 范围不包括end本身
+
+    Returns:
+        如'bytes=0-99,200-299'的Range请求头的值。
+    """
+    return 'bytes=' + ','.join([f'{begin}-{end - 1}' for begin, end in ranges])
+
+
+def content_range_span(content_range):
+    """ 从HTTP响应头中的Content-Range中获取数据范围(begin, end_with)。"""
+    span = content_range.split(None, 1)[-1].split('/', 1)[0]
+    begin, end_with = span.split('-', 1)
+    return int(begin), int(end_with)
+
+
 def content_range_fullsize(content_range):
     """ 从HTTP响应头中的Content-Range中获取文件总长。"""
     if content_range is None:
@@ -0,0 +1,230 @@
+
+import asyncio
+import httpx
+# HTTP/2的支持依赖h2库，缺少时不注册该客户端。
+import h2
+from nbdler.uri import URIResponse
+from .base_http import BaseHTTPClient, content_range_fullsize, content_type_mimetype
+from nbdler.utils import ReadSizeController
+from traceback import format_exc
+from nbdler.handler import h
+import logging
+import nbdler
+
+log = logging.getLogger(__name__)
+
+
+class HTTP2Client(BaseHTTPClient):
+    """ 基于httpx的HTTP/2客户端。
+
+    同一源站的下载块范围请求作为多路复用的流共用一个HTTP/2连接，
+    每个流的接收窗口随数据被读取而更新，读取慢的流不会占用整个连接的接收窗口。
+    不支持HTTP/2的源站将自动使用HTTP/1.1。
+    """
+    TIMEOUT = 10
+
+    async def connect(self):
+        session = self.session
+        source_uri = self.source_uri
+        proxies = source_uri.proxies or {}
+        proxy = proxies.get(source_uri.scheme)
+        trust_env = source_uri.kwargs.get('trust_env', False) and not proxy
+        verify = source_uri.kwargs.get('verify', True)
+
+        cookies = source_uri.cookies
+        uri, headers = self._build_uri_headers()
+
+        timeout = self.kwargs.get('timeout', None) or HTTP2Client.TIMEOUT
+        timeout = httpx.Timeout(timeout, pool=None)
+
+        client = session.get_client(proxy=proxy, verify=verify, trust_env=trust_env)
+        try:
+            request = client.build_request(
+                'GET',
+                uri,
+                headers=list(headers.items()),
+                cookies=cookies,
+                timeout=timeout,
+            )
+            resp = await client.send(request, stream=True)
+        except (httpx.TransportError, asyncio.TimeoutError) as error:
+            raise nbdler.error.TimeoutError(f"{uri}") from error
+        except asyncio.CancelledError:
+            # 竞速或暂停取消的连接不作为下载源错误
+            raise
+        except BaseException as error:
+            log.debug(f'{error}', format_exc())
+            raise nbdler.error.FatalError() from error
+        else:
+            total_length = content_range_fullsize(resp.headers.get('content-range'))
+            response = URIResponse(str(resp.url), list(resp.headers.items()), resp.status_code, resp.reason_phrase,
+                                   total_length, content_type_mimetype(resp.headers.get('content-type')),
+                                   self.progress.range, resp.status_code == 206)
+
+        self.resp = resp
+        if self.resume_capability is None:
+            if resp.status_code not in (206, 200):
+                raise nbdler.error.FatalError(f"[{resp.status_code} {resp.reason_phrase}] '{resp.url}'", status=resp.status_code)
+            self.resume_capability = resp.status_code == 206
+
+        elif self.resume_capability is True:
+            if not resp.status_code == 206:
+                raise nbdler.error.FatalError(f"[{resp.status_code} {resp.reason_phrase}] '{resp.url}'", status=resp.status_code)
+
+        self.session = session
+        return response
+
+    async def fetch(self):
+        session, resp = self.session, self.resp
+        pg = self.progress
+
+        speed_adjuster = h.speed_adjuster
+        uri_mgr = h.uri_mgr
+        file_data = h.file_data
+
+        pg.start()
+
+        uri_mgr.success(resp)
+
+        receive_into = _StreamReader(resp.aiter_raw()).readinto
+        # 数据直接填入缓冲块，填满后将缓冲块的切片交由文件缓冲区。
+        view = file_data.acquire_view()
+        buf_size = len(view)
+        offset = 0
+        read_ctrl = self.read_ctrl = ReadSizeController(
+            max_size=file_data.SLAB_SIZE, delay=uri_mgr.connection_delay(), limit=speed_adjuster.read_limit)
+        read_size = read_ctrl.size
+        while True:
+            if self._closed:
+                break
+
+            await speed_adjuster.acquire(read_size)
+
+            # 申领本次接收的长度，下载进度可能已被空闲的客户端切走末尾部分
+            remain_len = pg.claim(min(read_size, buf_size - offset))
+            try:
+                if remain_len > 0:
+                    walk_len = await receive_into(view[offset:offset + remain_len])
+                else:
+                    break
+            except (httpx.TimeoutException, asyncio.TimeoutError) as err:
+                uri_mgr.timeout(err)
+                break
+            except BaseException as err:
+                uri_mgr.fatal(err)
+                break
+
+            if not walk_len:
+                if resp.headers.get('content-length') is None:
+                    pg.set_walk_finish()
+                break
+
+            offset += walk_len
+            pg.walk(walk_len)
+            read_size = read_ctrl.update(walk_len)
+
+            if pg.walk_length >= pg.total_length:
+                break
+            elif offset >= buf_size:
+                await file_data.store(view[:offset])
+                view = file_data.acquire_view()
+                buf_size = len(view)
+                offset = 0
+        if offset:
+            await file_data.store(view[:offset])
+        else:
+            file_data.release_view(view)
+
+        pg.stop()
+
+    async def run(self):
+        if self.resp:
+            await self.close()
+
+        try:
+            resp = await self.connect()
+        except nbdler.error.UriError as err:
+            h.uri_mgr.fatal(err)
+            raise
+        else:
+            h.uri_mgr.success(resp)
+
+            if not self._closed:
+                await self.fetch()
+
+    async def close(self):
+        resp = self.resp
+        self.session = None
+        self.resp = None
+        if resp is not None:
+            # 关闭响应仅重置对应的HTTP/2流，连接由会话保留继续复用。
+            await resp.aclose()
+
+    @classmethod
+    async def dlopen(cls, source, progress, **kwargs):
+        async with ClientSession() as session:
+            async with cls(session, source, progress, None, **kwargs) as cli:
+                resp = await cli.connect()
+                size = resp.length
+                progress._range = (0, size)
+
+        return resp
+
+
+class _StreamReader:
+    """ 将httpx响应的数据流转换成readinto()的读取方式。"""
+    __slots__ = '_aiter', '_pending'
+
+    def __init__(self, aiter):
+        self._aiter = aiter
+        self._pending = memoryview(b'')
+
+    async def readinto(self, view):
+        pending = self._pending
+        if not pending:
+            try:
+                pending = memoryview(await self._aiter.__anext__())
+            except StopAsyncIteration:
+                return 0
+        length = min(len(view), len(pending))
+        view[:length] = pending[:length]
+        self._pending = pending[length:]
+        return length
+
+
+class ClientSession:
+    """ HTTP/2客户端会话。
+
+    httpx的代理和证书校验只能在客户端级别设置，因此按(代理, 证书校验, 使用环境代理)
+    创建并共享httpx.AsyncClient，每个AsyncClient对每个源站保持一个HTTP/2连接。
+    """
+    def __init__(self):
+        self._clients = {}
+
+    def get_client(self, proxy=None, verify=True, trust_env=False):
+        key = (proxy, verify, trust_env)
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=True, proxy=proxy, verify=verify, trust_env=trust_env,
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+            self._clients[key] = client
+        return client
+
+    async def close(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        await asyncio.gather(*[client.aclose() for client in clients])
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+NAME = 'httpx'
+PROTOCOL_SUPPORT = ('http', 'https')
+ASYNC_EXECUTE = True
+
+ClientHandler = HTTP2Client
@@ -1,9 +1,20 @@
 
 
+import asyncio
 import requests
+import threading
+import socket
+import ssl
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from nbdler.uri import URIResponse
 from traceback import format_exc
+from .abstract import ProbeStream
 from .base_http import BaseHTTPClient, content_range_fullsize, content_type_mimetype
+from .tls import TLSContexts
+from nbdler.utils import ReadSizeController
 from nbdler.handler import h
 import logging
 import nbdler
@@ -18,22 +29,20 @@ class HTTPClient(BaseHTTPClient):
     def connect(self):
         session = self.session
         source_uri = self.source_uri
-        proxies = source_uri.proxies or {}
-        if not proxies.get(source_uri.scheme):
-            if source_uri.kwargs.get('trust_env', False):
-                # Set environment's proxies.
-                no_proxy = proxies.get('no_proxy') if proxies is not None else None
-                env_proxies = get_environ_proxies(source_uri.uri, no_proxy=no_proxy)
-                for (k, v) in env_proxies.items():
-                    proxies.setdefault(k, v)
+        proxies = _source_proxies(source_uri)
 
         cookies = source_uri.cookies
         verify = source_uri.kwargs.get('verify', True)
         uri, headers = self._build_uri_headers()
         timeout = self.kwargs.get('timeout', None) or HTTPClient.TIMEOUT
+        if isinstance(session, PooledSession):
+            if source_uri.address is not None and not proxies.get(source_uri.scheme):
+                # 到下载源主机的连接固定使用分配的IP地址
+                session = session.for_address(source_uri.hostname, source_uri.address)
+            session.mount_pool(source_uri, _pool_maxsize(source_uri))
         try:
-            resp = requests.get(
-                source_uri.uri,
+            resp = session.get(
+                uri,
                 headers=headers,
                 proxies=proxies,
                 cookies=cookies,
@@ -54,12 +63,13 @@ class HTTPClient(BaseHTTPClient):
 
         if self.resume_capability is None:
             if resp.status_code not in (206, 200):
-                raise nbdler.error.FatalError(f"[{resp.status_code} {resp.reason}] '{resp.url}'")
+                raise nbdler.error.FatalError(f"[{resp.status_code} {resp.reason}] '{resp.url}'", status=resp.status_code)
             self.resume_capability = resp.status_code == 206
 
         elif self.resume_capability is True:
-            if not resp.status_code == 206:
-                raise nbdler.error.FatalError(f"[{resp.status_code} {resp.reason}] '{resp.url}'")
+            # 服务器不支持多范围请求时可能返回完整的资源，交由fetch_ranges()回退处理
+            if resp.status_code != 206 and (self.ranges is None or resp.status_code != 200):
+                raise nbdler.error.FatalError(f"[{resp.status_code} {resp.reason}] '{resp.url}'", status=resp.status_code)
 
         self.session = session
         self.resp = resp
@@ -70,60 +80,121 @@ class HTTPClient(BaseHTTPClient):
         pg = self.progress
 
         speed_adjuster = h.speed_adjuster
-        slicer = h.slicer
         uri_mgr = h.uri_mgr
         file_data = h.file_data
-        receive_data = resp.raw.read
+        receive_into = resp.raw.readinto
 
         pg.start()
 
         uri_mgr.success(resp)
 
-        data = b''
+        # 数据直接读入缓冲块，填满后将缓冲块的切片交由文件缓冲区，避免bytes拼接的重复拷贝。
+        view = file_data.acquire_view()
+        buf_size = len(view)
+        offset = 0
+        read_ctrl = self.read_ctrl = ReadSizeController(
+            max_size=file_data.SLAB_SIZE, delay=uri_mgr.connection_delay(), limit=speed_adjuster.read_limit)
+        read_size = read_ctrl.size
         while True:
             if self._closed:
                 break
 
-            speed_adjuster.acquire_threadsafe()
-            slicer.response_threadsafe()
+            speed_adjuster.acquire_threadsafe(read_size)
 
-            previous_len = len(data)
-            remain_len = pg.total_length - pg.walk_length
+            # 申领本次接收的长度，下载进度可能已被空闲的客户端切走末尾部分
+            remain_len = pg.claim(min(read_size, buf_size - offset))
             try:
-                if remain_len >= 8192:
-                    data += receive_data(8192)
-                elif remain_len > 0:
-                    data += receive_data(remain_len)
+                if remain_len > 0:
+                    walk_len = receive_into(view[offset:offset + remain_len])
                 else:
                     break
-            except requests.exceptions.Timeout as err:
-                uri_mgr.timeout(err)
+            except (requests.exceptions.Timeout, ReadTimeoutError) as err:
+                if not self._closed:
+                    uri_mgr.timeout(err)
                 break
             except BaseException as err:
-                uri_mgr.fatal(err)
+                if not self._closed:
+                    # 暂停或中断时关闭套接字导致的接收错误不计入下载源错误
+                    uri_mgr.fatal(err)
                 break
 
-            walk_len = len(data) - previous_len
             if not walk_len:
 
                 if resp.headers.get('content-length') is None:
                     pg.set_walk_finish()
                 break
 
+            offset += walk_len
             pg.walk(walk_len)
+            read_size = read_ctrl.update(walk_len)
 
             if pg.walk_length >= pg.total_length:
                 break
-            elif len(data) >= 65536:  # 64 KB
-                file_data.store_threadsafe(data)
-                data = b''
-        if data:
-            file_data.store_threadsafe(data)
+            elif offset >= buf_size:
+                file_data.store_threadsafe(view[:offset])
+                view = file_data.acquire_view()
+                buf_size = len(view)
+                offset = 0
+        if offset:
+            file_data.store_threadsafe(view[:offset])
+        else:
+            file_data.release_view(view)
 
         pg.stop()
 
+    def fetch_ranges(self):
+        """ 接收多范围请求的multipart/byteranges响应，并将各部分数据分配到各自的下载进度。
+
+        服务器不支持多范围请求时直接返回，由调用方对各下载块单独请求。
+        """
+        resp = self.resp
+        ranges = self.ranges
+
+        speed_adjuster = h.speed_adjuster
+        uri_mgr = h.uri_mgr
+        file_data = h.file_data
+
+        parser = self._multipart_parser(resp.headers.get('content-type'))
+        uri_mgr.set_multirange(parser is not None)
+        if parser is None:
+            return
+
+        for pg in ranges:
+            pg.start()
+
+        uri_mgr.success(resp)
+
+        receive_data = resp.raw.read
+        while not self._closed and not parser.finished:
+            speed_adjuster.acquire_threadsafe(65536)
+            try:
+                data = receive_data(65536)
+                if not data:
+                    break
+                routes = self._route_ranges(parser.feed(data))
+            except (requests.exceptions.Timeout, ReadTimeoutError) as err:
+                if not self._closed:
+                    uri_mgr.timeout(err)
+                break
+            except BaseException as err:
+                if not self._closed:
+                    # 暂停或中断时关闭套接字导致的接收错误不计入下载源错误
+                    uri_mgr.fatal(err)
+                break
+
+            for pg, data in routes:
+                file_data.store_threadsafe(data, pg)
+
+        for pg in ranges:
+            pg.stop()
+
     def run(self):
-        h.slicer.response_threadsafe()
+        if self.resp is not None:
+            # 交接的探测连接已经连接，直接继续接收数据
+            if not self._closed:
+                self.fetch()
+            return
+
         try:
             resp = self.connect()
         except nbdler.error.UriError as err:
@@ -131,20 +202,267 @@ class HTTPClient(BaseHTTPClient):
             raise
         else:
             h.uri_mgr.success(resp)
+            self._record_tls(_response_ssl_socket(self.resp))
 
-            self.validate_token(resp)
             if not self._closed:
-                self.fetch()
+                if self.ranges is None:
+                    self.validate_token(resp)
+                    self.fetch()
+                else:
+                    self.fetch_ranges()
+
+    def close(self):
+        resp = self.resp
+        if resp is not None and resp.raw.length_remaining == 0:
+            # 响应数据已完全接收，归还连接到连接池以复用keep-alive连接。
+            resp.raw.release_conn()
+            self.resp = None
+        else:
+            self._shutdown()
+        super().close()
+
+    async def pause(self):
+        self._closed = True
+        # 接收线程可能阻塞在readinto()中直到超时，关闭套接字使其立即返回
+        self._shutdown()
+
+    def _shutdown(self):
+        """ 关闭响应所用连接的套接字，阻塞中的接收立即返回，连接不再归还连接池。"""
+        resp = self.resp
+        if resp is None:
+            return
+        sock = getattr(resp.raw.connection, 'sock', None)
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
     @classmethod
     async def dlopen(cls, source, progress, **kwargs):
-        with cls(None, source, progress, None, **kwargs) as cli:
+        session = session_without_trust_env()
+        with session:
+            with cls(session, source, progress, None, **kwargs) as cli:
+                resp = cli.connect()
+                return resp
+
+    @classmethod
+    async def dlopen_handover(cls, source, progress, **kwargs):
+        session = session_without_trust_env()
+        cli = cls(session, source, progress, None, **kwargs)
+        try:
             resp = cli.connect()
-            return resp
+        except BaseException:
+            session.close()
+            raise
+        progress._range = (0, resp.length)
+        # 同步客户端的连接不依赖事件循环，探测连接保持打开交由下载器继续接收数据。
+        return resp, ProbeStream(NAME, source, client=cli, session=session)
+
+
+def _source_proxies(source_uri):
+    """ 返回下载源所用的代理，设置了trust_env时补充环境中的代理。"""
+    proxies = source_uri.proxies or {}
+    if not proxies.get(source_uri.scheme):
+        if source_uri.kwargs.get('trust_env', False):
+            # Set environment's proxies.
+            no_proxy = proxies.get('no_proxy') if proxies is not None else None
+            env_proxies = get_environ_proxies(source_uri.uri, no_proxy=no_proxy)
+            for (k, v) in env_proxies.items():
+                proxies.setdefault(k, v)
+    return proxies
+
+
+def _pool_maxsize(source_uri):
+    """ 返回下载源连接池的大小，由下载并发数和下载源的最大连接数决定。"""
+    try:
+        max_concurrent = h.client_worker.max_concurrent
+    except LookupError:
+        # 不在下载器的上下文中，如dlopen()
+        max_concurrent = 1
+    max_conn = source_uri.max_conn
+    if max_conn is not None:
+        max_concurrent = min(max_concurrent, max_conn)
+    return max(max_concurrent, 1)
+
+
+class PooledSession(requests.Session):
+    """ 按源站共享连接池的requests会话。
+
+    每个下载源的源站挂载独立的HTTPAdapter，连接池大小由下载并发数和下载源的最大连接数决定，
+    使得下载块的连接以及切片后的重连都能复用已建立的keep-alive连接。
+    """
+    def __init__(self, pinned=None):
+        """
+        Args:
+            pinned: (主机, IP地址)，到该主机的连接固定使用该地址
+        """
+        super().__init__()
+        self._pool_lock = threading.Lock()
+        self._pool_sizes = {}
+        self._pinned = pinned
+        self._pinned_sessions = {}
+        self._tls = TLSContexts()
+
+    def for_address(self, host, address):
+        """ 返回到host的连接固定使用address地址的会话。
+
+        urllib3的连接池按主机区分，因此每个地址使用独立连接池的子会话。
+        """
+        with self._pool_lock:
+            session = self._pinned_sessions.get((host, address))
+            if session is None:
+                session = PooledSession(pinned=(host, address))
+                session.trust_env = self.trust_env
+                # 子会话与主会话共用源站的TLS会话缓存
+                session._tls = self._tls
+                self._pinned_sessions[(host, address)] = session
+        return session
+
+    def mount_pool(self, source_uri, maxsize):
+        """ 为下载源的源站挂载指定大小的连接池。
+
+        Args:
+            source_uri: 下载源SourceURI对象
+            maxsize: 连接池保留的最大连接数
+        """
+        prefix = f'{source_uri.scheme}://{source_uri.netloc}/'.lower()
+        with self._pool_lock:
+            if self._pool_sizes.get(prefix, 0) >= maxsize:
+                return
+            if self._pinned is None:
+                adapter = TLSSessionAdapter(self._tls, pool_connections=1, pool_maxsize=maxsize)
+            else:
+                adapter = PinnedHTTPAdapter(*self._pinned, self._tls, pool_connections=1, pool_maxsize=maxsize)
+            previous = self.adapters.get(prefix)
+            self.mount(prefix, adapter)
+            self._pool_sizes[prefix] = maxsize
+        if previous is not None:
+            # 被替换的连接池及其keep-alive连接立即关闭
+            previous.close()
+
+    def idle_count(self, source_uri, proxies=None):
+        """ 返回连接池中到下载源源站的空闲连接数。"""
+        adapter = self.get_adapter(source_uri.uri)
+        verify = source_uri.kwargs.get('verify', True)
+        if hasattr(adapter, 'get_connection_with_tls_context'):
+            request = requests.Request('HEAD', source_uri.uri).prepare()
+            pool = adapter.get_connection_with_tls_context(request, verify, proxies)
+        else:
+            pool = adapter.get_connection(source_uri.uri, proxies)
+        queue = getattr(pool.pool, 'queue', None)
+        if queue is None:
+            return 0
+        return len([conn for conn in list(queue) if conn is not None and conn.sock is not None])
+
+    async def prewarm(self, source_uri, n, timeout=None):
+        """ 在线程池中以HEAD请求预先建立到下载源的连接，使连接池的空闲连接数达到n。
+
+        连接池按客户端所用的大小挂载，响应后连接归还连接池供客户端复用。
+
+        Args:
+            source_uri: 下载源SourceURI对象
+            n: 期望的空闲连接数
+            timeout: 建立连接的超时时间
+
+        Returns:
+            新建立的连接数
+        """
+        proxies = _source_proxies(source_uri)
+        session = self
+        if source_uri.address is not None and not proxies.get(source_uri.scheme):
+            session = self.for_address(source_uri.hostname, source_uri.address)
+        maxsize = _pool_maxsize(source_uri)
+        session.mount_pool(source_uri, maxsize)
+        loop = asyncio.get_running_loop()
+        idle = await loop.run_in_executor(None, session.idle_count, source_uri, proxies)
+        count = min(n, maxsize) - idle
+        if count <= 0:
+            return 0
+        timeout = timeout or HTTPClient.TIMEOUT
+
+        def head():
+            session.head(source_uri.uri,
+                         headers=dict(source_uri.headers.items()),
+                         proxies=proxies,
+                         cookies=source_uri.cookies,
+                         timeout=timeout,
+                         verify=source_uri.kwargs.get('verify', True),
+                         allow_redirects=False).close()
+
+        await asyncio.gather(*[loop.run_in_executor(None, head) for _ in range(count)],
+                             return_exceptions=True)
+        return count
+
+    def close(self):
+        with self._pool_lock:
+            sessions = list(self._pinned_sessions.values())
+            self._pinned_sessions.clear()
+        for session in sessions:
+            session.close()
+        super().close()
+
+
+class TLSSessionAdapter(HTTPAdapter):
+    """ HTTPS连接使用源站的缓存TLS会话的SSLContext的HTTPAdapter。"""
+    def __init__(self, tls_contexts, **kwargs):
+        self._tls = tls_contexts
+        super().__init__(**kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if host_params['scheme'] == 'https':
+            # CA证书已由SSLContext加载
+            pool_kwargs.pop('ca_certs', None)
+            pool_kwargs.pop('ca_cert_dir', None)
+            pool_kwargs['ssl_context'] = self._tls.get(host_params['host'], host_params['port'] or 443, verify)
+        return host_params, pool_kwargs
+
+
+class PinnedHTTPAdapter(TLSSessionAdapter):
+    """ 到指定主机的连接固定使用指定IP地址的HTTPAdapter。
+
+    仅替换建立套接字时连接的地址，请求头的Host和TLS的SNI及证书校验仍使用主机名。
+    """
+    def __init__(self, host, address, tls_contexts, **kwargs):
+        self._pinned = (host, address)
+        super().__init__(tls_contexts, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        host, address = self._pinned
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('PinnedHTTPConnectionPool', (HTTPConnectionPool,),
+                         {'ConnectionCls': _pinned_connection(HTTPConnection, host, address)}),
+            'https': type('PinnedHTTPSConnectionPool', (HTTPSConnectionPool,),
+                          {'ConnectionCls': _pinned_connection(HTTPSConnection, host, address)}),
+        }
+
+
+def _pinned_connection(connection_cls, host, address):
+    """ 返回到host的套接字连接固定使用address地址的urllib3连接类。"""
+    class PinnedConnection(connection_cls):
+        def _new_conn(self):
+            dns_host = self._dns_host
+            if dns_host.rstrip('.') == host:
+                self._dns_host = address
+            try:
+                return super()._new_conn()
+            finally:
+                self._dns_host = dns_host
+
+    return PinnedConnection
+
+
+def _response_ssl_socket(resp):
+    """ 返回响应所用连接的SSLSocket，非TLS连接返回None。"""
+    sock = getattr(resp.raw.connection, 'sock', None)
+    return sock if isinstance(sock, ssl.SSLSocket) else None
 
 
 def session_without_trust_env():
-    session = requests.Session()
+    session = PooledSession()
     # 默认创建不使用环境中的代理的会话，如要使用设置下载源的trust_env参数。
     session.trust_env = False
     return session
@@ -153,6 +471,7 @@ def session_without_trust_env():
 NAME = 'requests'
 PROTOCOL_SUPPORT = ('http', 'https')
 ASYNC_EXECUTE = False
+ADDRESS_PINNING = True
 
 ClientHandler = HTTPClient
 ClientSession = session_without_trust_env
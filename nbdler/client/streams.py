@@ -0,0 +1,749 @@
+
+import asyncio
+import time
+from collections import deque, defaultdict
+from functools import partial
+from base64 import b64encode
+from urllib.parse import urljoin, urlparse, unquote
+from urllib.request import getproxies
+from nbdler.uri import URIResponse
+from .abstract import ProbeStream
+from .base_http import BaseHTTPClient, content_range_fullsize, content_type_mimetype
+from .tls import TLSContexts
+from nbdler.utils import ReadSizeController
+from traceback import format_exc
+from nbdler.handler import h
+import logging
+import nbdler
+
+log = logging.getLogger(__name__)
+
+
+class StreamsClient(BaseHTTPClient):
+    """ 基于asyncio.BufferedProtocol的轻量HTTP/1.1客户端。
+
+    仅实现范围下载所需的GET请求：keep-alive连接复用、chunked和identity响应体、重定向。
+    响应体数据由传输层直接接收到下载缓冲块中，不经过中间缓冲。
+    """
+    TIMEOUT = 10
+
+    # 最大重定向次数
+    MAX_REDIRECTS = 10
+
+    async def connect(self):
+        session = self.session
+        source_uri = self.source_uri
+        proxy, verify, address = _source_options(source_uri)
+
+        uri, headers = self._build_uri_headers()
+        cookies = source_uri.cookies
+        if cookies:
+            headers.add_header('Cookie', '; '.join([f'{k}={v}' for k, v in cookies.items()]))
+
+        timeout = self.kwargs.get('timeout', None) or StreamsClient.TIMEOUT
+
+        try:
+            resp = await session.request(uri, list(headers.items()), proxy=proxy, verify=verify, address=address,
+                                         timeout=timeout, max_redirects=StreamsClient.MAX_REDIRECTS)
+        except (OSError, asyncio.TimeoutError, HTTPProtocolError) as error:
+            raise nbdler.error.TimeoutError(f"{uri}") from error
+        except asyncio.CancelledError:
+            # 竞速或暂停取消的连接不作为下载源错误
+            raise
+        except BaseException as error:
+            log.debug(f'{error}', format_exc())
+            raise nbdler.error.FatalError() from error
+        else:
+            total_length = content_range_fullsize(resp.getheader('content-range'))
+            response = URIResponse(resp.url, resp.headers, resp.status, resp.reason,
+                                   total_length, content_type_mimetype(resp.getheader('content-type')),
+                                   self.progress.range, resp.status == 206)
+
+        self.resp = resp
+        if self.resume_capability is None:
+            if resp.status not in (206, 200):
+                raise nbdler.error.FatalError(f"[{resp.status} {resp.reason}] '{resp.url}'", status=resp.status)
+            self.resume_capability = resp.status == 206
+
+        elif self.resume_capability is True:
+            # 服务器不支持多范围请求时可能返回完整的资源，交由fetch_ranges()回退处理
+            if resp.status != 206 and (self.ranges is None or resp.status != 200):
+                raise nbdler.error.FatalError(f"[{resp.status} {resp.reason}] '{resp.url}'", status=resp.status)
+
+        self.session = session
+        return response
+
+    async def fetch(self):
+        session, resp = self.session, self.resp
+        pg = self.progress
+
+        speed_adjuster = h.speed_adjuster
+        uri_mgr = h.uri_mgr
+        file_data = h.file_data
+
+        pg.start()
+
+        uri_mgr.success(resp)
+
+        receive_into = resp.readinto
+        # 响应体数据由传输层直接接收到缓冲块中，填满后将缓冲块的切片交由文件缓冲区。
+        view = file_data.acquire_view()
+        buf_size = len(view)
+        offset = 0
+        read_ctrl = self.read_ctrl = ReadSizeController(
+            max_size=file_data.SLAB_SIZE, delay=uri_mgr.connection_delay(), limit=speed_adjuster.read_limit)
+        read_size = read_ctrl.size
+        while True:
+            if self._closed:
+                break
+
+            await speed_adjuster.acquire(read_size)
+
+            # 申领本次接收的长度，下载进度可能已被空闲的客户端切走末尾部分
+            remain_len = pg.claim(min(read_size, buf_size - offset))
+            try:
+                if remain_len > 0:
+                    walk_len = await receive_into(view[offset:offset + remain_len])
+                else:
+                    break
+            except asyncio.TimeoutError as err:
+                uri_mgr.timeout(err)
+                break
+            except BaseException as err:
+                uri_mgr.fatal(err)
+                break
+
+            if not walk_len:
+                if resp.length is None:
+                    pg.set_walk_finish()
+                break
+
+            offset += walk_len
+            pg.walk(walk_len)
+            read_size = read_ctrl.update(walk_len)
+
+            if pg.walk_length >= pg.total_length:
+                break
+            elif offset >= buf_size:
+                await file_data.store(view[:offset])
+                view = file_data.acquire_view()
+                buf_size = len(view)
+                offset = 0
+        if offset:
+            await file_data.store(view[:offset])
+        else:
+            file_data.release_view(view)
+
+        pg.stop()
+
+    async def fetch_ranges(self):
+        """ 接收多范围请求的multipart/byteranges响应，并将各部分数据分配到各自的下载进度。
+
+        服务器不支持多范围请求时直接返回，由调用方对各下载块单独请求。
+        """
+        resp = self.resp
+        ranges = self.ranges
+
+        speed_adjuster = h.speed_adjuster
+        uri_mgr = h.uri_mgr
+        file_data = h.file_data
+
+        parser = self._multipart_parser(resp.getheader('content-type'))
+        uri_mgr.set_multirange(parser is not None)
+        if parser is None:
+            return
+
+        for pg in ranges:
+            pg.start()
+
+        uri_mgr.success(resp)
+
+        buf = bytearray(65536)
+        view = memoryview(buf)
+        while not self._closed and not parser.finished:
+            await speed_adjuster.acquire(65536)
+            try:
+                length = await resp.readinto(view)
+                if not length:
+                    break
+                routes = self._route_ranges(parser.feed(view[:length]))
+            except asyncio.TimeoutError as err:
+                uri_mgr.timeout(err)
+                break
+            except BaseException as err:
+                uri_mgr.fatal(err)
+                break
+
+            for pg, data in routes:
+                await file_data.store(data, pg)
+
+        for pg in ranges:
+            pg.stop()
+
+    async def run(self):
+        if self.resp:
+            self.close()
+
+        try:
+            resp = await self.connect()
+        except nbdler.error.UriError as err:
+            h.uri_mgr.fatal(err)
+            raise
+        else:
+            h.uri_mgr.success(resp)
+            self._record_tls(self.resp.ssl_object)
+
+            if not self._closed:
+                if self.ranges is None:
+                    await self.fetch()
+                else:
+                    await self.fetch_ranges()
+
+    def close(self):
+        resp = self.resp
+        self.session = None
+        self.resp = None
+        if resp is not None:
+            resp.close()
+
+    @classmethod
+    async def dlopen(cls, source, progress, **kwargs):
+        resp, _ = await cls.dlopen_handover(source, progress, **kwargs)
+        return resp
+
+    @classmethod
+    async def dlopen_handover(cls, source, progress, **kwargs):
+        async with ClientSession() as session:
+            async with cls(session, source, progress, None, **kwargs) as cli:
+                resp = await cli.connect()
+                size = resp.length
+                progress._range = (0, size)
+                # 探测连接属于dlopen()的事件循环，无法交接到下载器的事件循环。
+                # 仅保留已缓冲的数据作为前缀，探测连接随会话关闭，起点为0的下载块从前缀之后重新连接。
+                prefix = cli.resp.read_nowait()
+
+        return resp, ProbeStream(NAME, source, prefix=prefix)
+
+
+class HTTPProtocolError(Exception):
+    pass
+
+
+class _Connection(asyncio.BufferedProtocol):
+    """ HTTP/1.1连接。
+
+    响应头通过内部缓冲接收。接收响应体时，若内部缓冲已空，传输层直接把数据接收到调用方的缓冲区，
+    调用方未在读取时暂停接收，由套接字缓冲区保留数据。
+    """
+    # 内部缓冲大小，响应头不能超过该大小
+    BUFFER_SIZE = 65536
+
+    def __init__(self, loop):
+        self._loop = loop
+        self.transport = None
+        self._buffer = bytearray(self.BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._target = None
+        self._direct = False
+        self._waiter = None
+        self._eof = False
+        self._exc = None
+        self._paused = False
+        self._streaming = False
+        self.idle_time = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self._exc = exc
+        self._eof = True
+        self._wakeup()
+
+    def eof_received(self):
+        self._eof = True
+        self._wakeup()
+        return False
+
+    def get_buffer(self, sizehint):
+        if self._target is not None and self._start == self._end:
+            self._direct = True
+            return self._target
+        self._direct = False
+        if self._end == len(self._buffer):
+            # 前移未读取的数据
+            remain = self._end - self._start
+            self._buffer[:remain] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = remain
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        if self._direct:
+            self._direct = False
+            self._target = None
+            self._wakeup(nbytes)
+        else:
+            self._end += nbytes
+            self._wakeup()
+        if self._streaming or self._end == len(self._buffer):
+            # 读取响应体时没有等待读取的缓冲区，或内部缓冲已满，暂停接收。
+            self._pause()
+
+    def _pause(self):
+        if not self._paused and self.transport is not None and not self.transport.is_closing():
+            self._paused = True
+            self.transport.pause_reading()
+
+    def _resume(self):
+        if self._paused:
+            self._paused = False
+            if not self.transport.is_closing():
+                self.transport.resume_reading()
+
+    def _wakeup(self, result=None):
+        waiter = self._waiter
+        self._waiter = None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(result)
+
+    async def _wait(self, timeout):
+        if self._exc is not None:
+            raise self._exc
+        if self._eof:
+            return None
+        waiter = self._waiter = self._loop.create_future()
+        self._resume()
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            self._waiter = None
+
+    def is_reusable(self):
+        return (not self._eof and self._exc is None and self.transport is not None
+                and not self.transport.is_closing() and self._start == self._end)
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    async def readline(self, timeout):
+        """ 读取以CRLF结尾的一行，返回不包含CRLF的bytes。"""
+        while True:
+            index = self._buffer.find(b'\r\n', self._start, self._end)
+            if index >= 0:
+                line = bytes(self._view[self._start:index])
+                self._start = index + 2
+                return line
+            if self._end - self._start >= len(self._buffer):
+                raise HTTPProtocolError('line too long.')
+            if self._eof:
+                raise HTTPProtocolError('connection closed.')
+            await self._wait(timeout)
+
+    async def readinto(self, view, timeout):
+        """ 读取数据到view，返回读取的字节数，连接关闭返回0。"""
+        buffered = self._end - self._start
+        if buffered:
+            length = min(buffered, len(view))
+            view[:length] = self._view[self._start:self._start + length]
+            self._start += length
+            return length
+        if self._eof:
+            if self._exc is not None:
+                raise self._exc
+            return 0
+        self._streaming = True
+        self._target = view
+        try:
+            result = await self._wait(timeout)
+        finally:
+            self._target = None
+        if result is None:
+            # 连接关闭或数据进入了内部缓冲
+            return await self.readinto(view, timeout) if self._end > self._start else 0
+        return result
+
+    def read_nowait(self):
+        """ 返回内部缓冲中已接收的数据。"""
+        data = bytes(self._view[self._start:self._end])
+        self._start = self._end
+        return data
+
+    def reset(self):
+        """ 复用连接前重置状态。"""
+        self._streaming = False
+        self._target = None
+        self._pause()
+
+
+class _Response:
+    """ HTTP响应。 """
+    def __init__(self, session, conn, key, url, status, reason, headers, timeout):
+        self._session = session
+        self._conn = conn
+        self._key = key
+        self._timeout = timeout
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+
+        self._header_map = {}
+        for k, v in headers:
+            self._header_map.setdefault(k.lower(), v)
+
+        transfer_encoding = (self.getheader('transfer-encoding') or '').lower()
+        self._chunked = 'chunked' in transfer_encoding
+        length = self.getheader('content-length')
+        self.length = int(length) if length is not None and not self._chunked else None
+        self._remaining = self.length
+        self._chunk_remaining = 0
+        self._keep_alive = (self.getheader('connection') or '').lower() != 'close'
+        self._done = status in (204, 304) or self.length == 0
+
+    def getheader(self, name, default=None):
+        return self._header_map.get(name.lower(), default)
+
+    @property
+    def ssl_object(self):
+        """ 返回连接的SSLObject对象，非TLS连接返回None。"""
+        if self._conn is None or self._conn.transport is None:
+            return None
+        return self._conn.transport.get_extra_info('ssl_object')
+
+    async def readinto(self, view):
+        """ 读取响应体数据到view，返回读取的字节数，响应体结束返回0。"""
+        if self._done or not view:
+            return 0
+        conn = self._conn
+        timeout = self._timeout
+        if self._chunked:
+            if not self._chunk_remaining:
+                size = await conn.readline(timeout)
+                size = int(size.split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    # 跳过trailer
+                    while await conn.readline(timeout):
+                        pass
+                    self._done = True
+                    return 0
+                self._chunk_remaining = size
+            length = await conn.readinto(view[:self._chunk_remaining], timeout)
+            if not length:
+                raise HTTPProtocolError('incomplete chunked body.')
+            self._chunk_remaining -= length
+            if not self._chunk_remaining:
+                await conn.readline(timeout)
+            return length
+
+        if self._remaining is not None:
+            length = await conn.readinto(view[:self._remaining], timeout)
+            if not length:
+                raise HTTPProtocolError('incomplete body.')
+            self._remaining -= length
+            if not self._remaining:
+                self._done = True
+            return length
+
+        # 以连接关闭作为响应体结束
+        length = await conn.readinto(view, timeout)
+        if not length:
+            self._done = True
+            self._keep_alive = False
+        return length
+
+    def read_nowait(self):
+        """ 返回已接收的响应体数据，仅用于identity响应体。"""
+        if self._chunked or self._done:
+            return b''
+        data = self._conn.read_nowait()
+        if self._remaining is not None:
+            data = data[:self._remaining]
+            self._remaining -= len(data)
+        return data
+
+    async def discard(self):
+        """ 丢弃较小的响应体，以便复用连接。"""
+        if self._remaining is not None and self._remaining > 65536:
+            return
+        buf = memoryview(bytearray(8192))
+        while await self.readinto(buf):
+            pass
+
+    def close(self):
+        conn = self._conn
+        self._conn = None
+        if conn is None:
+            return
+        if self._done and self._keep_alive and conn.is_reusable():
+            self._session.release(self._key, conn)
+        else:
+            conn.close()
+
+
+class ClientSession:
+    """ 轻量HTTP/1.1客户端会话。
+
+    按(源站, 代理)维护空闲的keep-alive连接池，每个源站使用缓存TLS会话的SSLContext，
+    新建的连接恢复源站的TLS会话。
+    """
+    # 空闲连接的最大保持时间
+    KEEPALIVE_TIMEOUT = 15
+
+    def __init__(self):
+        self._idle = defaultdict(deque)
+        # 正在建立的预热连接
+        self._warming = defaultdict(deque)
+        self._tls = TLSContexts()
+        self._closed = False
+
+    async def _open(self, scheme, host, port, proxy, verify, address, timeout):
+        loop = asyncio.get_running_loop()
+        ssl_context = self._tls.get(host, port, verify) if scheme == 'https' else None
+        if proxy:
+            proxy_parse = urlparse(proxy)
+            conn_host, conn_port = proxy_parse.hostname, proxy_parse.port or 80
+        else:
+            conn_host, conn_port = address or host, port
+
+        transport, conn = await asyncio.wait_for(loop.create_connection(
+            lambda: _Connection(loop), conn_host, conn_port,
+            ssl=None if proxy else ssl_context,
+            server_hostname=None if proxy or ssl_context is None else host), timeout)
+
+        if proxy and ssl_context is not None:
+            # 通过CONNECT建立HTTPS代理隧道
+            try:
+                request = f'CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+                request += _proxy_authorization(proxy_parse)
+                conn.write(f'{request}\r\n'.encode('latin-1'))
+                status, reason, _ = await _read_head(conn, timeout)
+                if status != 200:
+                    raise HTTPProtocolError(f'proxy CONNECT failed: {status} {reason}')
+                transport = await asyncio.wait_for(loop.start_tls(
+                    transport, conn, ssl_context, server_hostname=host), timeout)
+                conn.transport = transport
+            except BaseException:
+                transport.close()
+                raise
+        return conn
+
+    def _acquire_idle(self, key):
+        idle = self._idle.get(key)
+        now = time.time()
+        while idle:
+            conn = idle.pop()
+            if conn.is_reusable() and now - conn.idle_time < self.KEEPALIVE_TIMEOUT:
+                conn.reset()
+                return conn
+            conn.close()
+        return None
+
+    async def _claim_warming(self, key):
+        """ 取用正在建立的预热连接，没有或建立失败返回None。"""
+        warming = self._warming.get(key)
+        if not warming:
+            return None
+        try:
+            return await warming.popleft()
+        except (OSError, asyncio.TimeoutError, HTTPProtocolError):
+            return None
+
+    def _warmed(self, key, fut):
+        """ 未被取用的预热连接建立后放入空闲连接池。"""
+        warming = self._warming.get(key)
+        if warming is None or fut not in warming:
+            return
+        warming.remove(fut)
+        if not fut.cancelled() and fut.exception() is None:
+            self.release(key, fut.result())
+
+    def idle_count(self, source_uri):
+        """ 返回到下载源的空闲和正在建立的连接数。"""
+        key = _origin_key(source_uri.uri, *_source_options(source_uri))
+        return len(self._idle.get(key, ())) + len(self._warming.get(key, ()))
+
+    async def prewarm(self, source_uri, n, timeout=None):
+        """ 预先建立到下载源的连接，使空闲和正在建立的连接数达到n。
+
+        Args:
+            source_uri: 下载源SourceURI对象
+            n: 期望的空闲连接数
+            timeout: 建立连接的超时时间
+
+        Returns:
+            新建立的连接数
+        """
+        if self._closed:
+            return 0
+        key = _origin_key(source_uri.uri, *_source_options(source_uri))
+        count = n - self.idle_count(source_uri)
+        if count <= 0:
+            return 0
+        loop = asyncio.get_running_loop()
+        warming = self._warming[key]
+        tasks = []
+        for _ in range(count):
+            task = loop.create_task(self._open(*key, timeout or StreamsClient.TIMEOUT))
+            task.add_done_callback(partial(self._warmed, key))
+            warming.append(task)
+            tasks.append(task)
+        # 预热被取消时不取消连接的建立，已被请求取用的连接由请求等待。
+        await asyncio.wait(tasks)
+        return count
+
+    def release(self, key, conn):
+        """ 归还可复用的连接。"""
+        if self._closed:
+            conn.close()
+            return
+        conn.reset()
+        conn.idle_time = time.time()
+        self._idle[key].append(conn)
+
+    async def request(self, url, headers, *, proxy=None, verify=True, address=None, timeout=10, max_redirects=10):
+        """ 发送GET请求并返回响应头已接收的_Response对象。
+
+        指定address时到该请求主机的连接固定使用该IP地址，重定向到其他主机的连接不受影响。
+        """
+        pinned_host = urlparse(url).hostname
+        for _ in range(max_redirects + 1):
+            url_parse = urlparse(url)
+            key = _origin_key(url, proxy, verify, address if url_parse.hostname == pinned_host else None)
+            scheme, host, port = key[:3]
+
+            target = url if proxy and scheme == 'http' else (url_parse.path or '/') + (
+                f'?{url_parse.query}' if url_parse.query else '')
+            lines = [f'GET {target} HTTP/1.1', f'Host: {url_parse.netloc.rpartition("@")[-1]}']
+            names = set()
+            for k, v in headers:
+                names.add(k.lower())
+                lines.append(f'{k}: {v}')
+            if 'user-agent' not in names:
+                lines.append('User-Agent: Nbdler')
+            if 'accept-encoding' not in names:
+                lines.append('Accept-Encoding: identity')
+            if url_parse.username is not None and 'authorization' not in names:
+                userinfo = f'{unquote(url_parse.username)}:{unquote(url_parse.password or "")}'
+                lines.append(f'Authorization: Basic {b64encode(userinfo.encode()).decode()}')
+            if proxy and scheme == 'http':
+                lines.append(_proxy_authorization(urlparse(proxy)).rstrip('\r\n'))
+            request = ('\r\n'.join([line for line in lines if line]) + '\r\n\r\n').encode('latin-1')
+
+            conn = self._acquire_idle(key)
+            if conn is None:
+                conn = await self._claim_warming(key)
+            reused = conn is not None
+            if conn is None:
+                conn = await self._open(*key, timeout)
+            try:
+                conn.write(request)
+                status, reason, resp_headers = await _read_head(conn, timeout)
+            except (OSError, HTTPProtocolError):
+                conn.close()
+                if not reused:
+                    raise
+                # 复用的连接可能已被服务器关闭，使用新连接重试
+                conn = await self._open(*key, timeout)
+                try:
+                    conn.write(request)
+                    status, reason, resp_headers = await _read_head(conn, timeout)
+                except BaseException:
+                    conn.close()
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+            resp = _Response(self, conn, key, url, status, reason, resp_headers, timeout)
+            location = resp.getheader('location')
+            if status in (301, 302, 303, 307, 308) and location:
+                await resp.discard()
+                resp.close()
+                url = urljoin(url, location)
+                continue
+            return resp
+        raise HTTPProtocolError(f'exceeded {max_redirects} redirects.')
+
+    async def close(self):
+        self._closed = True
+        for warming in self._warming.values():
+            while warming:
+                task = warming.popleft()
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    task.result().close()
+        self._warming.clear()
+        for idle in self._idle.values():
+            while idle:
+                idle.pop().close()
+        self._idle.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+async def _read_head(conn, timeout):
+    """ 读取响应状态行和响应头，返回(状态码, 原因, 响应头列表)。"""
+    while True:
+        status_line = await conn.readline(timeout)
+        try:
+            version, status, *reason = status_line.decode('latin-1').split(None, 2)
+            status = int(status)
+        except ValueError:
+            raise HTTPProtocolError(f'bad status line: {status_line!r}')
+        headers = []
+        while True:
+            line = await conn.readline(timeout)
+            if not line:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip(), value.strip()))
+        # 跳过1xx的临时响应
+        if 100 <= status < 200:
+            continue
+        return status, reason[0] if reason else '', headers
+
+
+def _source_options(source_uri):
+    """ 返回下载源使用的(代理, 证书校验, 固定的连接地址)。"""
+    proxies = source_uri.proxies or {}
+    proxy = proxies.get(source_uri.scheme)
+    if not proxy and source_uri.kwargs.get('trust_env', False):
+        proxy = getproxies().get(source_uri.scheme)
+    # 使用代理时由代理解析主机名
+    address = None if proxy else source_uri.address
+    return proxy, source_uri.kwargs.get('verify', True), address
+
+
+def _origin_key(url, proxy, verify, address=None):
+    """ 返回连接池的键(协议, 主机, 端口, 代理, 证书校验, 固定的连接地址)。"""
+    url_parse = urlparse(url)
+    scheme = url_parse.scheme.lower()
+    port = url_parse.port or (443 if scheme == 'https' else 80)
+    return scheme, url_parse.hostname, port, proxy, verify, address
+
+
+def _proxy_authorization(proxy_parse):
+    if proxy_parse.username is None:
+        return ''
+    userinfo = f'{unquote(proxy_parse.username)}:{unquote(proxy_parse.password or "")}'
+    return f'Proxy-Authorization: Basic {b64encode(userinfo.encode()).decode()}\r\n'
+
+
+NAME = 'streams'
+PROTOCOL_SUPPORT = ('http', 'https')
+ASYNC_EXECUTE = True
+ADDRESS_PINNING = True
+
+ClientHandler = StreamsClient
@@ -0,0 +1,95 @@
+import ssl
+import os
+import threading
+import weakref
+
+
+class SessionCachingContext(ssl.SSLContext):
+    """ 缓存并复用TLS会话的客户端SSLContext。
+
+    每个源站使用独立的上下文，新建的TLS连接携带该源站最近一次握手得到的会话，
+    服务器接受时以简短握手恢复会话，省去证书交换和验证的开销。
+    服务器不接受时自动进行完整握手。
+    """
+    def __new__(cls, verify=True):
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def __init__(self, verify=True):
+        """
+        Args:
+            verify: 证书校验，False不校验，str为CA证书文件或目录的路径，其他使用系统默认的CA证书
+        """
+        super().__init__()
+        if verify is False:
+            self.check_hostname = False
+            self.verify_mode = ssl.CERT_NONE
+        elif isinstance(verify, str):
+            if os.path.isdir(verify):
+                self.load_verify_locations(capath=verify)
+            else:
+                self.load_verify_locations(cafile=verify)
+        else:
+            self.load_default_certs()
+
+        self._session = None
+        self._lock = threading.Lock()
+        self._handshakes = weakref.WeakSet()
+        self.resumed = 0
+        self.full = 0
+
+    def wrap_socket(self, *args, session=None, **kwargs):
+        return super().wrap_socket(*args, session=session or self._session, **kwargs)
+
+    def wrap_bio(self, *args, session=None, **kwargs):
+        return super().wrap_bio(*args, session=session or self._session, **kwargs)
+
+    def record(self, ssl_object):
+        """ 记录连接的握手并缓存连接的TLS会话。
+
+        Args:
+            ssl_object: 已完成握手的SSLSocket或SSLObject对象
+
+        Returns:
+            首次记录该连接时返回握手是否恢复了会话，已记录过的连接返回None。
+        """
+        with self._lock:
+            if ssl_object in self._handshakes:
+                return None
+            self._handshakes.add(ssl_object)
+            resumed = ssl_object.session_reused
+            if resumed:
+                self.resumed += 1
+            else:
+                self.full += 1
+            session = ssl_object.session
+            if session is not None and (session.has_ticket or session.id):
+                self._session = session
+        return resumed
+
+
+class TLSContexts:
+    """ 按(主机, 端口, 证书校验)缓存的SessionCachingContext。"""
+    def __init__(self):
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port, verify=True):
+        key = (host, port, verify)
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is None:
+                context = SessionCachingContext(verify)
+                self._contexts[key] = context
+        return context
+
+
+def record_handshake(ssl_object):
+    """ 记录新建TLS连接的握手。
+
+    Returns:
+        首次记录的连接返回握手是否恢复了会话。非TLS连接、不缓存会话的上下文或已记录过的连接返回None。
+    """
+    context = getattr(ssl_object, 'context', None)
+    if isinstance(context, SessionCachingContext):
+        return context.record(ssl_object)
+    return None
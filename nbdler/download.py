@@ -8,6 +8,8 @@ from nbdler.handler import (
     ClientWorker,
     URIStatusManager,
     GatherException,
+    ConnectionPrewarmer,
+    ConcurrencyController,
     h, Handlers)
 from .client import get_policy, ClientPolicy
 from .version import VERSION
@@ -25,10 +27,15 @@ __all__ = (
 
 class DownloadConfigure:
     ADJUSTABLE = frozenset(
-        {'max_concurrent', 'max_speed', 'buffer_size', 'timeout', 'interval', 'client_policy'})
+        {'max_concurrent', 'max_speed', 'buffer_size', 'timeout', 'interval', 'client_policy', 'sequential'})
 
     def __init__(self, resume_capability, max_concurrent, chunk_size, buffer_size, timeout=10,
-                 max_speed=None, downloading_ext='.downloading', interval=0.5, client_policy=None, **kwargs):
+                 max_speed=None, downloading_ext='.downloading', interval=0.5, client_policy=None,
+                 max_gap_size=1048576, max_ranges=32, prewarm=False, dns_ttl=None, use_mmap=False,
+                 io_workers=4, preallocate='sparse', direct_io=False, durability='none',
+                 state_format='json', memory_high_watermark=None, memory_low_watermark=None,
+                 sequential=False, endgame_size=None, min_slice_size=None,
+                 adaptive_concurrency=None, **kwargs):
 
         self.version = VERSION
         self.resume_capability = resume_capability
@@ -40,6 +47,36 @@ class DownloadConfigure:
         self.max_speed = max_speed
         self.downloading_ext = downloading_ext
         self.client_policy = client_policy
+        # 剩余量不超过max_gap_size的下载块作为缺口，合并为最多max_ranges个范围的多范围请求
+        self.max_gap_size = max_gap_size
+        self.max_ranges = max_ranges
+        # 预先建立到下载源的连接
+        self.prewarm = prewarm
+        # 下载源主机名解析的缓存有效期，None则不解析和固定连接地址
+        self.dns_ttl = dns_ttl
+        # 客户端直接接收数据到下载中文件的内存映射，仅用于大小已知的文件
+        self.use_mmap = use_mmap
+        # 文件数据写入的并行线程数
+        self.io_workers = io_workers
+        # 下载中文件的预分配方式：sparse、full或keep_size
+        self.preallocate = preallocate
+        # 以O_DIRECT绕过页缓存写入文件数据，内存映射模式下不适用
+        self.direct_io = direct_io
+        # 下载状态的持久性：none、atomic或fsync，参见FileTempData
+        self.durability = durability
+        # 下载状态文件的格式：json，或块记录按需加载的binary
+        self.state_format = state_format
+        # 未写入文件的数据量达到高水位时暂停客户端接收，降至低水位时恢复，默认4倍buffer_size和其一半
+        self.memory_high_watermark = memory_high_watermark
+        self.memory_low_watermark = memory_low_watermark
+        # 下载块切片优先选择文件位置靠前的下载块，适合边下载边按顺序读取
+        self.sequential = sequential
+        # 剩余下载量不超过该值时进入收尾阶段，从最快的下载源竞速重复请求最慢的下载块，默认None不竞速
+        self.endgame_size = endgame_size
+        # 切片出的新下载块的最小长度，None则按下载源的传输速率和连接延迟估计
+        self.min_slice_size = min_slice_size
+        # 并发数自适应调节的上限，从max_concurrent开始按传输速率和下载源的过载响应调节，None则固定并发数
+        self.adaptive_concurrency = adaptive_concurrency
         self.kwargs = kwargs
 
     def set(self, **kwargs):
@@ -52,6 +89,7 @@ class DownloadConfigure:
                 timeout: 客户端连接接收超时时间
                 interval: 速度调节间隙
                 client_policy: 客户端处理策略
+                sequential: 下载块切片是否优先选择文件位置靠前的下载块
         """
         attrs = set(kwargs).intersection(DownloadConfigure.ADJUSTABLE)
         for attr in attrs:
@@ -77,12 +115,21 @@ class DownloadConfigure:
 
 
 class Downloader:
-    def __init__(self, file, uris, block_grp, *, handlers=None, **kwargs):
-
+    def __init__(self, file, uris, block_grp, *, handlers=None, probe=None, **kwargs):
+        """
+        Args:
+            file: 下载文件File对象
+            uris: 下载源管理器URIs对象
+            block_grp: 下载块管理器BlockGroup对象
+            handlers: 额外添加的Handler列表
+            probe: dlopen()交接的探测连接ProbeStream对象，其连接或已接收的数据作为起点为0的下载块的数据来源
+            **kwargs: 下载配置，参见DownloadConfigure
+        """
         self.file = file
         self.uris = uris
         self.block_grp = block_grp
         self.config = DownloadConfigure.loads(kwargs)
+        self._probe = probe
 
         self._executor = None
 
@@ -102,6 +149,8 @@ class Downloader:
             BlockSlicer,
             GatherException,
             URIStatusManager,
+            ConnectionPrewarmer,
+            ConcurrencyController,
         ]
         handlers.extend(buildin_handlers)
         for handler in handlers:
@@ -113,6 +162,84 @@ class Downloader:
             handler.add_parent(weakref.proxy(self))
             self._handlers[handler.name] = handler
 
+    def stream(self, offset=0, chunk_size=FileTempData.SLAB_SIZE):
+        """ 线程安全按文件顺序读取已下载的数据。
+
+        以生成器的形式从文件的offset位置开始返回连续已写入文件的数据，文件开头连续完成的数据增长时
+        继续返回新的数据。数据在缓冲释放写入文件后才可读取，buffer_size决定了读取的粒度。
+        当文件读取完毕，或下载器已暂停且没有更多连续的数据时中断生成器的迭代。
+        配合sequential配置可使连续完成的数据尽快增长。
+        使用方式：
+            dl.start()
+            for data in dl.stream():
+                do_some_works(data)
+
+        Args:
+            offset: 开始读取的文件位置
+            chunk_size: 每次返回的最大数据长度
+
+        Yields:
+            bytes数据
+        """
+        file_data = self._handlers.file_data
+        fd = None
+        try:
+            while True:
+                since = file_data.flushes
+                stopped = self._future is not None and self._future.done()
+                end = self.block_grp.done_offset(offset)
+                if end > offset:
+                    if fd is None:
+                        fd = open(self._stream_path(), 'rb')
+                    fd.seek(offset)
+                    while offset < end:
+                        data = fd.read(min(chunk_size, end - offset))
+                        offset += len(data)
+                        yield data
+                elif offset >= self.block_grp.total_size or stopped:
+                    break
+                else:
+                    file_data.wait_flushed_threadsafe(since, self.config.interval)
+        finally:
+            if fd is not None:
+                fd.close()
+
+    async def astream(self, offset=0, chunk_size=FileTempData.SLAB_SIZE):
+        """ 异步按文件顺序读取已下载的数据。 具体参见stream()方法。
+        使用方式：
+            async for data in dl.astream():
+                do_some_works(data)
+        """
+        loop = asyncio.get_running_loop()
+        file_data = self._handlers.file_data
+        fd = None
+        try:
+            while True:
+                since = file_data.flushes
+                stopped = self._future is not None and self._future.done()
+                end = self.block_grp.done_offset(offset)
+                if end > offset:
+                    if fd is None:
+                        fd = await loop.run_in_executor(None, open, self._stream_path(), 'rb')
+                    fd.seek(offset)
+                    while offset < end:
+                        data = await loop.run_in_executor(None, fd.read, min(chunk_size, end - offset))
+                        offset += len(data)
+                        yield data
+                elif offset >= self.block_grp.total_size or stopped:
+                    break
+                else:
+                    await file_data.wait_flushed(since, self.config.interval)
+        finally:
+            if fd is not None:
+                fd.close()
+
+    def _stream_path(self):
+        """ 返回读取下载数据的文件路径，下载器关闭后文件已去除.downloading后缀。"""
+        if self._closed:
+            return self.file.pathname
+        return f'{self.file.pathname}{self.config.downloading_ext}'
+
     def exceptions(self, exception_type=None, *, just_new_exception=True):
         """ 线程安全获取异常
 
@@ -249,8 +376,12 @@ class Downloader:
                         file.name = file.number_name(postfix)
                     break
 
-            # 删除下载配置文件
+            # 删除下载配置文件和下载进度日志
             os.unlink(f'{start_filepath}{self.config.downloading_ext}.cfg')
+            try:
+                os.unlink(f'{start_filepath}{self.config.downloading_ext}.cfg.journal')
+            except FileNotFoundError:
+                pass
         return result
 
     async def ajoin(self):
@@ -326,15 +457,31 @@ class Downloader:
         }
         return dumpy
 
+    def pack(self, compress=True):
+        """ 返回二进制格式的下载状态。参见nbdler.state。"""
+        from nbdler.state import pack
+        return pack(self, compress)
+
     @classmethod
     def loads(cls, dumpy, handlers=None):
+        """ 从下载状态加载下载器。
+
+        Args:
+            dumpy: dumps()返回的下载状态字典，或pack()返回的二进制下载状态
+            handlers: 额外添加的Handler列表
+        """
         from nbdler.uri import URIs
         from nbdler.file import File
         from nbdler.block import BlockGroup
+        from nbdler.state import unpack
 
+        if isinstance(dumpy, (bytes, bytearray, memoryview)):
+            dumpy = unpack(dumpy)
         uris = URIs.loads(dumpy['uris'])
         file = File(**dumpy['file'])
-        block_grp = BlockGroup.loads(dumpy['block_grp'])
+        block_grp = dumpy['block_grp']
+        if not isinstance(block_grp, BlockGroup):
+            block_grp = BlockGroup.loads(block_grp)
         return cls(file, uris, block_grp, handlers=handlers, **dumpy['config'])
 
     transfer_rate = property(lambda self: self.block_grp.transfer_rate)
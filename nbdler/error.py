@@ -36,7 +36,10 @@ class TimeoutError(UriError):
 
 
 class FatalError(UriError):
-    pass
+    @property
+    def status(self):
+        """ 下载源响应的状态码，没有响应时为None。"""
+        return self.kwargs.get('status')
 
 
 class MaxRetriesExceeded(ClientError):
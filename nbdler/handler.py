@@ -1,18 +1,28 @@
 import asyncio
-from collections import defaultdict
+from collections import defaultdict, deque
 from contextvars import ContextVar
 from contextlib import asynccontextmanager, contextmanager
 from concurrent.futures.thread import ThreadPoolExecutor
-from nbdler.error import HandlerError, ClientError
+from nbdler.error import HandlerError, ClientError, TimeoutError as URITimeoutError
 from functools import partial
 from copy import copy
-from operator import attrgetter
+from operator import attrgetter, itemgetter
+from math import ceil
+from time import time
 import threading
-from nbdler.utils import UsageInfo
+from nbdler.utils import (
+    UsageInfo, BufferPool, DNSCache, IOLane, IndexedHeap, is_ip_address, preallocate, write_atomic, append_file)
+from nbdler.journal import Journal
+from nbdler.block import Block
+from nbdler.progress import Progress
+from urllib.request import getproxies
 from traceback import format_exc
 import logging
 import weakref
 import json
+import os
+import mmap
+import errno
 
 log = logging.getLogger(__name__)
 
@@ -47,7 +57,7 @@ class Handlers(dict):
 
     async def prepare(self):
         """ Handler启动预处理，通常预启动，做初始化工作。启动标志在该方法设置。"""
-        self._ready = asyncio.Event(loop=asyncio.get_running_loop())
+        self._ready = asyncio.Event()
         result = await asyncio.gather(*[handler.prepare() for handler in self.values()])
         self._ready.set()
         return result
@@ -95,7 +105,7 @@ class _HandlerReference(threading.local):
 
     @contextmanager
     def enter(self, handlers, loop=None):
-        assert self._loop or loop
+        assert loop or self._loop
         if loop:
             if not isinstance(loop, weakref.ProxyType):
                 loop = weakref.proxy(loop)
@@ -346,22 +356,56 @@ class GatherException(Handler):
 
 
 class URIStatus:
-    def __init__(self, uri):
+    # 表示下载源过载的响应状态码
+    THROTTLE_STATUS = (429, 503)
+
+    def __init__(self, uri, address=None, group=None):
+        """
+        Args:
+            uri: 下载源SourceURI对象
+            address: 客户端连接固定使用的IP地址，None则由客户端自行解析
+            group: 同一下载源的URIStatus列表，组内共享下载源的最大连接数
+        """
         self.source_uri = uri
+        self.address = address
+        self.group = group if group is not None else []
+        self.group.append(self)
+        # 地址已不在下载源的解析结果中，不再分配给新的下载块
+        self.expired = False
+        # 连续失败次数
+        self._failures = 0
+        # TLS会话恢复的握手次数和完整握手次数
+        self._tls_resumed = 0
+        self._tls_full = 0
         self._used = 0
         self._success = 0
         self._timeout = 0
         self._fatal = 0
+        # 连接超时和过载响应的次数
+        self._throttled = 0
+        # ConcurrencyController调节的下载源连接数上限，None则不限制
+        self.conn_limit = None
 
         self._logs = []
         self._users = {}
+        # 已退出的下载块从该下载源接收的数据量，和正在使用的下载块开始使用时的接收量
+        self._walked = 0
+        self._walk_starts = {}
+        self.usage_info = UsageInfo(self.walk_length)
 
         self._conn_delay_moving_avg = [0 for _ in range(8)]
         self._conn_delay = float('inf')
 
+        # 下载源是否支持多范围请求，None为未确定
+        self.multirange = None
+
     def log(self, resp):
         self._logs.append(resp)
 
+    @property
+    def connection_delay(self):
+        return self._conn_delay
+
     def _response_delay(self, time_s):
         moving_avg = self._conn_delay_moving_avg
         moving_avg.append(time_s)
@@ -376,13 +420,16 @@ class URIStatus:
     def use(self, block):
         self._used += 1
         self._users[block] = UsageInfo(lambda: block.progress.walk_length)
+        self._walk_starts[block] = block.progress.walk_length
 
     def timeout(self, block, resp):
         self._timeout += 1
+        self._failures += 1
         self.log(f'{block} {resp}')
 
     def success(self, block, resp):
         self._success += 1
+        self._failures = 0
         self.log(f'{block} {resp}')
         # TODO: 在多下载源的情况下对下载源之间经过资源数据采样校验，通过后作为响应基准
         if self.source_uri.getresponse() is None:
@@ -391,23 +438,54 @@ class URIStatus:
 
     def fatal(self, block, resp):
         self._fatal += 1
+        self._failures += 1
+        if isinstance(resp, URITimeoutError) or getattr(resp, 'status', None) in URIStatus.THROTTLE_STATUS:
+            self._throttled += 1
         self.log(f'{block} {resp}')
 
+    def congestion_count(self):
+        """ 返回超时和过载响应的累计次数。"""
+        return self._timeout + self._throttled
+
+    def tls_handshake(self, resumed):
+        if resumed:
+            self._tls_resumed += 1
+        else:
+            self._tls_full += 1
+
     def disuse(self, block):
         self._used -= 1
         del self._users[block]
+        self._walked += block.progress.walk_length - self._walk_starts.pop(block)
+
+    def walk_length(self):
+        """ 返回从该下载源接收的数据量。"""
+        return self._walked + sum([block.progress.walk_length - start
+                                   for block, start in self._walk_starts.items()])
 
     def is_available(self):
         """ 返回当前下载源是否超过有效使用次数。 """
-        return self.source_uri.max_conn is None or self.source_uri.max_conn > self._used
+        if self.expired or not self.is_healthy() and any([s.is_healthy() for s in self.group if not s.expired]):
+            # 同一下载源有其他可用地址时不再使用连续失败的地址
+            return False
+        max_conn = self.source_uri.max_conn
+        if self.conn_limit is not None:
+            max_conn = self.conn_limit if max_conn is None else min(max_conn, self.conn_limit)
+        return max_conn is None or max_conn > sum([status._used for status in self.group])
+
+    def is_healthy(self):
+        """ 返回是否未连续失败3次及以上。"""
+        return self._failures < 3
 
     @property
     def users(self):
         return self._users
 
     def get_copy(self):
-        """ 返回URI下载源对象的副本。"""
-        return copy(self.source_uri)
+        """ 返回URI下载源对象的副本，副本的连接固定使用该状态的IP地址。"""
+        source_uri = copy(self.source_uri)
+        source_uri.address = self.address
+        return source_uri
 
     def transfer_rate(self):
         """ 返回下载源的传输速率。"""
@@ -422,6 +500,7 @@ class URIStatus:
         """ 刷新当前下载源的状态使用信息。"""
         for user in self._users.values():
             user.refresh()
+        self.usage_info.refresh()
 
     def __repr__(self):
         return (f'<URIStatus {self.transfer_rate() / 1024} kb/s [{self._conn_delay * 1000} ms]'
@@ -434,7 +513,14 @@ class URIStatus:
             'success': self._success,
             'timeout': self._timeout,
             'fatal': self._fatal,
-            'connection_delay': self._conn_delay
+            'throttled': self._throttled,
+            'conn_limit': self.conn_limit,
+            'connection_delay': self._conn_delay,
+            'multirange': self.multirange,
+            'address': self.address,
+            'expired': self.expired,
+            'tls_resumed': self._tls_resumed,
+            'tls_full': self._tls_full,
         }
 
 
@@ -444,6 +530,10 @@ class URIStatusManager(Handler):
     负责工作：
         1. 管理和调配URI下载源
         2. 监控URI下载源工作状态
+        3. 缓存下载源的主机名解析，将每个解析地址作为独立的URIStatus分配连接
+
+    客户端支持固定连接地址时，同一下载源的多个A/AAAA记录如同多个镜像，
+    get_uri()按地址的使用次数和传输速度分配，CDN的多个边缘节点可以分摊连接。
     """
 
     name = 'uri_mgr'
@@ -452,11 +542,92 @@ class URIStatusManager(Handler):
         self._uri_status = {}
         self._cond = None
         self._stopped = False
+        self._dns = None
+        self._resolving = {}
+        self._prepared = None
+
+    def _prepared_event(self):
+        if self._prepared is None:
+            self._prepared = asyncio.Event()
+        return self._prepared
 
     async def prepare(self):
         self._cond = asyncio.Condition()
+        prepared = self._prepared_event()
+        prepared.clear()
+        dns_ttl = self.parent.config.dns_ttl
+        if dns_ttl and (self._dns is None or self._dns.ttl != dns_ttl):
+            self._dns = DNSCache(dns_ttl)
         for uri in self.parent.uris:
-            self._uri_status.setdefault(uri.id, URIStatus(uri))
+            if not any([key[0] == uri.id for key in self._uri_status]):
+                await self._update_addresses(uri)
+        prepared.set()
+
+    async def wait_prepared(self):
+        """ 等待下载源的状态建立完成，供其他Handler在prepare()中使用。"""
+        await self._prepared_event().wait()
+
+    def _should_resolve(self, uri):
+        """ 返回是否解析下载源的主机名并固定连接地址。"""
+        if self._dns is None or uri.protocol not in ('http', 'https') or is_ip_address(uri.hostname):
+            return False
+        proxies = uri.proxies or {}
+        if proxies.get(uri.scheme):
+            return False
+        if uri.kwargs.get('trust_env', False) and getproxies().get(uri.scheme):
+            return False
+        solution = self.parent.config.client_policy.get_solution(uri.protocol)
+        return solution.supports_address_pinning()
+
+    async def _update_addresses(self, uri):
+        """ 按下载源的主机名解析结果更新下载源的URIStatus。
+
+        新地址添加URIStatus，不再出现的地址标记为过期。解析失败时保留现有的状态，
+        下载源没有任何状态时添加不固定地址的URIStatus。
+        """
+        addresses = []
+        if self._should_resolve(uri):
+            port = uri.port or (443 if uri.scheme == 'https' else 80)
+            try:
+                addresses = await self._dns.resolve(uri.hostname, port)
+            except OSError as err:
+                log.debug(f'resolve {uri.hostname} failed: {err!r}')
+
+        statuses = [status for key, status in self._uri_status.items() if key[0] == uri.id]
+        if not addresses:
+            if not statuses:
+                self._uri_status[(uri.id, None)] = URIStatus(uri)
+            return
+        group = statuses[0].group if statuses else []
+        for status in statuses:
+            status.expired = status.address not in addresses
+        for address in addresses:
+            if (uri.id, address) not in self._uri_status:
+                self._uri_status[(uri.id, address)] = URIStatus(uri, address, group)
+
+    def _refresh_addresses(self):
+        """ 在后台重新解析过期的下载源主机名。"""
+        if self._dns is None:
+            return
+        for uri in self.parent.uris:
+            task = self._resolving.get(uri.id)
+            if task is not None and not task.done():
+                continue
+            port = uri.port or (443 if uri.scheme == 'https' else 80)
+            if self._should_resolve(uri) and self._dns.expired(uri.hostname, port):
+                self._resolving[uri.id] = asyncio.ensure_future(self._update_addresses(uri))
+
+    def _lookup_status(self, source_uri):
+        """ 返回下载源对象所对应的URIStatus对象。"""
+        status = self._uri_status.get((source_uri.id, source_uri.address))
+        if status is None:
+            # 未固定地址的连接，如dlopen()交接的探测连接，计入该下载源的首个状态
+            status = next(s for key, s in self._uri_status.items() if key[0] == source_uri.id)
+        return status
+
+    def statuses(self):
+        """ 返回所有未过期的URIStatus对象。"""
+        return [status for status in self._uri_status.values() if not status.expired]
 
     async def get_uri(self):
         """  返回URI状态对象供客户端使用。
@@ -465,33 +636,77 @@ class URIStatusManager(Handler):
         分配下载源。
 
         Returns:
-            被分配的URIStatus对象。
+            被分配的URIStatus对象，等待可用下载源期间暂停时返回None。
         """
         avl_uris = self._find_avl_uris()
-        while not avl_uris:
-            await self._cond.wait()
-            avl_uris = self._find_avl_uris()
+        if not avl_uris:
+            cond = self._cond
+            async with cond:
+                while not avl_uris:
+                    if self._stopped:
+                        return None
+                    await cond.wait()
+                    avl_uris = self._find_avl_uris()
 
         uri = avl_uris[0]
         if uri._used > 0:
             uri = sorted(avl_uris, key=lambda u: u.average_speed(), reverse=True)[0]
         return uri
 
+    def get_fastest_uri(self, exclude=None):
+        """ 返回单连接传输速度最快的可用URIStatus对象，尽量避开下载源exclude所对应的状态。
+
+        Args:
+            exclude: 避开的下载源SourceURI对象
+
+        Returns:
+            URIStatus对象，没有可用的下载源时返回None。
+        """
+        excluded = exclude and self._lookup_status(exclude)
+        avl_uris = self._find_avl_uris()
+        if not avl_uris:
+            return None
+        return max(avl_uris, key=lambda u: (u is not excluded, u.users and u.average_speed() or 0))
+
     def _find_avl_uris(self):
         more_used = sorted(self._uri_status.values(), key=attrgetter('_used'))
         return list(filter(lambda u: u.is_available(), more_used))
 
     def success(self, resp):
         block = _lookup_block()
-        self._uri_status[block.current_uri().id].success(block, resp)
+        self._lookup_status(block.current_uri()).success(block, resp)
 
     def timeout(self, resp):
         block = _lookup_block()
-        self._uri_status[block.current_uri().id].timeout(block, resp)
+        status = self._lookup_status(block.current_uri())
+        status.timeout(block, resp)
+        h.concurrency.congested(status)
 
     def fatal(self, resp):
         block = _lookup_block()
-        self._uri_status[block.current_uri().id].fatal(block, resp)
+        status = self._lookup_status(block.current_uri())
+        status.fatal(block, resp)
+        h.concurrency.congested(status)
+
+    def set_multirange(self, supported):
+        """ 记录当前下载块所用下载源是否支持多范围请求。"""
+        block = _lookup_block()
+        for status in self._lookup_status(block.current_uri()).group:
+            status.multirange = supported
+
+    def tls_handshake(self, resumed):
+        """ 记录当前下载块新建的TLS连接是否恢复了会话。"""
+        block = _lookup_block()
+        self._lookup_status(block.current_uri()).tls_handshake(resumed)
+
+    def get_status(self, source_uri):
+        """ 返回下载源对象所对应的URIStatus对象。"""
+        return self._lookup_status(source_uri)
+
+    def connection_delay(self):
+        """ 返回当前下载块所用下载源的连接延迟。"""
+        block = _lookup_block()
+        return self._lookup_status(block.current_uri()).connection_delay
 
     async def run(self):
         self._stopped = False
@@ -503,10 +718,26 @@ class URIStatusManager(Handler):
             if self._stopped:
                 break
 
+            rates = {}
             for status in uri_status.values():
                 status.refresh()
+                for block, usage in status.users.items():
+                    rates[block] = usage.rate
+            h.slicer.update_rates(rates)
+            self._refresh_addresses()
+            await self.notify()
 
+        await self.notify()
         self._cond = None
+        self._prepared = None
+
+    async def notify(self):
+        """ 唤醒等待可用下载源的客户端。"""
+        cond = self._cond
+        if cond is None:
+            return
+        async with cond:
+            cond.notify_all()
 
     async def pause(self):
         self._stopped = True
@@ -518,7 +749,323 @@ class URIStatusManager(Handler):
         return f'<URIStatusManager {self._uri_status} future={self._future}>'
 
     def info_getter(self):
-        return {k: v.info() for k, v in self._uri_status.items()}
+        return {(uri_id if address is None else f'{uri_id}@{address}'): v.info()
+                for (uri_id, address), v in self._uri_status.items()}
+
+
+class ConnectionPrewarmer(Handler):
+    """ 连接预热器，由下载配置的prewarm开启。
+
+    负责工作：
+        1. 下载开始前预先建立到各下载源的连接
+        2. 下载过程中补充下载源的空闲连接
+
+    客户端从会话的连接池取用已建立的连接，新下载块的首字节等待时间约为一个往返。
+    预热的目标是下载源重定向后的最终链接，即客户端实际连接的源站。
+    客户端会话需提供异步的prewarm(source_uri, n)方法，不提供的客户端不做预热。
+    """
+    name = 'conn_pool'
+
+    def __init__(self):
+        self._stopped = False
+        self._tasks = {}
+
+    async def prepare(self):
+        self._stopped = False
+        config = self.parent.config
+        if not config.prewarm:
+            return
+        await h.uri_mgr.wait_prepared()
+        # 下载块的切片在启动后才确定，首次预热按下载的并发数。
+        # 等待预热完成使客户端启动时从连接池取用已建立的连接。
+        self._top_up(config.max_concurrent if config.resume_capability else 1)
+        if self._tasks:
+            await asyncio.wait(list(self._tasks.values()))
+
+    def _target_uri(self, status):
+        """ 返回预热所用的下载源对象副本，链接为下载源响应的最终链接。"""
+        source_uri = status.get_copy()
+        resp = source_uri.getresponse()
+        if resp is not None and resp.uri and resp.uri != source_uri.uri:
+            hostname = source_uri.hostname
+            source_uri.uri = resp.uri
+            if source_uri.hostname != hostname:
+                # 固定的地址属于重定向前的主机
+                source_uri.address = None
+        return source_uri
+
+    def _top_up(self, waiting=None):
+        """ 按等待客户端的下载块数补充各下载源的空闲连接，每个下载源不超过其分摊的并发数。
+
+        Args:
+            waiting: 等待客户端的下载块数，None则按未分配客户端的下载块计算
+        """
+        config = self.parent.config
+        if not config.prewarm:
+            return
+        if waiting is None:
+            waiting = len([b for b in self.parent.block_grp.unfinished_blocks() if b.client is None])
+        probe = self.parent._probe
+        if probe is not None and probe.client is not None:
+            # 起点为0的下载块使用dlopen()交接的探测连接
+            waiting -= 1
+        if waiting <= 0:
+            return
+        statuses = h.uri_mgr.statuses()
+        per_status = min(waiting, int(ceil(config.max_concurrent / max(len(statuses), 1))))
+        for status in statuses:
+            task = self._tasks.get(status)
+            if task is not None and not task.done():
+                continue
+            source_uri = self._target_uri(status)
+            solution = config.client_policy.get_solution(source_uri.protocol)
+            prewarm = getattr(h.client_worker._get_session(solution), 'prewarm', None)
+            if prewarm is None:
+                continue
+            n = per_status
+            if source_uri.max_conn is not None:
+                n = min(n, int(ceil(source_uri.max_conn / len(status.group))))
+            n -= len(status.users)
+            if n > 0:
+                self._tasks[status] = asyncio.ensure_future(
+                    self._prewarm(prewarm, source_uri, n))
+
+    async def _prewarm(self, prewarm, source_uri, n):
+        try:
+            await prewarm(source_uri, n, self.parent.config.timeout)
+        except BaseException as err:
+            # 预热失败不影响下载，客户端将自行建立连接。
+            log.debug(f'prewarm {source_uri.uri} failed: {err!r}')
+
+    async def run(self):
+        async_sleep = asyncio.sleep
+        while True:
+            await async_sleep(1)
+            if self._stopped:
+                break
+            self._top_up()
+
+    async def pause(self):
+        self._stopped = True
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    async def close(self):
+        pass
+
+    def __repr__(self):
+        return f'<ConnectionPrewarmer {len(self._tasks)} future={self._future}>'
+
+
+class _AIMD:
+    """ 加性增、乘性减调节的并发数。"""
+    __slots__ = 'limit', 'rate', 'congestion', 'decreased', 'history'
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.rate = 0
+        # 已处理的拥塞次数
+        self.congestion = 0
+        # 上次减小并发数的时间
+        self.decreased = 0
+        # (时间, 并发数, 传输速率)的历史记录
+        self.history = deque(maxlen=ConcurrencyController.HISTORY_SIZE)
+
+    def decrease(self, guard=0):
+        """ 距上次减小超过guard秒时乘性减小并发数，避免同一次拥塞的多个响应连续减小。
+
+        Returns:
+            是否减小了并发数。
+        """
+        now = time()
+        if now - self.decreased < guard:
+            return False
+        self.decreased = now
+        self.limit = max(1, int(self.limit * ConcurrencyController.DECREASE_FACTOR))
+        return True
+
+    def update(self, rate, congested, busy, upper, guard=0):
+        """ 按一个控制周期的传输速率调节并发数。
+
+        Args:
+            rate: 本周期的传输速率
+            congested: 本周期是否出现超时或过载响应
+            busy: 并发数是否已用满，未用满时增加并发数没有意义
+            upper: 并发数上限
+            guard: 两次减小并发数的最小间隔
+        """
+        previous = self.rate
+        tolerance = ConcurrencyController.RATE_TOLERANCE
+        if congested:
+            self.decrease(guard)
+        elif time() - self.decreased < ConcurrencyController.CONTROL_INTERVAL * 2:
+            # 减小并发数后速率随之下降，待速率稳定后再比较
+            pass
+        elif rate < previous * (1 - tolerance):
+            self.decrease(guard)
+        elif busy and rate > previous * (1 + tolerance):
+            self.limit += 1
+        self.limit = max(1, min(self.limit, upper))
+        self.rate = rate
+        self.history.append((round(time(), 3), self.limit, rate))
+
+    def info(self):
+        return {
+            'limit': self.limit,
+            'rate': self.rate,
+            'history': list(self.history),
+        }
+
+
+class ConcurrencyController(Handler):
+    """ 并发数自适应控制器。
+
+    负责工作：
+        1. 按下载的总传输速率调节下载的并发数
+        2. 按各下载源的传输速率、超时和过载响应调节各下载源的连接数上限
+
+    配置adaptive_concurrency时启用，并发数从max_concurrent开始探测，不超过adaptive_concurrency。
+    每CONTROL_INTERVAL秒比较一次传输速率，并发数已用满且速率上升时加1，
+    出现超时、429/503响应或速率下降时乘以DECREASE_FACTOR。
+    下载源出现超时或过载响应时立即减小其连接数上限，每个连接延迟内最多减小一次，
+    超出上限的客户端在URIStatusManager.get_uri()等待，不再以重试加重下载源的负载。
+    下载的并发数不超过各下载源连接数上限之和，避免客户端等待不可用的下载源。
+    """
+    name = 'concurrency'
+
+    CONTROL_INTERVAL = 2
+    # 速率变化超过该比例才视为上升或下降
+    RATE_TOLERANCE = 0.1
+    DECREASE_FACTOR = 0.5
+    HISTORY_SIZE = 60
+
+    def __init__(self):
+        self._stopped = False
+        self._download = None
+        # {下载源ID: 下载源的_AIMD}
+        self._sources = {}
+
+    @property
+    def enabled(self):
+        return bool(self.parent.config.adaptive_concurrency)
+
+    @property
+    def limit(self):
+        """ 下载当前允许的并发数。"""
+        if not self.enabled or self._download is None:
+            return self.parent.config.max_concurrent
+        limit = self._download.limit
+        if self._sources:
+            limit = min(limit, sum([aimd.limit for aimd in self._sources.values()]))
+        return limit
+
+    async def prepare(self):
+        self._stopped = False
+        if self.enabled and self._download is None:
+            self._download = _AIMD(self.parent.config.max_concurrent)
+
+    def _source(self, uri_id):
+        """ 返回下载源的并发数和其未过期的URIStatus列表。"""
+        aimd = self._sources.get(uri_id)
+        if aimd is None:
+            aimd = self._sources[uri_id] = _AIMD(self._download.limit)
+        statuses = [status for status in h.uri_mgr.statuses() if status.source_uri.id == uri_id]
+        return aimd, statuses
+
+    @staticmethod
+    def _guard(statuses):
+        """ 返回下载源两次减小连接数上限的最小间隔，即其连接延迟。"""
+        delays = [status.connection_delay for status in statuses]
+        return min(min(delays, default=0), ConcurrencyController.CONTROL_INTERVAL)
+
+    def congested(self, status):
+        """ 下载源出现超时或过载响应时立即减小其连接数上限。
+
+        Args:
+            status: 出现失败的URIStatus对象
+        """
+        if not self.enabled or self._download is None:
+            return
+        aimd, statuses = self._source(status.source_uri.id)
+        count = sum([s.congestion_count() for s in statuses])
+        if count <= aimd.congestion:
+            return
+        aimd.congestion = count
+        if aimd.decrease(self._guard(statuses)):
+            for s in statuses:
+                s.conn_limit = aimd.limit
+
+    def _control(self):
+        config = self.parent.config
+        upper = config.adaptive_concurrency
+        uri_ids = {status.source_uri.id for status in h.uri_mgr.statuses()}
+
+        congested = False
+        for uri_id in uri_ids:
+            aimd, statuses = self._source(uri_id)
+            source_uri = statuses[0].source_uri
+            count = sum([status.congestion_count() for status in statuses])
+            source_congested = count > aimd.congestion
+            aimd.congestion = count
+            source_upper = upper if source_uri.max_conn is None else min(upper, source_uri.max_conn)
+            busy = sum([len(status.users) for status in statuses]) >= aimd.limit
+            rate = sum([status.usage_info.rate for status in statuses])
+            aimd.update(rate, source_congested, busy, source_upper, self._guard(statuses))
+            for status in statuses:
+                status.conn_limit = aimd.limit
+            congested = congested or source_congested
+
+        busy = h.client_worker.working_count() >= self._download.limit
+        self._download.update(self.parent.block_grp.usage_info.rate, congested, busy, upper)
+
+    async def run(self):
+        if not self.enabled:
+            return
+        async_sleep = asyncio.sleep
+        ticks = 0
+        while True:
+            await async_sleep(1)
+            if self._stopped:
+                break
+            ticks += 1
+            if ticks % ConcurrencyController.CONTROL_INTERVAL:
+                continue
+            self._control()
+            # 并发数增加后立即唤醒等待下载源的客户端并切片补充并发量
+            await h.uri_mgr.notify()
+            await h.client_worker.fill()
+
+    async def pause(self):
+        self._stopped = True
+
+    async def close(self):
+        pass
+
+    def __repr__(self):
+        return f'<ConcurrencyController limit={self.limit} future={self._future}>'
+
+    def info_getter(self):
+        return {
+            'enabled': self.enabled,
+            'limit': self.limit,
+            'download': self._download and self._download.info(),
+            'sources': {uri_id: aimd.info() for uri_id, aimd in self._sources.items()},
+        }
+
+
+class _Race:
+    """ 下载块的竞速请求。"""
+    __slots__ = 'shadow', 'uri', 'exited', 'task', 'racer'
+
+    def __init__(self, uri):
+        # 竞速连接使用的下载块，不属于下载块管理器
+        self.shadow = None
+        self.uri = uri
+        # 原下载块的工作已退出
+        self.exited = asyncio.Event()
+        self.task = None
+        self.racer = None
 
 
 class ClientWorker(Handler):
@@ -528,6 +1075,13 @@ class ClientWorker(Handler):
         1. 客户端会话管理
         2. 下载块工作调配
         3. 工作进度检测
+        4. 收尾阶段的竞速请求
+
+    剩余下载量不超过endgame_size时进入收尾阶段，空闲的并发不再请求切片，而是从最快的下载源
+    重复请求预计完成时间最长的下载块的剩余范围。竞速连接从原下载块已写入文件的位置开始，
+    先完成的连接胜出，另一连接被取消。竞速连接胜出时，原下载块在竞速数据写入文件后被替换为完成的下载块，
+    被取消的原连接即使仍有数据写入，也只是以相同的数据覆盖文件中相同的位置。
+    重复下载的数据量计入info_getter()的redundant。
     """
     name = 'client_worker'
 
@@ -538,23 +1092,73 @@ class ClientWorker(Handler):
         self._stopped = False
         self._executors = None
         self._tasks = set()
+        # 下载块工作的asyncio.Task，用于取消竞速失败的异步客户端
+        self._worker_tasks = {}
+        self._races = {}
+        # 竞速失败后被替换、仍在退出中的原下载块
+        self._orphans = set()
+        self._race_count = 0
+        self._race_wins = 0
+        self._redundant = 0
+        # 因读取停滞被中断的次数
+        self._interrupts = 0
 
     async def prepare(self):
         self._stopped = False
 
         self._block_queue = asyncio.Queue()
+        config = self.parent.config
         self._executors = ThreadPoolExecutor(
-            max_workers=self.parent.config.max_concurrent,
+            max_workers=max(config.max_concurrent, config.adaptive_concurrency or 0),
             thread_name_prefix=self.parent.file.name
         )
 
+    @property
+    def max_concurrent(self):
+        """ 当前允许的最大并发数，启用adaptive_concurrency时由ConcurrencyController调节。"""
+        return h.concurrency.limit
+
+    def working_count(self):
+        """ 返回正在工作的下载块数。"""
+        return len(self._working_blocks)
+
+    def stalled_blocks(self, stall_time):
+        """ 返回申领后超过stall_time秒仍未接收到数据的下载块，竞速中和已被替换的下载块除外。"""
+        return [block for block in self._working_blocks
+                if block not in self._races and block not in self._orphans
+                and block.progress.stalled_time() > stall_time]
+
+    async def interrupt(self, block):
+        """ 中断下载块停滞的客户端，下载块退出后从已接收的位置以新的连接重试。"""
+        if self._stopped:
+            return
+        self._interrupts += 1
+        await self._cancel_client(block, self._worker_tasks.get(block))
+
+    async def fill(self):
+        """ 切片补充并发量到当前允许的最大并发数。"""
+        if self._stopped or not self.parent.config.resume_capability:
+            return
+        block_group = self.parent.block_grp
+        for i in range(self.max_concurrent - len(block_group.unfinished_blocks())):
+            block = h.slicer.steal()
+            if block is None:
+                break
+            await self.submit(block)
+
     async def run(self):
         def goto_work(blo):
             """ 后台执行下载块。 """
             def cb(fut):
                 # 回调移除工作下载块，并交由下载块检测
-                self._block_queue.put_nowait(blo)
                 self._working_blocks.remove(blo)
+                self._worker_tasks.pop(blo, None)
+                race = self._races.get(blo)
+                if race is not None:
+                    # 竞速中的下载块由竞速任务处理
+                    race.exited.set()
+                else:
+                    self._block_queue.put_nowait(blo)
 
             task = asyncio.run_coroutine_threadsafe(
                 self._worker(blo), loop)
@@ -562,12 +1166,34 @@ class ClientWorker(Handler):
             task.add_done_callback(cb)
             return task
 
+        def goto_ranges(blos):
+            """ 后台以多范围请求执行多个下载块。 """
+            def cb(fut):
+                for b in blos:
+                    self._block_queue.put_nowait(b)
+                    self._working_blocks.remove(b)
+
+            # 多范围响应按请求时的范围分配数据，下载块不允许被切片
+            for b in blos:
+                h.slicer.discard(b)
+            task = asyncio.run_coroutine_threadsafe(
+                self._ranges_worker(blos), loop)
+            self._working_blocks.update(blos)
+            task.add_done_callback(cb)
+            return task
+
         loop = asyncio.get_running_loop()
         config = self.parent.config
         block_group = self.parent.block_grp
 
         # 准备未完成的下载块
         unfinished_blocks = block_group.unfinished_blocks()
+        # 剩余量小的缺口下载块合并为多范围请求
+        if config.resume_capability:
+            for blocks in self._gap_batches(unfinished_blocks):
+                for block in blocks:
+                    unfinished_blocks.remove(block)
+                goto_ranges(blocks)
         # 提交下载块到工作区
         while unfinished_blocks:
             block = unfinished_blocks.pop(0)
@@ -581,10 +1207,14 @@ class ClientWorker(Handler):
             work_queue.task_done()
             if block is None:
                 break
+            if block in self._orphans:
+                self._orphans.discard(block)
+                continue
             if block.unused_length():
                 # 重试下载块
                 goto_work(block)
             else:
+                h.slicer.discard(block)
                 # 检查任务是否完成
                 if block_group.is_walk_finished():
                     missing = block_group.integrity_check()
@@ -596,21 +1226,28 @@ class ClientWorker(Handler):
                     break
                 # 已完成其中一下载块后允许对未完成下载块进行切片补充并发量
                 if resume_capability:
-                    if len(block_group.unfinished_blocks()) < config.max_concurrent:
+                    if len(block_group.unfinished_blocks()) < self.max_concurrent:
                         if unfinished_blocks:
                             goto_work(unfinished_blocks.pop(0))
-                        else:
-                            h.slicer.request()
+                        elif not self._start_race():
+                            block = h.slicer.steal()
+                            if block is not None:
+                                goto_work(block)
 
         # 任务完成或暂停，清除冗余队列信息
         while not work_queue.empty():
             await work_queue.get()
             work_queue.task_done()
 
-        # 待所有下载块退出
+        # 待所有下载块和竞速请求退出。下载完成后，竞速失败已被取消的连接和被替换的原下载块
+        # 不再有需要写入的数据，只等待仍在写入的下载块
         while self._working_blocks:
+            if block_group.is_walk_finished() and self._working_blocks <= self._orphans:
+                break
             await work_queue.get()
             work_queue.task_done()
+        if self._races and not block_group.is_walk_finished():
+            await asyncio.gather(*[race.task for race in list(self._races.values())])
 
         self._executors.shutdown(False)
         # 非阻塞执行关闭所有handler
@@ -625,13 +1262,44 @@ class ClientWorker(Handler):
             return False
         await self._block_queue.put(block)
 
-    async def _worker(self, block):
-        """ 客户端工作worker。
+    def _gap_batches(self, blocks):
+        """ 挑选剩余量不超过max_gap_size的缺口下载块分批。
+
+        仅当缺口下载块多于最大并发数时分批，批次数尽量不少于最大并发数，
+        每批不超过max_ranges个下载块。
+
         Args:
-            block: 下载块Block对象。
+            blocks: 按起点排序的下载块Block对象列表。
+
+        Returns:
+            多于一个下载块的批次列表。
+        """
+        config = self.parent.config
+        if config.max_ranges < 2:
+            return []
+        gaps = [b for b in blocks if b.progress.walk_left <= config.max_gap_size]
+        if len(gaps) <= self.max_concurrent:
+            return []
+        size = min(config.max_ranges, int(ceil(len(gaps) / self.max_concurrent)))
+        batches = [gaps[i:i + size] for i in range(0, len(gaps), size)]
+        return [batch for batch in batches if len(batch) > 1]
+
+    def _get_session(self, solution):
+        """ 返回客户端处理方案的会话，不存在则创建。"""
+        session = self._client_session.get(solution, None)
+        if session is None:
+            session = solution.get_session()
+            self._client_session[solution] = session
+        return session
+
+    async def _run_client(self, block, cli, solution):
+        """ 运行客户端，非异步的客户端在线程池中运行。
+        Args:
+            block: 客户端所在的下载块Block对象。
+            cli: 客户端对象。
+            solution: 客户端处理方案。
         """
         def run_client_threadsafe():
-            nonlocal cli, loop, handlers_ref, block
             token = block_context.set(block)
             with h.enter(handlers_ref, loop):
                 try:
@@ -641,45 +1309,270 @@ class ClientWorker(Handler):
                 finally:
                     block_context.reset(token)
 
-        if self._stopped:
-            return
+        if solution.is_async():
+            return await cli.run()
         handlers_ref = h.owner
         loop = asyncio.get_running_loop()
-        config = self.parent.config
+        return await loop.run_in_executor(self._executors, run_client_threadsafe)
 
-        # 准备下载源
-        uri = await h.uri_mgr.get_uri()
+    async def _worker(self, block):
+        """ 客户端工作worker。
+        Args:
+            block: 下载块Block对象。
+        """
+        if self._stopped:
+            return
+        config = self.parent.config
+        self._worker_tasks[block] = asyncio.current_task()
 
-        source_uri = uri.get_copy()
         resume_capability = config.resume_capability
         client_policy = config.client_policy
 
-        solution = client_policy.get_solution(source_uri.protocol)
+        probe = self._take_probe(block)
+        client = None
+        if probe is not None:
+            # 使用dlopen()交接的探测连接作为该下载块的数据来源，只交接了前缀数据时重新连接
+            client = probe.detach_client()
+            if not resume_capability and client is None:
+                # 不支持断点续传的情况下，重新连接将从资源起点开始传输，已接收的数据不可用。
+                probe.close()
+                probe = None
+
+        if client is not None:
+            uri = h.uri_mgr.get_status(probe.source_uri)
+            solution = client_policy.get_solution(client.source_uri.protocol)
+            client.progress = block.progress
+        else:
+            # 准备下载源
+            uri = await h.uri_mgr.get_uri()
+            if uri is None:
+                return None
 
-        # 准备客户端会话
-        session = self._client_session.get(solution, None)
-        if session is None:
-            session = solution.get_session()
-            self._client_session[solution] = session
+            source_uri = uri.get_copy()
 
-        # 准备客户端处理器
-        client = solution.get_client(
-            session, source_uri, block.progress, resume_capability)
+            solution = client_policy.get_solution(source_uri.protocol)
+
+            # 准备客户端处理器
+            client = solution.get_client(
+                self._get_session(solution), source_uri, block.progress, resume_capability)
 
         # 为下载块准备客户端进行下载
+        result = None
         async with block.request(client) as cli:
             uri.use(block)
             try:
-                if solution.is_async():
-                    fut = cli.run()
-                else:
-                    fut = loop.run_in_executor(self._executors, run_client_threadsafe)
-                result = await fut
+                if probe is not None and probe.prefix:
+                    await self._store_prefix(block, probe.prefix)
+                if not block.progress.is_walk_finished():
+                    result = await self._run_client(block, cli, solution)
+            except asyncio.CancelledError:
+                # 竞速失败或读取停滞被取消
+                pass
             except BaseException as err:
                 h.exception.client_error(err)
             uri.disuse(block)
+        if probe is not None:
+            probe.close()
+        return result
+
+    async def _ranges_worker(self, blocks):
+        """ 多范围请求客户端工作worker。
+
+        使用单个多范围请求下载多个缺口下载块。下载源或客户端不支持多范围请求时直接返回，
+        未完成的下载块回到工作队列后单独请求。
+
+        Args:
+            blocks: 按起点排序的下载块Block对象列表。
+        """
+        if self._stopped:
+            return
+        config = self.parent.config
+
+        uri = await h.uri_mgr.get_uri()
+        if uri is None:
+            return
+        source_uri = uri.get_copy()
+        solution = config.client_policy.get_solution(source_uri.protocol)
+        if uri.multirange is False or source_uri.range_field is not None or not solution.supports_multirange():
+            return
+
+        head, others = blocks[0], blocks[1:]
+        client = solution.get_client(
+            self._get_session(solution), source_uri, head.progress, config.resume_capability)
+        client.ranges = [b.progress for b in blocks]
+
+        # 其余下载块共用同一客户端，以便下载块记录所用的下载源
+        for b in others:
+            b.request(client)
+        result = None
+        async with head.request(client) as cli:
+            uri.use(head)
+            try:
+                result = await self._run_client(head, cli, solution)
+            except BaseException as err:
+                h.exception.client_error(err)
+            uri.disuse(head)
+        for b in others:
+            b.refresh()
+            b.client = None
         return result
 
+    def _start_race(self):
+        """ 处于收尾阶段时，为预计完成时间最长的下载块启动一个竞速请求。
+
+        Returns:
+            是否启动了竞速请求。
+        """
+        config = self.parent.config
+        block_grp = self.parent.block_grp
+        if not config.endgame_size or block_grp.remaining_length() > config.endgame_size:
+            return False
+        if len(self._working_blocks) + len(self._races) >= self.max_concurrent:
+            return False
+        # 多范围请求的下载块共用客户端，不参与竞速
+        blocks = [b for b in self._working_blocks
+                  if b not in self._races and b not in self._orphans and b.client is not None
+                  and getattr(b.client, 'ranges', None) is None and b.unused_length()]
+        if not blocks:
+            return False
+        block = max(blocks, key=lambda b: (h.slicer.remaining_time(b), b.progress.walk_left))
+        uri = h.uri_mgr.get_fastest_uri(exclude=block.current_uri())
+        if uri is None:
+            return False
+        # 影子下载块按竞速开始时的终点请求，被竞速的下载块不再被切片
+        h.slicer.discard(block)
+        race = self._races[block] = _Race(uri)
+        race.task = asyncio.ensure_future(self._race(block, race))
+        self._race_count += 1
+        return True
+
+    async def _race(self, block, race):
+        """ 竞速请求下载块的剩余范围，先完成的连接胜出。"""
+        exited = asyncio.ensure_future(race.exited.wait())
+        completed = None
+        try:
+            # 竞速从已写入文件的位置开始，竞速胜出时原下载块此前的数据都已在文件中。
+            # 先写入原下载块已保存的数据，减少重复下载的数据量。
+            file_data = h.file_data
+            since = file_data.flushes
+            await file_data.flush()
+            await file_data.wait_flushed(since, self.parent.config.interval)
+            progress = block.progress
+            chunk_size = self.parent.block_grp.chunk_size
+            begin = (progress.begin + progress.done_length) // chunk_size * chunk_size
+            if self._stopped or progress.is_walk_finished():
+                return
+            shadow = race.shadow = Block(Progress((begin, progress.end)), chunk_size)
+            racer = race.racer = asyncio.ensure_future(self._race_worker(shadow, race.uri))
+
+            await asyncio.wait([racer, exited], return_when=asyncio.FIRST_COMPLETED)
+            if exited.done() and block.progress.is_walk_finished():
+                # 原连接胜出
+                await self._cancel_client(shadow, racer)
+                await asyncio.wait([racer])
+                self._redundant += shadow.progress.walk_length
+            else:
+                # 原连接未完成就退出时，等待竞速连接代替其完成
+                await asyncio.wait([racer])
+                if shadow.progress.is_walk_finished():
+                    completed = await self._win_race(block, shadow, exited.done())
+                else:
+                    self._redundant += shadow.progress.walk_length
+        finally:
+            exited.cancel()
+            del self._races[block]
+            if race.exited.is_set():
+                self._orphans.discard(block)
+            if completed is not None:
+                self._block_queue.put_nowait(completed)
+            elif race.exited.is_set():
+                self._block_queue.put_nowait(block)
+
+    async def _win_race(self, block, shadow, exited):
+        """ 竞速连接胜出，取消原连接，竞速数据写入文件后以完成的下载块替换原下载块。
+
+        Args:
+            block: 原下载块
+            shadow: 竞速连接的下载块
+            exited: 原下载块的工作是否已退出
+
+        Returns:
+            替换原下载块的完成的下载块。
+        """
+        progress = block.progress
+        if not exited:
+            self._orphans.add(block)
+            await self._cancel_client(block, self._worker_tasks.get(block))
+        self._redundant += max(0, progress.begin + progress.walk_length - shadow.progress.begin)
+        self._race_wins += 1
+
+        file_data = h.file_data
+        while not shadow.progress.is_done_finished():
+            since = file_data.flushes
+            await file_data.flush()
+            await file_data.wait_flushed(since, self.parent.config.interval)
+        h.slicer.discard(block)
+        completed = self.parent.block_grp.complete(block)
+        file_data.record_done(completed.progress)
+        return completed
+
+    async def _race_worker(self, shadow, uri):
+        """ 竞速连接工作worker。
+        Args:
+            shadow: 竞速连接的下载块Block对象。
+            uri: 竞速连接使用的URIStatus对象。
+        """
+        if self._stopped:
+            return
+        config = self.parent.config
+        source_uri = uri.get_copy()
+        solution = config.client_policy.get_solution(source_uri.protocol)
+        client = solution.get_client(self._get_session(solution), source_uri, shadow.progress, True)
+        async with shadow.request(client) as cli:
+            uri.use(shadow)
+            try:
+                await self._run_client(shadow, cli, solution)
+            except asyncio.CancelledError:
+                pass
+            except BaseException as err:
+                h.exception.client_error(err)
+            uri.disuse(shadow)
+
+    async def _cancel_client(self, block, task):
+        """ 取消下载块的客户端，异步客户端同时取消其工作任务以中断阻塞中的读取，
+        线程客户端由pause()关闭连接的套接字中断阻塞中的读取。
+
+        Args:
+            block: 下载块Block对象。
+            task: 下载块工作的asyncio.Task，客户端尚未进入时等待其进入。
+        """
+        while block.client is None:
+            if task is None or task.done():
+                return
+            await asyncio.sleep(0)
+        client = block.client
+        await client.pause()
+        solution = self.parent.config.client_policy.get_solution(client.source_uri.protocol)
+        if task is not None and solution.is_async():
+            task.cancel()
+
+    def _take_probe(self, block):
+        """ 若下载块从资源起点开始，取出dlopen()交接的探测连接。"""
+        probe = self.parent._probe
+        progress = block.progress
+        if probe is None or progress.begin != 0 or progress.walk_length != 0:
+            return None
+        self.parent._probe = None
+        return probe
+
+    async def _store_prefix(self, block, prefix):
+        """ 将探测连接已接收的数据作为下载块的数据。"""
+        progress = block.progress
+        prefix = prefix[:progress.total_length]
+        if prefix:
+            progress.walk(len(prefix))
+            await h.file_data.store(prefix)
+
     async def close(self):
         async def close_sess(sess):
             """ 关闭客户端会话。"""
@@ -689,6 +1582,11 @@ class ClientWorker(Handler):
         await asyncio.gather(*[close_sess(session) for session in self._client_session.values()])
         self._client_session.clear()
 
+        probe = self.parent._probe
+        if probe is not None:
+            self.parent._probe = None
+            probe.close()
+
     async def pause(self):
         async def pause_cli(blo):
             """ 安全暂停关闭客户端。"""
@@ -705,7 +1603,9 @@ class ClientWorker(Handler):
 
         if not self._stopped:
             self._stopped = True
-            await asyncio.gather(*[pause_cli(block) for block in self._working_blocks])
+            await asyncio.gather(*[pause_cli(block) for block in self._working_blocks],
+                                 *[self._cancel_client(race.shadow, race.racer) for race in self._races.values()
+                                   if race.racer is not None])
             await self._block_queue.put(None)
 
     def __repr__(self):
@@ -713,7 +1613,14 @@ class ClientWorker(Handler):
 
     def info_getter(self):
         return {
-            'actives': set(self._working_blocks)
+            'actives': set(self._working_blocks),
+            'read_size': {blo: blo.client.read_ctrl.info() for blo in set(self._working_blocks)
+                          if blo.client is not None and blo.client.read_ctrl is not None},
+            'racing': set(self._races),
+            'races': self._race_count,
+            'race_wins': self._race_wins,
+            'redundant': self._redundant,
+            'interrupts': self._interrupts,
         }
 
 
@@ -721,74 +1628,177 @@ class BlockSlicer(Handler):
     """ 下载块切片器。
 
     负责工作：
-        1. 下载块切片请求和响应
+        1. 从正在下载的下载块末尾切走未申领的部分
+        2. 维护下载块的预计完成时间
+
+    切片不需要被切片下载块的客户端配合，客户端接收数据前以Progress.claim()申领接收长度，
+    切片只切走申领范围之后的部分，被切片的客户端在下一次申领时停在新的终点，停滞的连接也不会占住剩余的下载量。
+
+    切片优先选择预计完成时间最长的下载块，而非剩余量最大的下载块，快速下载源上剩余量大的下载块
+    不会先于慢速下载源上剩余量小的下载块被切片。预计完成时间为剩余量除以下载块的实时传输速率，
+    尚无速率的下载块按当前下载块的平均速率估计，所有下载块都没有速率时按剩余量选择。
+    候选下载块保存在IndexedHeap中，只在切片和速率刷新时更新变化的下载块，切片决策不再排序全部下载块。
+
+    切片的起点总是块chunk的整数倍。新下载块小于min_slice_size时拒绝切片，未配置时取块chunk大小与
+    SLICE_COST倍的建立请求期间可传输数据量中的较大者，避免下载末尾不断切出建立请求比传输更耗时的小下载块。
+
+    切片无法切走客户端正在接收的申领范围。并发有空闲时已没有可切片的下载块，申领后超过stall_time()
+    仍未接收到数据的客户端被中断，下载块从已接收的位置以新的连接重试，停滞的读取不必等到超时才退出。
     """
     name = 'slicer'
 
+    # 新下载块的传输时间至少为建立请求耗时的倍数
+    SLICE_COST = 4
+    # 判定读取停滞的最短时间（秒）
+    STALL_TIME = 2
+
     def __init__(self):
-        self._waiters = set()
-        self._lock = threading.Lock()
+        # 以(-预计完成时间, -剩余量)为键值的候选下载块
+        self._candidates = IndexedHeap()
+        self._rates = {}
+        self._mean_rate = 0
+        # 完成的切片次数和因新下载块过小而拒绝的切片次数
+        self._slices = 0
+        self._refused = 0
+        # 按传输速率和连接延迟估计的新下载块最小长度
+        self._min_size = 0
+        # 建立请求的平均耗时
+        self._mean_delay = 0
+        self._stopped = False
 
     async def divide_into(self, n):
         """ 下载块切片器分成n份。
 
-        该方法不建议在在下载块工作过程中进行调用，
-        否则可能会出现传输数据冗余的问题。
-
         Args:
             n: 分成n份。
         """
         for i in range(n):
-            self.request()
-            while self._waiters:
-                block = self._waiters.pop()
-                self._slice(block)
+            if self.steal() is None:
+                break
 
     def _slice(self, source_block):
         req_range = source_block.half_unused()
         if req_range:
+            if self._slice_length(source_block) < self.min_slice_size():
+                self._refused += 1
+                return None
             result = source_block.slice(req_range)
             if result:
                 block = self.parent.block_grp.insert(result)
+                h.file_data.record_slice(source_block.progress, block.progress)
+                self._update(source_block)
+                self._update(block)
+                self._slices += 1
                 return block
 
         return None
 
-    async def response(self):
-        """ 客户端用于响应切片器是否需要对其进行切片。
+    def min_slice_size(self):
+        """ 返回新下载块的最小长度。"""
+        min_size = self.parent.config.min_slice_size
+        if min_size is None:
+            min_size = self._min_size
+        return max(min_size, self.parent.block_grp.chunk_size)
+
+    def stall_time(self):
+        """ 返回判定读取停滞的时长，取STALL_TIME与SLICE_COST倍的建立请求耗时中的较大者。"""
+        return max(BlockSlicer.STALL_TIME, BlockSlicer.SLICE_COST * self._mean_delay)
+
+    def _slice_length(self, block):
+        """ 返回从下载块切片出的新下载块的长度。"""
+        return block.unused_length() // 2 * self.parent.block_grp.chunk_size
+
+    def _update(self, block):
+        """ 更新下载块在候选中的预计完成时间。"""
+        unused = block.unused_length()
+        if unused <= 1:
+            # 剩余不足两个块chunk的下载块无法切片
+            self._candidates.remove(block)
+            return
+        self._candidates.push(block, (-self.remaining_time(block), -unused))
 
-        若切片器希望对当前下载块进行切片，调用该方法允许切片器安全的对当前下载块进行切片。
-        安全的前提是该方法在不影响下载区间的地方调用。
-        若当前下载块未在期望切片队列则直接跳过。
-        """
-        if self._waiters:
-            with self._lock:
-                source_block = _lookup_block()
-                if source_block not in self._waiters:
-                    return
-                self._waiters.remove(source_block)
-                resp = self._slice(source_block)
-            if resp is not None:
-                await h.client_worker.submit(resp)
+    def remaining_time(self, block):
+        """ 返回下载块的预计完成时间，所有下载块都没有速率时返回inf。"""
+        rate = self._rates.get(block) or self._mean_rate
+        if not rate:
+            return float('inf')
+        return block.unused_length() * self.parent.block_grp.chunk_size / rate
 
-    def response_threadsafe(self):
-        with self._lock:
-            if not self._waiters and _lookup_block() not in self._waiters:
-                return False
-        await_coroutine_threadsafe(self.response())
+    def update_rates(self, rates):
+        """ 按下载块的实时传输速率更新预计完成时间。
 
-    def request(self):
-        """ 请求一次下载块切片。
+        Args:
+            rates: {下载块: 实时传输速率}，通常为正在下载的下载块
+        """
+        known = [rate for rate in rates.values() if rate > 0]
+        self._rates = rates
+        if known:
+            self._mean_rate = sum(known) / len(known)
+        delays = [status.connection_delay for status in h.uri_mgr.statuses()
+                  if status.connection_delay != float('inf')]
+        if delays:
+            self._mean_delay = sum(delays) / len(delays)
+            self._min_size = int(BlockSlicer.SLICE_COST * self._mean_rate * self._mean_delay)
+        for block in rates:
+            if block in self._candidates:
+                self._update(block)
+
+    def discard(self, block):
+        """ 从候选中移除已完成或不再允许切片的下载块。"""
+        self._candidates.remove(block)
+
+    def steal(self):
+        """ 立即从预计完成时间最长的下载块末尾切出一个新的下载块。
+
+        配置sequential时优先选择文件位置靠前且可切片的下载块，使文件开头连续完成的数据尽快增长。
 
-        使用最大剩余block大小策略来选择被切块对象，该方法并未对下载块进行切片，
-        需要客户端配合response()方法来响应切片请求。
+        Returns:
+            切片出的新下载块，没有可切片的下载块时返回None。
         """
-        len_waiting = len(self._waiters)
-        blocks = sorted(self.parent.block_grp.unfinished_blocks(), key=lambda i: i.unused_length(), reverse=True)
-        self._waiters = set(blocks[:len_waiting + 1])
-        return len(self._waiters) == len_waiting + 1
+        if self.parent.config.sequential:
+            min_size = self.min_slice_size()
+            candidates = [b for b in self.parent.block_grp.unfinished_blocks() if b in self._candidates]
+            blocks = [b for b in candidates if self._slice_length(b) >= min_size]
+            if candidates and not blocks:
+                self._refused += 1
+        else:
+            blocks = self._top(1)
+        for block in blocks:
+            # 被切片的客户端已申领到切片点之后时切片失败，尝试下一个下载块
+            result = self._slice(block)
+            if result is not None:
+                return result
+        return None
+
+    def _top(self, n):
+        """ 返回预计完成时间最长的n个切片不小于min_slice_size的下载块。"""
+        candidates = self._candidates
+        min_size = self.min_slice_size()
+        blocks = []
+        # 切片过小的下载块暂不切片，剩余量和最小长度变化后仍是候选
+        skipped = []
+        while candidates and len(blocks) < n:
+            block, key = candidates.peek()
+            self._update(block)
+            if block not in candidates or candidates.peek()[0] is not block:
+                # 已无法切片或剩余量变化后不再是最长，按更新后的键值重新选择
+                continue
+            if self._slice_length(block) < min_size:
+                skipped.append(candidates.pop())
+            else:
+                blocks.append(candidates.pop())
+        for block, key in blocks + skipped:
+            candidates.push(block, key)
+        if skipped and len(blocks) < n:
+            self._refused += 1
+        return [block for block, key in blocks]
 
     async def prepare(self):
+        self._candidates.clear()
+        self._rates = {}
+        self._mean_rate = 0
+        for block in self.parent.block_grp.unfinished_blocks():
+            self._update(block)
         # 下载块切片以保证下载块的最大并发量。
         config = self.parent.config
         if config.resume_capability:
@@ -797,20 +1807,38 @@ class BlockSlicer(Handler):
                 await self.divide_into(config.max_concurrent - blocks_len)
 
     async def run(self):
-        pass
+        self._stopped = False
+        if not self.parent.config.resume_capability:
+            # 不支持断点续传时重新连接只能从资源起点开始，不中断停滞的读取
+            return
+        async_sleep = asyncio.sleep
+        client_worker = h.client_worker
+        while True:
+            await async_sleep(1)
+            if self._stopped:
+                break
+            if client_worker.working_count() >= client_worker.max_concurrent:
+                continue
+            for block in client_worker.stalled_blocks(self.stall_time()):
+                await client_worker.interrupt(block)
 
     async def close(self):
         pass
 
     async def pause(self):
-        self._waiters.clear()
+        self._stopped = True
 
     def __repr__(self):
-        return f'<BlockSlicer {self._waiters} future={self._future}>'
+        return f'<BlockSlicer candidates={len(self._candidates)} future={self._future}>'
 
     def info_getter(self):
         return {
-            'waiters': set(self._waiters)
+            'candidates': len(self._candidates),
+            'mean_rate': self._mean_rate,
+            'min_slice_size': self.min_slice_size(),
+            'stall_time': self.stall_time(),
+            'slices': self._slices,
+            'refused': self._refused,
         }
 
 
@@ -837,29 +1865,47 @@ class SpeedAdjuster(Handler):
                 self._thread_cond.notify_all()
                 self._async_cond.notify_all()
 
-    def acquire_threadsafe(self):
+    def acquire_threadsafe(self, size=8192):
+        """ 线程安全获取读取配额。
+        Args:
+            size: 本次要读取的字节数
+        """
         if self._opened:
             while True:
                 with self._thread_cond:
                     value = self._sema_value
                     if value > 0:
-                        self._sema_value -= 1
+                        self._sema_value -= size
                         break
                     self._thread_cond.wait()
         return False
 
-    async def acquire(self):
+    async def acquire(self, size=8192):
+        """ 获取读取配额，限速时配额不足将等待下一个调节间隙。
+
+        配额以字节计，允许本次读取透支配额，透支部分在下一个调节间隙扣除。
+
+        Args:
+            size: 本次要读取的字节数
+        """
         if self._opened:
             while True:
                 with self._thread_cond:
                     async with self._async_cond:
                         value = self._sema_value
                         if value > 0:
-                            self._sema_value -= 1
+                            self._sema_value -= size
                             break
                         await self._async_cond.wait()
         return False
 
+    def read_limit(self):
+        """ 返回限速时每个连接在单个调节间隙的读取配额，未限速返回None。"""
+        config = self.parent.config
+        if not self._opened or config.max_speed is None:
+            return None
+        return int(config.max_speed * config.interval / max(config.max_concurrent, 1))
+
     async def prepare(self):
         assert self._stopped
         self._async_cond = asyncio.Condition()
@@ -893,12 +1939,11 @@ class SpeedAdjuster(Handler):
                     self._opened = True
                     fraction = 0
 
-            # 如果限制的下载速率就处理信号量
+            # 如果限制的下载速率就处理读取配额
             if max_speed is not None:
-                value = config.max_speed * config.interval / 8196
+                value = config.max_speed * config.interval
 
-                # 由于下载客户端以单次读数据粒度进行限速，所以为了更细化的限速
-                # 对计算出来的信号量粒度小数保留下来留给下次累加。
+                # 配额以字节计，对计算出来的配额小数保留下来留给下次累加。
                 fraction += value % 1
                 value = int(value)
                 if fraction >= 1:
@@ -906,7 +1951,8 @@ class SpeedAdjuster(Handler):
                     fraction -= 1
                 with self._thread_cond:
                     async with self._async_cond:
-                        self._sema_value = value
+                        # 上一个调节间隙透支的配额在本次扣除
+                        self._sema_value = min(self._sema_value, 0) + value
                         self._thread_cond.notify_all()
                         self._async_cond.notify_all()
 
@@ -934,25 +1980,119 @@ class FileTempData(Handler):
     负责工作：
         1. 文件缓冲和写入
         2. 下载状态的保存
+
+    内存映射模式下，客户端直接将数据接收到下载中文件的内存映射区域，不再经过缓冲和写入，
+    buffer_size仅决定同步映射和保存下载状态的间隔。每次保存状态前都同步映射到文件。
+
+    下载状态的持久性由durability配置:
+        - none: 原地写入状态文件，不同步磁盘。开销最小，中断在写入过程中时状态文件可能损坏。
+        - atomic: 状态文件写入临时文件后重命名，状态文件总是完整的，每次快照只多一次重命名。
+                  系统崩溃时状态记录的完成长度可能多于已落盘的数据。
+        - fsync: 每次保存状态前先同步文件数据，再同步写入状态，状态记录的完成长度总是已落盘。
+                 每次缓冲释放增加一次数据同步和一次状态同步，写入吞吐受磁盘同步延迟限制，
+                 适合较大的buffer_size。
+
+    已保存但未写入文件的数据超过高水位时，保存数据的客户端暂停，直到写入使其降至低水位，
+    避免网络快于磁盘时内存无限增长。未写入的数据量最多超出高水位每个客户端一个缓冲块，
+    info_getter()的stall_time为客户端因此累计等待的时间。
     """
+    DURABILITY = frozenset({'none', 'atomic', 'fsync'})
 
     name = 'file_data'
 
+    # 客户端接收数据的缓冲块大小，也是客户端单次读取量的上限
+    SLAB_SIZE = 262144   # 256 KB
+
     def __init__(self):
         self._buffers = defaultdict(list)
         self._counter = 0
+        self._pool = BufferPool(FileTempData.SLAB_SIZE)
+        self._mmap = None
+        # 内存映射模式下各下载进度已保存的数据长度
+        self._stored = {}
+        self._journal = None
         self._unreleased = None
         self._lock = threading.RLock()
         self._stopped = True
+        # 已保存但未写入文件的数据量，由_pending_lock保护。
+        # 保存数据的线程持有_lock等待事件循环释放缓冲，事件循环中不能获取_lock。
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._writable = None
+        self._stall_time = 0
+        self._stalls = 0
+        # 合并写入的相邻缓冲数量
+        self._merges = 0
+        # 缓冲写入文件的次数，用于通知等待数据写入的读取者
+        self._flushes = 0
+        self._flush_cond = threading.Condition(threading.Lock())
+        self._flush_waiters = set()
 
     async def saving_state(self):
         """ 保存当前下载状态。
 
-        以cfg的文件形式保存当前下载配置以备文件下载状态的恢复。
+        以cfg的文件形式保存当前下载配置以备文件下载状态的恢复，并清空下载进度日志。
+        """
+        await self._checkpoint(compact=True)
+
+    def _checkpoint(self, compact=False):
+        """ 记录当前的下载状态。
+
+        需要时保存完整快照，否则只追加下载进度日志。
+
+        Returns:
+            保存下载状态的协程。
         """
-        dumpy = self.parent.dumps()
-        async with h.aio.open(f'{self.parent.file.pathname}{self.parent.config.downloading_ext}.cfg', mode='w') as f:
-            await f.write(json.dumps(dumpy))
+        journal = self._journal
+        if journal is None:
+            journal = self._journal = Journal()
+        if compact or journal.needs_snapshot():
+            if self.parent.config.state_format == 'binary':
+                state = self.parent.pack()
+            else:
+                state = json.dumps(self.parent.dumps())
+            return self._save_state(journal.snapshot(), state)
+        return self._append_journal(journal.pop())
+
+    def _state_path(self):
+        return f'{self.parent.file.pathname}{self.parent.config.downloading_ext}.cfg'
+
+    async def _save_state(self, header, state):
+        """ 保存下载状态快照并清空下载进度日志。
+
+        Args:
+            header: 清空后的下载进度日志内容
+            state: JSON的str或二进制格式的bytes下载状态
+        """
+        durability = self.parent.config.durability
+        if durability == 'none':
+            async with h.aio.open(self._state_path(), mode='wb' if isinstance(state, bytes) else 'w') as f:
+                await f.write(state)
+        else:
+            await h.aio.execute(write_atomic, self._state_path(), state, durability == 'fsync', meta=True)
+        # 快照保存后再清空日志，中断时重放日志中快照已包含的记录不会改变下载状态
+        async with h.aio.open(f'{self._state_path()}.journal', mode='wb') as f:
+            await f.write(header)
+
+    async def _append_journal(self, data):
+        if data:
+            await h.aio.execute(append_file, f'{self._state_path()}.journal', data,
+                                self.parent.config.durability == 'fsync', meta=True)
+
+    def record_done(self, progress):
+        """ 记录下载进度的完成长度。"""
+        if self._journal is not None:
+            self._journal.record_done(progress)
+
+    async def flush(self):
+        """ 释放当前的缓冲，使其尽快写入文件。"""
+        if self._counter:
+            await self._release()
+
+    def record_slice(self, progress, new_progress):
+        """ 记录下载进度的切片。"""
+        if self._journal is not None:
+            self._journal.record_slice(progress, new_progress)
 
     async def _release(self):
         buffers = self._buffers
@@ -961,64 +2101,323 @@ class FileTempData(Handler):
         self._buffers = defaultdict(list)
         return await self._unreleased.put((counter, buffers))
 
-    def store_threadsafe(self, data):
+    def store_threadsafe(self, data, progress=None):
         """ 线程安全保存临时下载数据。"""
         with self._lock:
-            block = _lookup_block()
-            self._buffers[block.progress].append(data)
+            if progress is None:
+                progress = _lookup_block().progress
             self._counter += len(data)
+            with self._pending_lock:
+                self._pending += len(data)
+            if self._mmap is not None:
+                self._map_data(data, progress)
+            else:
+                self._buffers[progress].append(data)
             if self.parent.config.buffer_size <= self._counter:
                 await_coroutine_threadsafe(self._release())
+        if self._pending >= self._watermarks()[0] or not self._writable.is_set():
+            await_coroutine_threadsafe(self._throttle())
+
+    def acquire_view(self, progress=None):
+        """ 返回客户端用于接收数据的可写memoryview。
 
-    async def store(self, data):
+        缓冲模式下为缓冲块池中bytearray缓冲块的memoryview，缓冲块在写入文件后自动归还缓冲块池。
+        内存映射模式下为文件映射中下载进度待接收位置开始的区域，不超过SLAB_SIZE和下载进度的结尾。
+        客户端将数据填入后，通过store()传递其从头开始的切片。
+
+        Args:
+            progress: 接收数据的下载进度，默认为当前上下文下载块的下载进度
+        """
+        mapped = self._mmap
+        if mapped is None:
+            return memoryview(self._pool.acquire())
+        if progress is None:
+            progress = _lookup_block().progress
+        start = progress.begin + self._stored.get(progress, progress.done_length)
+        end = max(start, min(progress.end, start + FileTempData.SLAB_SIZE))
+        return memoryview(mapped)[start:end]
+
+    def release_view(self, view):
+        """ 归还未交由store()保存的acquire_view()。"""
+        buf = view.obj
+        view.release()
+        if buf is not self._mmap:
+            self._pool.release(buf)
+
+    def _map_data(self, data, progress):
+        """ 内存映射模式下保存数据。
+
+        已在映射区域中的数据只计入下载进度，其他数据拷贝到映射中下载进度待保存的位置。
+        """
+        length = len(data)
+        stored = self._stored.get(progress, progress.done_length)
+        if type(data) is memoryview and data.obj is self._mmap:
+            data.release()
+        else:
+            start = progress.begin + stored
+            self._mmap[start:start + length] = data
+        self._stored[progress] = stored + length
+        self._buffers[progress].append(length)
+
+    def _recycle(self, lines):
+        """ 回收已写入文件的缓冲块。"""
+        release = self._pool.release
+        for line in lines:
+            if type(line) is memoryview:
+                buf = line.obj
+                line.release()
+                release(buf)
+
+    async def store(self, data, progress=None):
         """ 缓冲传输数据。
 
         当缓冲的数据超过了buffer_size，将对缓冲进行释放写入文件。
 
         Args:
-            data: 要被缓冲的传输数据
+            data: 要被缓冲的传输数据，bytes或acquire_view()的memoryview切片
+            progress: 数据所属的下载进度，默认为当前上下文下载块的下载进度
         """
-        block = _lookup_block()
-        self._buffers[block.progress].append(data)
+        if progress is None:
+            progress = _lookup_block().progress
         self._counter += len(data)
+        with self._pending_lock:
+            self._pending += len(data)
+        if self._mmap is not None:
+            self._map_data(data, progress)
+        else:
+            self._buffers[progress].append(data)
         if self.parent.config.buffer_size <= self._counter:
             await self._release()
+        if self._pending >= self._watermarks()[0] or not self._writable.is_set():
+            await self._throttle()
+
+    def _watermarks(self):
+        """ 返回未写入数据量的(高水位, 低水位)。"""
+        config = self.parent.config
+        high = config.memory_high_watermark
+        if high is None:
+            high = 4 * config.buffer_size
+        low = config.memory_low_watermark
+        if low is None:
+            low = high // 2
+        return high, min(low, high)
+
+    async def _throttle(self):
+        """ 未写入的数据达到高水位时，等待写入使其降至低水位。"""
+        if self._pending >= self._watermarks()[0]:
+            self._writable.clear()
+        if self._writable.is_set():
+            return
+        # 释放全部缓冲，等待的数据都能被写入
+        if self._counter:
+            await self._release()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await self._writable.wait()
+        self._stall_time += loop.time() - start
+        self._stalls += 1
+
+    def _written(self, length):
+        """ 记录数据已写入，未写入的数据降至低水位时恢复暂停的客户端。"""
+        with self._pending_lock:
+            self._pending -= length
+        if self._pending <= self._watermarks()[1]:
+            self._writable.set()
 
     async def prepare(self):
         assert self._stopped
+        if self.parent.config.durability not in FileTempData.DURABILITY:
+            raise ValueError(f'unknown durability: {self.parent.config.durability!r}')
         self._unreleased = asyncio.Queue()
         self._stopped = False
+        self._pending = 0
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._stored = {}
+        self._journal = Journal()
+        if self.parent.config.use_mmap:
+            await asyncio.get_running_loop().run_in_executor(None, self._open_mmap)
+
+    def _open_mmap(self):
+        """ 以内存映射打开下载中的文件，大小未知或为0的文件不使用内存映射。"""
+        file = self.parent.file
+        if not file.size:
+            return
+        fd = os.open(f'{file.pathname}{self.parent.config.downloading_ext}',
+                     os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            # 通过下载块是否有done_length的情况来判断是否需要重写文件。
+            if not self.parent.block_grp.done_length():
+                os.ftruncate(fd, 0)
+                preallocate(fd, file.size, self.parent.config.preallocate)
+            if os.fstat(fd).st_size != file.size:
+                os.ftruncate(fd, file.size)
+            self._mmap = mmap.mmap(fd, file.size)
+        finally:
+            os.close(fd)
+
+    def _close_mmap(self):
+        mapped = self._mmap
+        self._mmap = None
+        try:
+            mapped.close()
+        except BufferError:
+            # 仍有映射区域的memoryview未释放，交由垃圾回收关闭
+            log.debug('mmap is still exported.')
 
     async def run(self):
-        unreleased = self._unreleased
+        if self._mmap is not None:
+            try:
+                await self._flush_loop(self._sync)
+            finally:
+                self._close_mmap()
+            return
+
         file = self.parent.file
         filepath = f'{file.pathname}{self.parent.config.downloading_ext}'
 
         # 通过下载块是否有walk_length的情况来判断是否需要重写文件。
         if not self.parent.block_grp.done_length():
-            async with h.aio.open(f'{file.pathname}{self.parent.config.downloading_ext}', mode='wb') as fd:
-                if file.size is not None:
-                    await fd.seek(file.size - 1)
-                    await fd.write(b'\x00')
+            await h.aio.execute(self._create_file, filepath)
 
-        async with h.aio.open(filepath, mode='rb+') as fd:
-            while True:
-                result = await unreleased.get()
-                if result is None:
-                    unreleased.task_done()
-                    break
-                counter, buffers = result
-                for pg, lines in buffers.items():
-                    await fd.seek(pg.begin + pg.done_length)
-                    await fd.writelines(lines)
-                    pg.done(sum([len(line) for line in lines]))
-
-                # 删除引用，尽快回收垃圾
-                del lines
-                del result
-                del buffers
-                await self.saving_state()
+        async with h.aio.open_raw(filepath, direct=self.parent.config.direct_io) as fd:
+            fsync = self.parent.config.durability == 'fsync'
+
+            async def write(buffers):
+                # 按位置写入不依赖文件指针，文件中不相邻的数据并发写入。
+                await asyncio.gather(*[self._write(fd, offset, members)
+                                       for offset, members in self._coalesce(buffers)])
+                if fsync:
+                    await fd.fdatasync()
+
+            await self._flush_loop(write)
+
+    def _create_file(self, filepath):
+        """ 新建下载中的文件，大小已知时按preallocate配置预分配文件空间。"""
+        fd = os.open(filepath, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            if self.parent.file.size:
+                preallocate(fd, self.parent.file.size, self.parent.config.preallocate)
+        finally:
+            os.close(fd)
+
+    async def _flush_loop(self, write):
+        """ 处理释放的缓冲，每次写入后保存下载状态。
+
+        Args:
+            write: 写入缓冲的异步函数，参数为{下载进度: 缓冲数据列表}
+        """
+        unreleased = self._unreleased
+        saving = None
+        while True:
+            result = await unreleased.get()
+            if result is None:
+                if saving is not None:
+                    await saving
+                # 结束时保存完整快照，暂停后的下载状态不依赖日志
+                await self._checkpoint(compact=True)
                 unreleased.task_done()
+                self._notify_flushed()
+                break
+            counter, buffers = result
+            await write(buffers)
+            self._written(counter)
+            self._notify_flushed()
+            for pg in buffers:
+                self._journal.record_done(pg)
+
+            # 删除引用，尽快回收垃圾
+            del result
+            del buffers
+            # 写入完成时的下载状态在元数据通道中保存，同时处理下一次释放的缓冲，
+            # 同一时间只保存一份下载状态。
+            if saving is not None:
+                await saving
+            saving = asyncio.ensure_future(self._checkpoint())
+            unreleased.task_done()
+
+    def _notify_flushed(self):
+        """ 通知等待数据写入文件的读取者。"""
+        with self._flush_cond:
+            self._flushes += 1
+            self._flush_cond.notify_all()
+            for waiter in self._flush_waiters:
+                waiter()
+
+    @property
+    def flushes(self):
+        """ 缓冲写入文件的次数。"""
+        return self._flushes
+
+    def wait_flushed_threadsafe(self, since, timeout=None):
+        """ 线程安全等待缓冲写入文件。
+
+        Args:
+            since: 调用者上一次读取的flushes，写入次数已变化时立即返回
+            timeout: 最长等待时间
+        """
+        with self._flush_cond:
+            self._flush_cond.wait_for(lambda: self._flushes != since, timeout)
+
+    async def wait_flushed(self, since, timeout=None):
+        """ 在任意事件循环中异步等待缓冲写入文件。参见wait_flushed_threadsafe()。"""
+        def waiter():
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._flush_cond:
+            if self._flushes != since:
+                return
+            self._flush_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._flush_cond:
+                self._flush_waiters.discard(waiter)
+
+    async def _sync(self, buffers):
+        """ 内存映射模式下先以msync同步映射到文件，再计入下载进度的完成长度。
+
+        无论durability如何，保存状态前映射的数据都已落盘，durability只决定状态文件的写入和同步方式。
+        """
+        await h.aio.execute(self._mmap.flush)
+        for pg, lengths in buffers.items():
+            pg.done(sum(lengths))
+
+    def _coalesce(self, buffers):
+        """ 按文件位置排序各下载进度的缓冲数据，合并文件中首尾相接的缓冲数据。
+
+        Args:
+            buffers: {下载进度: 缓冲数据列表}
+
+        Returns:
+            [(文件位置, [(下载进度, 缓冲数据列表, 数据长度), ...]), ...]
+        """
+        regions = []
+        for pg, lines in buffers.items():
+            regions.append((pg.begin + pg.done_length, pg, lines, sum([len(line) for line in lines])))
+        regions.sort(key=itemgetter(0))
+
+        groups = []
+        end = None
+        for offset, pg, lines, length in regions:
+            if offset == end:
+                groups[-1][1].append((pg, lines, length))
+                self._merges += 1
+            else:
+                groups.append((offset, [(pg, lines, length)]))
+            end = offset + length
+        return groups
+
+    async def _write(self, fd, offset, members):
+        """ 将文件中首尾相接的下载进度的缓冲数据一次写入到文件的offset位置。"""
+        await fd.pwritev([line for pg, lines, length in members for line in lines], offset)
+        for pg, lines, length in members:
+            pg.done(length)
+            self._recycle(lines)
 
     async def pause(self):
         if not self._stopped:
@@ -1028,12 +2427,18 @@ class FileTempData(Handler):
             await self._unreleased.put(None)
 
     async def close(self):
-        pass
+        self._pool.clear()
+        self._stored = {}
 
     def info_getter(self):
         return {
             'size': self._counter,
-            'ready': 1
+            'ready': 1,
+            'pending': self._pending,
+            'stalled': self._writable is not None and not self._writable.is_set(),
+            'stalls': self._stalls,
+            'stall_time': self._stall_time,
+            'merges': self._merges,
         }
 
     def __repr__(self):
@@ -1047,20 +2452,25 @@ class AIOReaderWriter(Handler):
 
     负责工作：
         1. 管理IO读写线程
+
+    文件数据的写入由io_workers个线程的数据通道执行，不同位置的写入可以并行，以利用存储设备的队列深度；
+    下载状态等元数据文件的读写由单独的单线程元数据通道执行，不与数据写入互相阻塞。
     """
     name = 'aio'
 
     def __init__(self):
-        self._executor = None
+        self._data_lane = None
+        self._meta_lane = None
         self._writers = set()
 
     async def prepare(self):
-        self._executor = ThreadPoolExecutor(
-            max_workers=1, thread_name_prefix=f'BufferWriter {self.parent.file.name}')
+        name = self.parent.file.name
+        self._data_lane = IOLane(max(1, self.parent.config.io_workers), f'BufferWriter {name}')
+        self._meta_lane = IOLane(1, f'MetaWriter {name}')
 
     @asynccontextmanager
     async def open(self, file, mode='r', *args, **kwargs):
-        """ 异步打开文件。
+        """ 在元数据通道中异步打开文件。
 
         Args:
             file: 参见io.open()方法参数file
@@ -1074,17 +2484,63 @@ class AIOReaderWriter(Handler):
         def async_open():
             return open(file, mode, *args, **kwargs)
 
-        executor = self._executor
-        assert executor
+        lane = self._meta_lane
+        assert lane
         loop = asyncio.get_running_loop()
-        fd = await loop.run_in_executor(executor, async_open)
-        aiofile = AIOFile(executor, fd, loop=loop)
+        fd = await lane.submit(async_open, loop=loop)
+        aiofile = AIOFile(lane, fd, loop=loop)
         self._writers.add(aiofile)
         yield aiofile
         # 关闭文件
-        await loop.run_in_executor(executor, fd.close)
+        await lane.submit(fd.close, loop=loop)
         self._writers.remove(aiofile)
 
+    @asynccontextmanager
+    async def open_raw(self, file, flags=os.O_RDWR, *, direct=False):
+        """ 在数据通道中异步打开文件描述符。
+
+        Args:
+            file: 文件路径
+            flags: 参见os.open()方法参数flags
+            direct: 是否以O_DIRECT绕过页缓存写入对齐的数据，平台或文件系统不支持时忽略
+
+        Returns:
+            异步文件描述符对象AIORawFile，通过pwritev()按位置写入。
+        """
+        lane = self._data_lane
+        assert lane
+        loop = asyncio.get_running_loop()
+        flags |= getattr(os, 'O_BINARY', 0)
+        fd = await lane.submit(os.open, file, flags, loop=loop)
+        direct_fd = None
+        if direct and _HAS_DIRECT:
+            try:
+                direct_fd = await lane.submit(_open_direct, file, flags, fd, loop=loop)
+            except OSError as err:
+                log.debug(f'O_DIRECT is not supported: {err}')
+        rawfile = AIORawFile(lane, fd, loop=loop, direct_fd=direct_fd)
+        self._writers.add(rawfile)
+        try:
+            yield rawfile
+        finally:
+            # 关闭文件
+            await lane.submit(rawfile.close, loop=loop)
+            self._writers.remove(rawfile)
+
+    def execute(self, func, *args, meta=False):
+        """ 在数据通道或元数据通道中执行函数。
+
+        Args:
+            func: 执行的函数
+            *args: 函数参数
+            meta: 是否在元数据通道中执行
+
+        Returns:
+            函数执行结果的Future对象。
+        """
+        lane = self._meta_lane if meta else self._data_lane
+        return lane.submit(func, *args)
+
     async def run(self):
         pass
 
@@ -1092,11 +2548,18 @@ class AIOReaderWriter(Handler):
         for handler in h.iter_all():
             if handler != self:
                 await handler.join()
-        self._executor.shutdown(False)
+        self._data_lane.shutdown(False)
+        self._meta_lane.shutdown(False)
 
     async def pause(self):
         pass
 
+    def info_getter(self):
+        return {
+            'data': self._data_lane and self._data_lane.info(),
+            'meta': self._meta_lane and self._meta_lane.info(),
+        }
+
 
 class AIOFile:
     """ 异步文件读写对象。
@@ -1107,8 +2570,8 @@ class AIOFile:
         {'read', 'readline', 'readlines', 'write', 'writeline',
          'writelines', 'seek', 'flush', 'truncate'})
 
-    def __init__(self, executor, fd, loop=None):
-        self._executor = executor
+    def __init__(self, lane, fd, loop=None):
+        self._lane = lane
         self._fd = fd
         self._loop = loop
 
@@ -1123,7 +2586,7 @@ class AIOFile:
                     handler = partial(getattr(self._fd, item), **kwargs)
                 else:
                     handler = getattr(self._fd, item)
-                fut = loop.run_in_executor(self._executor, handler, *args)
+                fut = self._lane.submit(handler, *args, loop=loop)
                 return fut
             func = ready
 
@@ -1137,3 +2600,200 @@ class AIOFile:
 
     def __repr__(self):
         return f'<AIOFile {self._fd}>'
+
+
+class AIORawFile:
+    """ 异步文件描述符读写对象。
+
+    使用os.pwritev()按位置写入，每次写入以尽量少的系统调用写入多个缓冲数据，
+    不经过Python的文件缓冲，也不依赖文件指针，不同位置的写入可以并发执行。
+
+    提供O_DIRECT文件描述符时，写入范围中按_DIRECT_ALIGN对齐的部分经对齐的中转缓冲绕过页缓存写入，
+    首尾不对齐的部分仍经页缓存写入，并提示内核不保留这些页面。
+    """
+    def __init__(self, lane, fd, loop=None, direct_fd=None):
+        self._lane = lane
+        self._fd = fd
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._direct_fd = direct_fd
+        self._bounce = threading.local()
+
+    def fileno(self):
+        return self._fd
+
+    def fdatasync(self, *, loop=None):
+        """ 同步文件数据到磁盘。
+
+        Returns:
+            同步完成的Future对象。
+        """
+        return self._lane.submit(getattr(os, 'fdatasync', os.fsync), self._fd, loop=loop)
+
+    def close(self):
+        """ 关闭文件描述符。"""
+        if self._direct_fd is not None:
+            os.close(self._direct_fd)
+            self._direct_fd = None
+            _fadvise(self._fd, 0, 0, 'POSIX_FADV_DONTNEED')
+        os.close(self._fd)
+
+    def pwritev(self, buffers, offset, *, loop=None):
+        """ 从文件的offset位置开始依次写入buffers的所有缓冲数据。
+
+        Args:
+            buffers: bytes或memoryview等缓冲数据的列表
+            offset: 写入的文件位置
+
+        Returns:
+            写入完成的Future对象。
+        """
+        if loop is None:
+            loop = asyncio.get_running_loop()
+        return self._lane.submit(self._pwritev, buffers, offset, loop=loop)
+
+    def _pwritev(self, buffers, offset):
+        if self._direct_fd is not None:
+            self._pwritev_direct(buffers, offset)
+        else:
+            self._pwritev_buffered(buffers, offset)
+
+    def _pwritev_direct(self, buffers, offset):
+        total = sum([len(buf) for buf in buffers])
+        end = offset + total
+        start = -(-offset // _DIRECT_ALIGN) * _DIRECT_ALIGN
+        stop = end // _DIRECT_ALIGN * _DIRECT_ALIGN
+        if start >= stop:
+            self._pwritev_buffered(buffers, offset)
+            _fadvise(self._fd, offset, total, 'POSIX_FADV_DONTNEED')
+            return
+
+        if start > offset:
+            self._pwritev_buffered(_slice_buffers(buffers, 0, start - offset), offset)
+            _fadvise(self._fd, offset, start - offset, 'POSIX_FADV_DONTNEED')
+        if end > stop:
+            self._pwritev_buffered(_slice_buffers(buffers, stop - offset, total), stop)
+            _fadvise(self._fd, stop, end - stop, 'POSIX_FADV_DONTNEED')
+
+        bounce = getattr(self._bounce, 'buffer', None)
+        if bounce is None:
+            # 匿名内存映射按页对齐，满足O_DIRECT的内存对齐要求
+            bounce = self._bounce.buffer = mmap.mmap(-1, _DIRECT_BOUNCE_SIZE)
+        with memoryview(bounce) as bounce_view:
+            pos = start
+            while pos < stop:
+                size = min(stop - pos, _DIRECT_BOUNCE_SIZE)
+                filled = 0
+                for piece in _slice_buffers(buffers, pos - offset, pos - offset + size):
+                    bounce_view[filled:filled + len(piece)] = piece
+                    filled += len(piece)
+                try:
+                    self._pwrite_direct(bounce_view[:size], pos)
+                except OSError as err:
+                    if err.errno != errno.EINVAL:
+                        raise
+                    # 文件系统不支持O_DIRECT写入，改为经页缓存写入
+                    log.debug(f'O_DIRECT write failed, fall back to buffered write: {err}')
+                    self._pwrite(bounce_view[:size], pos)
+                pos += size
+
+    def _pwrite_direct(self, view, offset):
+        fd = self._direct_fd
+        with view:
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+
+    def _pwritev_buffered(self, buffers, offset):
+        fd = self._fd
+        if not _HAS_PWRITEV:
+            for buf in buffers:
+                self._pwrite(buf, offset)
+                offset += len(buf)
+            return
+
+        index = 0
+        while index < len(buffers):
+            batch = buffers[index:index + _IOV_MAX]
+            written = os.pwritev(fd, batch, offset)
+            offset += written
+            for buf in batch:
+                if written < len(buf):
+                    break
+                written -= len(buf)
+                index += 1
+            if written:
+                # 缓冲数据只写入了一部分，写入剩余部分
+                with memoryview(buffers[index]) as view, view[written:] as rest:
+                    self._pwrite(rest, offset)
+                    offset += len(rest)
+                index += 1
+
+    def _pwrite(self, buf, offset):
+        """ 从文件的offset位置写入缓冲数据的全部内容。"""
+        fd = self._fd
+        with memoryview(buf) as view:
+            while view:
+                if _HAS_PWRITE:
+                    written = os.pwrite(fd, view, offset)
+                else:
+                    # 没有按位置写入的平台上，定位和写入需保证原子性
+                    with self._lock:
+                        os.lseek(fd, offset, os.SEEK_SET)
+                        written = os.write(fd, view)
+                view = view[written:]
+                offset += written
+
+    def __repr__(self):
+        return f'<AIORawFile {self._fd}>'
+
+
+def _slice_buffers(buffers, start, stop):
+    """ 返回缓冲数据列表依次拼接后[start, stop)范围的memoryview列表。"""
+    pieces = []
+    pos = 0
+    for buf in buffers:
+        length = len(buf)
+        if pos + length > start and pos < stop:
+            view = memoryview(buf)
+            pieces.append(view[max(start - pos, 0):min(stop - pos, length)])
+        pos += length
+        if pos >= stop:
+            break
+    return pieces
+
+
+def _open_direct(file, flags, fd):
+    """ 以O_DIRECT打开文件，并提示内核不保留该文件经页缓存写入的页面。"""
+    direct_fd = os.open(file, flags | os.O_DIRECT)
+    _fadvise(fd, 0, 0, 'POSIX_FADV_NOREUSE')
+    return direct_fd
+
+
+def _fadvise(fd, offset, length, advice):
+    """ 平台支持时调用os.posix_fadvise()，忽略失败。"""
+    advice = getattr(os, advice, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+_HAS_PWRITEV = hasattr(os, 'pwritev')
+_HAS_PWRITE = hasattr(os, 'pwrite')
+_HAS_DIRECT = hasattr(os, 'O_DIRECT') and _HAS_PWRITE
+
+# O_DIRECT写入的文件位置、长度和内存地址对齐大小，4096满足常见的512和4K扇区设备
+_DIRECT_ALIGN = 4096
+# O_DIRECT写入的中转缓冲大小
+_DIRECT_BOUNCE_SIZE = 1024 * 1024
+
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+if _IOV_MAX <= 0:
+    _IOV_MAX = 1024
@@ -0,0 +1,150 @@
+# -*- coding: UTF-8 -*-
+""" 下载进度日志
+
+下载状态以完整快照(.cfg)加追加日志(.cfg.journal)的形式保存。
+每次写入文件后只向日志追加发生变化的下载进度记录，日志超过Journal.COMPACT_SIZE时重新保存完整快照并清空日志。
+恢复下载时先加载快照，再按顺序重放日志记录。
+
+日志格式:
+
++-------+----------+----------+-----+
+| MAGIC | record 1 | record 2 | ... |
++-------+----------+----------+-----+
+
+记录格式: 类型(1字节) + 数据 + CRC32(4字节，覆盖类型和数据)，整数均为小端无符号64位。
+    - DONE:  下载块起点, 完成长度
+    - SLICE: 被切片下载块起点, 新下载块起点, 新下载块终点
+
+写入中断导致的不完整或校验失败的记录及其之后的记录都将被忽略。
+"""
+import struct
+import zlib
+
+__all__ = (
+    'Journal',
+    'replay',
+)
+
+MAGIC = b'NBJ1'
+
+DONE = 1
+SLICE = 2
+
+_RECORDS = {
+    DONE: struct.Struct('<BQQ'),
+    SLICE: struct.Struct('<BQQQ'),
+}
+_CRC = struct.Struct('<I')
+
+# 未知的下载块终点
+_NO_END = 0xffffffffffffffff
+
+
+def _pack(record_type, *values):
+    data = _RECORDS[record_type].pack(record_type, *values)
+    return data + _CRC.pack(zlib.crc32(data))
+
+
+class Journal:
+    """ 下载进度的追加日志记录器。
+
+    只在内存中收集记录，由调用者负责写入日志文件。
+    """
+    # 日志文件超过该大小时保存完整快照
+    COMPACT_SIZE = 1024 * 1024
+
+    def __init__(self):
+        self._pending = []
+        self._size = 0
+        self._snapshotted = False
+
+    def record_done(self, progress):
+        """ 记录下载进度的完成长度。"""
+        self._pending.append(_pack(DONE, progress.begin, progress.done_length))
+
+    def record_slice(self, progress, new_progress):
+        """ 记录从下载进度progress中切片出下载进度new_progress。"""
+        end = new_progress.end
+        if end is None:
+            end = _NO_END
+        self._pending.append(_pack(SLICE, progress.begin, new_progress.begin, end))
+
+    def needs_snapshot(self):
+        """ 返回是否需要保存完整快照。"""
+        return not self._snapshotted or self._size >= Journal.COMPACT_SIZE
+
+    def snapshot(self):
+        """ 在保存完整快照前调用，丢弃快照已包含的记录。
+
+        Returns:
+            清空后日志文件的内容。
+        """
+        self._pending.clear()
+        self._size = len(MAGIC)
+        self._snapshotted = True
+        return MAGIC
+
+    def pop(self):
+        """ 取出待追加到日志文件的记录数据。"""
+        data = b''.join(self._pending)
+        self._pending.clear()
+        self._size += len(data)
+        return data
+
+
+def replay(path, block_grp):
+    """ 将日志文件的记录重放到下载块管理器。
+
+    记录均可重复重放，快照已包含的记录不会改变下载状态。
+
+    Args:
+        path: 日志文件路径
+        block_grp: 从快照加载的BlockGroup对象
+
+    Returns:
+        重放的记录数量，日志文件不存在时返回0。
+    """
+    try:
+        with open(path, 'rb') as fd:
+            data = fd.read()
+    except FileNotFoundError:
+        return 0
+
+    if data[:len(MAGIC)] != MAGIC:
+        return 0
+
+    blocks = {block.progress.begin: block for block in block_grp.unfinished_blocks()}
+    count = 0
+    pos = len(MAGIC)
+    while pos < len(data):
+        record = _RECORDS.get(data[pos])
+        if record is None:
+            break
+        end = pos + record.size
+        if end + _CRC.size > len(data):
+            break
+        crc, = _CRC.unpack_from(data, end)
+        if crc != zlib.crc32(data[pos:end]):
+            break
+
+        record_type, *values = record.unpack_from(data, pos)
+        pos = end + _CRC.size
+        if record_type == DONE:
+            begin, done_length = values
+            block = blocks.get(begin)
+            if block is not None and done_length > block.progress.done_length:
+                progress = block.progress
+                progress.walk_length = progress.done_length = done_length
+                block.refresh()
+        elif record_type == SLICE:
+            begin, put_begin, put_end = values
+            if put_end == _NO_END:
+                put_end = None
+            block = blocks.get(begin)
+            if block is not None and put_begin not in blocks:
+                result = block.slice((put_begin, put_end))
+                if result:
+                    blocks[put_begin] = block_grp.insert(result)
+        count += 1
+
+    return count
@@ -2,10 +2,18 @@
 
 # from ..utils.misc import Component
 # # from .misc import Timer
+from threading import Lock
+from time import monotonic
 
 
 class Progress:
-    __slots__ = '_range', 'walk_length', 'done_length', '_timer'
+    """ 下载进度。
+
+    下载客户端每次接收数据前以claim()申领接收长度，切片只能从已申领的范围之后切出，
+    因此空闲的客户端可以随时从正在下载的下载进度末尾切走未申领的部分，被切片的客户端在下一次申领时停在新的终点。
+    申领只在接收期间有效，接收的数据计入walk()后申领范围随之收回。
+    """
+    __slots__ = '_range', 'walk_length', 'done_length', '_timer', '_claimed', '_claim_time', '_lock'
 
     def __init__(self, range, walk_length=0, done_length=0, increment_time=0):
         begin, end = range
@@ -13,10 +21,14 @@ class Progress:
 
         if done_length != walk_length:
             # 存在下载缓冲未写入文件，下载配置文件可能被非正常关闭。尝试回退下载进度。
-            done_length = walk_length
+            walk_length = done_length
 
         self.walk_length = walk_length
         self.done_length = done_length
+        # 客户端已申领的接收长度
+        self._claimed = walk_length
+        self._claim_time = 0
+        self._lock = Lock()
 
     def is_walk_finished(self):
         return self.walk_length >= self.total_length
@@ -70,8 +82,32 @@ class Progress:
     def percent_complete(self):
         return self.walk_length * 100 / self.total_length
 
+    def claim(self, byte_len):
+        """ 申领接收不超过byte_len长度的数据。
+
+        Returns:
+            允许接收的长度，不大于0表示已到达下载进度的终点。
+        """
+        with self._lock:
+            length = min(byte_len, self.total_length - self.walk_length)
+            self._claimed = self.walk_length + max(length, 0)
+            self._claim_time = monotonic()
+        return length
+
+    def stalled_time(self):
+        """ 返回客户端申领后仍未接收到数据的时长，没有等待中的申领时返回0。"""
+        if self._claimed > self.walk_length:
+            return monotonic() - self._claim_time
+        return 0
+
+    def release(self):
+        """ 收回客户端退出时未接收完的申领。"""
+        with self._lock:
+            self._claimed = self.walk_length
+
     def walk(self, byte_len):
         self.walk_length += byte_len
+        self._claimed = self.walk_length
 
     def done(self, byte_len):
         self.done_length += byte_len
@@ -92,19 +128,21 @@ class Progress:
     def reset(self):
         self.walk_length = 0
         self.done_length = 0
+        self._claimed = 0
 
     def slice(self, request_range):
-        """ 下载进度切片。"""
+        """ 下载进度切片。只能切出客户端已申领的范围之后的部分。"""
         put_begin, put_end = request_range
-        if put_begin > self.begin + self.walk_length:
-            if put_end != self.end:
-                put_end = self.end
-            if put_begin >= put_end:
+        with self._lock:
+            if put_begin > self.begin + max(self.walk_length, self._claimed):
+                if put_end != self.end:
+                    put_end = self.end
+                if put_begin >= put_end:
+                    return None
+            else:
                 return None
-        else:
-            return None
 
-        self._range = (self._range[0], put_begin)
+            self._range = (self._range[0], put_begin)
         return put_begin, put_end
 
     def __repr__(self):
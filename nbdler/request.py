@@ -27,6 +27,34 @@ class RequestConfig:
             **kwargs: 保存提供的额外参数，以在后续提供给下载客户端来让客户端进行选择调整。
                       - downloading_ext: 下载中文件扩展名
                       - interval: 心跳刷新间隔
+                      - max_gap_size: 剩余量不超过该值的下载块作为缺口合并为多范围请求
+                      - max_ranges: 单个多范围请求的最大范围数，小于2则不使用多范围请求
+                      - prewarm: 是否预先建立到下载源的连接，默认False
+                      - dns_ttl: 下载源主机名解析的缓存有效期（秒），每个解析地址作为独立的下载源分配连接，
+                                 默认None由客户端自行解析
+                      - use_mmap: 是否将数据直接接收到下载中文件的内存映射，仅用于大小已知的文件，默认False
+                      - io_workers: 文件数据写入的并行线程数，默认4
+                      - preallocate: 下载中文件的预分配方式，默认sparse
+                                     - sparse: 稀疏文件
+                                     - full: posix_fallocate()分配全部磁盘空间
+                                     - keep_size: fallocate(FALLOC_FL_KEEP_SIZE)分配磁盘空间，文件大小随写入增长
+                      - direct_io: 是否以O_DIRECT绕过页缓存写入文件数据，默认False
+                      - durability: 下载状态的持久性，默认none
+                                    - none: 原地写入状态文件，最快，写入过程中中断可能损坏状态文件
+                                    - atomic: 临时文件写入后重命名，状态文件总是完整，开销可忽略
+                                    - fsync: 先同步文件数据再同步写入状态，最安全，
+                                             每次缓冲释放增加两次磁盘同步
+                      - state_format: 下载状态文件的格式，默认json，binary为块记录按需加载的压缩二进制格式
+                      - memory_high_watermark: 未写入文件的数据量达到该值时暂停客户端接收，默认4倍buffer_size
+                      - memory_low_watermark: 暂停的客户端在未写入的数据量降至该值时恢复，默认高水位的一半
+                      - sequential: 下载块切片是否优先选择文件位置靠前的下载块，
+                                    配合Downloader.stream()边下载边按顺序读取，默认False
+                      - endgame_size: 剩余下载量不超过该值时，空闲的连接从最快的下载源重复请求最慢的下载块的剩余范围，
+                                      先完成者胜出，重复请求会增加带宽和下载源的负载，默认None不竞速，如4194304
+                      - min_slice_size: 切片出的新下载块的最小长度，默认None则取块大小和建立请求期间可传输的数据量
+                                        的4倍中的较大者
+                      - adaptive_concurrency: 并发数自适应调节的上限，并发数从max_concurrent开始，传输速率上升时逐个增加，
+                                              出现超时、429/503响应或速率下降时减半，默认None则固定并发数
         """
         self.file_path = file_path
         self.max_concurrent = max_concurrent
@@ -52,6 +80,7 @@ class RequestConfig:
                        - exception: 异常收集处理器
                        - file_data: 文件缓冲区
                        - aio: 异步文件读写工作线程
+                       - conn_pool: 下载源连接预热器
         """
         for handler in handlers:
             bisect.insort(self.handlers, handler)
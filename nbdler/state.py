@@ -0,0 +1,74 @@
+# -*- coding: UTF-8 -*-
+""" 二进制下载状态格式
+
+格式:
+    头部: MAGIC(4字节) + 版本(1字节) + FLAGS(1字节) + 保留(2字节) + 元数据长度(4字节)
+    元数据JSON
+    下载块管理器
+
+元数据JSON为下载配置、文件和下载源信息，下载块管理器为BlockGroup.pack()的打包数据。
+FLAGS的FLAG_ZLIB位表示块记录经过zlib压缩。
+"""
+import json
+import struct
+
+__all__ = (
+    'pack',
+    'unpack',
+    'is_packed',
+)
+
+MAGIC = b'NBST'
+VERSION = 1
+
+FLAG_ZLIB = 0x01
+
+_HEADER = struct.Struct('<4sBBHI')
+
+
+def is_packed(data):
+    """ 返回数据是否为二进制下载状态格式。"""
+    return data[:len(MAGIC)] == MAGIC
+
+
+def pack(downloader, compress=True):
+    """ 将下载器的下载状态打包为二进制格式。
+
+    Args:
+        downloader: Downloader对象
+        compress: 是否压缩块记录
+
+    Returns:
+        打包的bytes数据。
+    """
+    meta = json.dumps({
+        'config': downloader.config.dumps(),
+        'file': downloader.file.dumps(),
+        'uris': downloader.uris.dumps(),
+    }).encode('utf-8')
+    flags = FLAG_ZLIB if compress else 0
+    return b''.join([
+        _HEADER.pack(MAGIC, VERSION, flags, 0, len(meta)),
+        meta,
+        downloader.block_grp.pack(compress),
+    ])
+
+
+def unpack(data):
+    """ 解包二进制格式的下载状态。
+
+    Returns:
+        Downloader.loads()的参数字典，其中block_grp为已加载的BlockGroup对象。
+    """
+    from nbdler.block import BlockGroup
+
+    magic, version, flags, _, meta_length = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not a packed download state.')
+    if version > VERSION:
+        raise ValueError(f'unsupported download state version: {version}')
+    pos = _HEADER.size
+    dumpy = json.loads(bytes(data[pos:pos + meta_length]).decode('utf-8'))
+    pos += meta_length
+    dumpy['block_grp'] = BlockGroup.unpack(memoryview(data)[pos:], bool(flags & FLAG_ZLIB))
+    return dumpy
@@ -102,6 +102,9 @@ class SourceURI(BaseURI):
         self._response = URIResponse.loads(response) if response else None
         self.kwargs = kwargs
 
+        # 客户端连接固定使用的IP地址，由URIStatusManager在运行时分配，不保存
+        self.address = None
+
     def getresponse(self):
         return self._response
 
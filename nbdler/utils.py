@@ -4,6 +4,13 @@ import asyncio
 from contextlib import contextmanager
 import threading
 from concurrent import futures
+import ipaddress
+import socket
+import errno
+import os
+import logging
+
+log = logging.getLogger(__name__)
 
 
 class UsageInfo:
@@ -47,6 +54,441 @@ class UsageInfo:
         self.rate = sum(self._moving_avg) / 8
 
 
+class ReadSizeController:
+    """ 连接的自适应单次读取粒度控制器。
+
+    根据连接的实时传输速率和连接延迟调整客户端单次读取的数据量。
+    连接越快，单次读取量越接近带宽时延积，以减少读取循环、限速和切片响应的调用次数；
+    限速或连接较慢时缩小单次读取量，保证限速和切片的及时响应。
+    """
+
+    __slots__ = 'min_size', 'max_size', 'size', 'rate', 'delay', '_limit', '_window_start', '_window_length'
+
+    # 速率采样窗口时长
+    WINDOW = 0.1
+    # 单次读取的期望耗时区间，连接延迟限制在该区间内作为带宽时延积的时延
+    MIN_LATENCY = 0.01
+    MAX_LATENCY = 0.1
+
+    def __init__(self, min_size=8192, max_size=262144, delay=None, limit=None):
+        """
+        Args:
+            min_size: 最小单次读取量
+            max_size: 最大单次读取量
+            delay: 连接延迟
+            limit: 返回单次读取量上限的函数，返回None则不限制，如限速时的每连接配额
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.size = min_size
+        self.rate = 0
+        self.delay = delay
+        self._limit = limit
+        self._window_start = time.time()
+        self._window_length = 0
+
+    def update(self, length):
+        """ 记录一次读取的数据量，并在采样窗口结束时调整单次读取量。
+
+        Args:
+            length: 本次读取的数据量
+
+        Returns:
+            调整后的单次读取量。
+        """
+        self._window_length += length
+        cur_time = time.time()
+        diff_time = cur_time - self._window_start
+        if diff_time < self.WINDOW:
+            return self.size
+
+        rate = self._window_length / diff_time
+        self.rate = (self.rate + rate) / 2 if self.rate else rate
+        self._window_start = cur_time
+        self._window_length = 0
+
+        delay = self.delay
+        if delay is None or delay == float('inf'):
+            delay = self.MAX_LATENCY
+        target = self.rate * min(max(delay, self.MIN_LATENCY), self.MAX_LATENCY)
+
+        # 以倍数增减避免读取量随速率抖动频繁变化
+        size = self.size
+        if target >= size * 2:
+            size *= 2
+        elif target < size / 2:
+            size //= 2
+
+        max_size = self.max_size
+        if self._limit is not None:
+            limit = self._limit()
+            if limit is not None:
+                max_size = min(max_size, limit)
+        self.size = max(self.min_size, min(size, max_size))
+        return self.size
+
+    def info(self):
+        return {
+            'size': self.size,
+            'rate': self.rate,
+            'delay': self.delay,
+        }
+
+
+class BufferPool:
+    """ 可复用的bytearray缓冲块池。
+
+    客户端从池中取出固定大小的缓冲块，通过memoryview直接把接收的数据填入缓冲块，
+    填满后的缓冲块不经拷贝交由文件缓冲区保存，写入文件后再归还池中复用。
+    """
+
+    __slots__ = '_size', '_max_free', '_free'
+
+    def __init__(self, size, max_free=64):
+        """
+        Args:
+            size: 缓冲块大小
+            max_free: 池中最多保留的空闲缓冲块数量，超出的缓冲块交由垃圾回收
+        """
+        self._size = size
+        self._max_free = max_free
+        self._free = deque()
+
+    @property
+    def size(self):
+        return self._size
+
+    def acquire(self):
+        """ 取出一个缓冲块，若池中没有空闲的缓冲块则新建。"""
+        try:
+            return self._free.pop()
+        except IndexError:
+            return bytearray(self._size)
+
+    def release(self, buf):
+        """ 归还缓冲块。"""
+        if type(buf) is bytearray and len(buf) == self._size and len(self._free) < self._max_free:
+            self._free.append(buf)
+
+    def clear(self):
+        self._free.clear()
+
+
+class IndexedHeap:
+    """ 可按元素更新键值的最小堆。
+
+    以字典记录元素在堆中的位置，更新或删除任意元素只需O(log n)，不必重新排序全部元素。
+    元素须可哈希，键值须可比较。
+    """
+
+    __slots__ = '_heap', '_index'
+
+    def __init__(self):
+        self._heap = []
+        self._index = {}
+
+    def push(self, item, key):
+        """ 添加元素，元素已存在则更新其键值。"""
+        pos = self._index.get(item)
+        if pos is None:
+            self._heap.append((key, item))
+            pos = len(self._heap) - 1
+            self._index[item] = pos
+            self._sift_up(pos)
+        else:
+            old_key = self._heap[pos][0]
+            self._heap[pos] = (key, item)
+            if key < old_key:
+                self._sift_up(pos)
+            else:
+                self._sift_down(pos)
+
+    def remove(self, item):
+        """ 删除元素，元素不存在则忽略。"""
+        pos = self._index.pop(item, None)
+        if pos is None:
+            return
+        last = self._heap.pop()
+        if pos < len(self._heap):
+            self._heap[pos] = last
+            self._index[last[1]] = pos
+            self._sift_up(pos)
+            self._sift_down(self._index[last[1]])
+
+    def peek(self):
+        """ 返回键值最小的(元素, 键值)。"""
+        key, item = self._heap[0]
+        return item, key
+
+    def pop(self):
+        """ 删除并返回键值最小的(元素, 键值)。"""
+        item, key = self.peek()
+        self.remove(item)
+        return item, key
+
+    def clear(self):
+        self._heap.clear()
+        self._index.clear()
+
+    def _sift_up(self, pos):
+        heap = self._heap
+        entry = heap[pos]
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if not entry[0] < heap[parent][0]:
+                break
+            heap[pos] = heap[parent]
+            self._index[heap[pos][1]] = pos
+            pos = parent
+        heap[pos] = entry
+        self._index[entry[1]] = pos
+
+    def _sift_down(self, pos):
+        heap = self._heap
+        size = len(heap)
+        entry = heap[pos]
+        while True:
+            child = 2 * pos + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if not heap[child][0] < entry[0]:
+                break
+            heap[pos] = heap[child]
+            self._index[heap[pos][1]] = pos
+            pos = child
+        heap[pos] = entry
+        self._index[entry[1]] = pos
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item):
+        return item in self._index
+
+
+class IOLane:
+    """ 统计排队深度和耗时的IO工作线程池。
+
+    耗时为提交到完成的时长，包括在线程池中排队等待的时间。
+    """
+
+    __slots__ = '_executor', 'depth', 'max_depth', 'count', 'total_time', 'max_time'
+
+    def __init__(self, max_workers, thread_name_prefix=''):
+        """
+        Args:
+            max_workers: 工作线程数
+            thread_name_prefix: 工作线程名称前缀
+        """
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.depth = 0
+        self.max_depth = 0
+        self.count = 0
+        self.total_time = 0
+        self.max_time = 0
+
+    def submit(self, func, *args, loop=None):
+        """ 在工作线程中执行函数。
+
+        Returns:
+            函数执行结果的asyncio.Future对象。
+        """
+        if loop is None:
+            loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        def done(fut):
+            elapsed = loop.time() - start
+            self.depth -= 1
+            self.count += 1
+            self.total_time += elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+
+        self.depth += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+        fut = loop.run_in_executor(self._executor, func, *args)
+        fut.add_done_callback(done)
+        return fut
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+
+    def info(self):
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'count': self.count,
+            'latency': self.total_time / (self.count or 1),
+            'max_latency': self.max_time,
+        }
+
+
+PREALLOCATE_MODES = frozenset({'sparse', 'full', 'keep_size'})
+
+# linux/falloc.h
+_FALLOC_FL_KEEP_SIZE = 0x01
+# 文件系统不支持预分配时的错误码
+_UNSUPPORTED_ERRNOS = frozenset({errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL})
+
+_fallocate_func = None
+
+
+def _fallocate(fd, mode, offset, length):
+    """ 调用libc的fallocate()。"""
+    global _fallocate_func
+    if _fallocate_func is None:
+        import ctypes
+        import ctypes.util
+        func = False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            func = getattr(libc, 'fallocate64', None) or libc.fallocate
+        except (OSError, AttributeError, TypeError):
+            pass
+        else:
+            func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+            func.restype = ctypes.c_int
+        _fallocate_func = func
+    if not _fallocate_func:
+        raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS))
+    if _fallocate_func(fd, mode, offset, length) != 0:
+        import ctypes
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def preallocate(fd, size, mode='sparse'):
+    """ 为文件预分配size大小的空间。
+
+    Args:
+        fd: 文件描述符
+        size: 文件大小
+        mode: 预分配方式
+            - sparse: 只设置文件大小，生成稀疏文件
+            - full: posix_fallocate()分配磁盘空间并设置文件大小
+            - keep_size: fallocate(FALLOC_FL_KEEP_SIZE)分配磁盘空间，不改变文件大小
+        平台或文件系统不支持时退化为sparse。
+    """
+    if mode not in PREALLOCATE_MODES:
+        raise ValueError(f'unknown preallocate mode: {mode!r}')
+    try:
+        if mode == 'full':
+            if not hasattr(os, 'posix_fallocate'):
+                raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS))
+            os.posix_fallocate(fd, 0, size)
+            return
+        elif mode == 'keep_size':
+            _fallocate(fd, _FALLOC_FL_KEEP_SIZE, 0, size)
+            return
+    except OSError as err:
+        if err.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+        log.debug(f'preallocate {mode} is not supported, fall back to sparse file: {err}')
+    os.ftruncate(fd, size)
+
+
+def write_atomic(path, data, fsync=False):
+    """ 写入临时文件后重命名为目标文件，中断时目标文件保持原有的完整内容。
+
+    Args:
+        path: 目标文件路径
+        data: 写入的str或bytes数据
+        fsync: 是否在重命名前同步临时文件，并在重命名后同步所在目录
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb' if isinstance(data, bytes) else 'w') as fd:
+        fd.write(data)
+        if fsync:
+            fd.flush()
+            os.fsync(fd.fileno())
+    os.replace(tmp_path, path)
+    if fsync:
+        fsync_dir(os.path.dirname(path) or '.')
+
+
+def append_file(path, data, fsync=False):
+    """ 向文件追加bytes数据。
+
+    Args:
+        path: 文件路径
+        data: 追加的数据
+        fsync: 是否在追加后同步文件
+    """
+    with open(path, 'ab') as fd:
+        fd.write(data)
+        if fsync:
+            fd.flush()
+            os.fsync(fd.fileno())
+
+
+def fsync_dir(path):
+    """ 同步目录，使目录中文件的创建和重命名落盘。不支持打开目录的平台上忽略。"""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class DNSCache:
+    """ 带有效期的主机名解析缓存。
+
+    系统解析器不返回记录的TTL，所有记录使用统一的有效期。
+    """
+
+    __slots__ = 'ttl', '_records'
+
+    def __init__(self, ttl=300):
+        """
+        Args:
+            ttl: 解析记录的有效期（秒）
+        """
+        self.ttl = ttl
+        self._records = {}
+
+    def expired(self, host, port):
+        """ 返回主机的解析记录是否不存在或已过期。"""
+        record = self._records.get((host, port))
+        return record is None or record[0] <= time.time()
+
+    async def resolve(self, host, port):
+        """ 解析主机的所有A/AAAA记录。
+
+        Returns:
+            按解析器返回顺序排列的去重地址列表。
+        """
+        record = self._records.get((host, port))
+        if record is not None and record[0] > time.time():
+            return record[1]
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = []
+        for family, _, _, _, sockaddr in infos:
+            if family in (socket.AF_INET, socket.AF_INET6) and sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        self._records[(host, port)] = (time.time() + self.ttl, addresses)
+        return addresses
+
+
+def is_ip_address(host):
+    """ 返回主机名是否为IP地址。"""
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
 def update_range_field(range_filed, target_range):
     """ 更新范围域。
 
@@ -170,7 +612,7 @@ def cancel_all_tasks(loop):
         task.cancel()
 
     loop.run_until_complete(
-        asyncio.tasks.gather(*to_cancel, loop=loop, return_exceptions=True))
+        asyncio.tasks.gather(*to_cancel, return_exceptions=True))
 
     for task in to_cancel:
         if task.cancelled():
@@ -18,6 +18,10 @@ install_requires = [
     'requests'
 ]
 
+extras_require = {
+    'http2': ['httpx[http2]'],
+}
+
 
 setup(
     name=about['TITLE'],
@@ -37,4 +41,5 @@ setup(
         ],
     packages=find_packages(),
     install_requires=install_requires,
+    extras_require=extras_require,
 )
\ No newline at end of file
@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """ 支持单范围请求的本地下载源，可令首个覆盖stall_at位置的请求在每个分块后停顿。"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        with self.server.lock:
+            self.server.heads += 1
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.data)))
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        data = server.data
+        rng = self.headers.get('Range')
+        if rng:
+            begin, end = rng.split('=')[1].split('-')
+            begin, end = int(begin), int(end) if end else len(data) - 1
+            body = data[begin:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {begin}-{end}/{len(data)}')
+        else:
+            begin, end = 0, len(data) - 1
+            body = data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        delay = 0
+        with server.lock:
+            if rng and server.stall_at is not None and begin <= server.stall_at <= end and not server.stalled:
+                server.stalled = True
+                delay = server.stall_delay
+        view = memoryview(body)
+        try:
+            for i in range(0, len(view), 65536):
+                self.wfile.write(view[i:i + 65536])
+                if delay:
+                    time.sleep(delay)
+        except OSError:
+            pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """ 启动本地下载源，返回服务器对象，url属性为资源链接。"""
+    server = _Server(('127.0.0.1', 0), _RangeHandler)
+    server.data = os.urandom(8 * 1024 * 1024 + 123)
+    server.lock = threading.Lock()
+    server.stall_at = None
+    server.stall_delay = 0
+    server.stalled = False
+    server.heads = 0
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/file.bin'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,130 @@
+# -*- coding: UTF-8 -*-
+
+import os
+
+import pytest
+
+from nbdler import handler
+from nbdler.handler import AIORawFile, _slice_buffers
+
+_pwritev = getattr(os, 'pwritev', None)
+_pwrite = getattr(os, 'pwrite', None)
+
+
+def _buffers(count, size=100):
+    data = os.urandom(count * size)
+    return data, [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.fixture
+def rawfile(tmp_path):
+    path = tmp_path / 'file.bin'
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT)
+    rawfile = AIORawFile(None, fd)
+    yield rawfile, path
+    rawfile.close()
+
+
+def _limited(func, calls, limit):
+    """ 每次最多写入limit字节的写入函数，记录每次调用的缓冲数量。"""
+    def pwritev(fd, buffers, offset):
+        calls.append(len(buffers))
+        truncated = []
+        remain = limit
+        for buf in buffers:
+            if remain <= 0:
+                break
+            truncated.append(memoryview(buf)[:remain])
+            remain -= len(truncated[-1])
+        return func(fd, truncated, offset)
+    return pwritev
+
+
+@pytest.mark.skipif(_pwritev is None, reason='os.pwritev() is not available')
+@pytest.mark.parametrize('limit', [1, 99, 100, 101, 250, 10000])
+def test_pwritev_partial_writes(rawfile, monkeypatch, limit):
+    # 系统调用只写入部分数据时，从中断的位置继续写入剩余的缓冲数据
+    rawfile, path = rawfile
+    data, buffers = _buffers(20)
+    calls = []
+    monkeypatch.setattr(os, 'pwritev', _limited(_pwritev, calls, limit))
+
+    rawfile._pwritev_buffered(buffers, 50)
+
+    assert path.read_bytes() == b'\x00' * 50 + data
+    assert calls
+
+
+@pytest.mark.skipif(_pwritev is None, reason='os.pwritev() is not available')
+def test_pwritev_iov_max_batches(rawfile, monkeypatch):
+    # 每次系统调用的缓冲数量不超过IOV_MAX
+    rawfile, path = rawfile
+    data, buffers = _buffers(10)
+    calls = []
+    monkeypatch.setattr(handler, '_IOV_MAX', 3)
+    monkeypatch.setattr(os, 'pwritev', _limited(_pwritev, calls, len(data)))
+
+    rawfile._pwritev_buffered(buffers, 0)
+
+    assert path.read_bytes() == data
+    assert calls == [3, 3, 3, 1]
+
+
+@pytest.mark.skipif(_pwritev is None, reason='os.pwritev() is not available')
+def test_pwritev_iov_max_partial_batch(rawfile, monkeypatch):
+    rawfile, path = rawfile
+    data, buffers = _buffers(10)
+    calls = []
+    monkeypatch.setattr(handler, '_IOV_MAX', 4)
+    monkeypatch.setattr(os, 'pwritev', _limited(_pwritev, calls, 250))
+
+    rawfile._pwritev_buffered(buffers, 0)
+
+    assert path.read_bytes() == data
+    assert max(calls) <= 4
+
+
+@pytest.mark.skipif(_pwrite is None, reason='os.pwrite() is not available')
+def test_pwrite_fallback(rawfile, monkeypatch):
+    # 没有os.pwritev()的平台上逐个缓冲写入，同样处理部分写入
+    rawfile, path = rawfile
+    data, buffers = _buffers(5)
+    monkeypatch.setattr(handler, '_HAS_PWRITEV', False)
+    monkeypatch.setattr(os, 'pwrite', lambda fd, buf, offset: _pwrite(fd, memoryview(buf)[:33], offset))
+
+    rawfile._pwritev_buffered(buffers, 10)
+
+    assert path.read_bytes() == b'\x00' * 10 + data
+
+
+def test_pwritev_empty(rawfile):
+    rawfile, path = rawfile
+    rawfile._pwritev_buffered([], 0)
+    rawfile._pwritev_buffered([b''], 0)
+
+    assert path.read_bytes() == b''
+
+
+@pytest.mark.skipif(_pwrite is None, reason='os.pwrite() is not available')
+@pytest.mark.parametrize('offset,size', [(0, 8192), (100, 8192), (4096, 100), (4000, 200), (1, 3 * 4096 + 5)])
+def test_pwritev_direct_split(tmp_path, offset, size):
+    # 对齐的部分经中转缓冲写入，首尾不对齐的部分经页缓存写入
+    path = tmp_path / 'file.bin'
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT)
+    rawfile = AIORawFile(None, fd, direct_fd=os.open(str(path), os.O_RDWR))
+    data = os.urandom(size)
+    try:
+        rawfile._pwritev([data[i:i + 1000] for i in range(0, size, 1000)], offset)
+    finally:
+        rawfile.close()
+
+    assert path.read_bytes() == b'\x00' * offset + data
+
+
+def test_slice_buffers():
+    buffers = [b'abc', b'', b'defg', b'hi']
+
+    assert b''.join(_slice_buffers(buffers, 0, 9)) == b'abcdefghi'
+    assert b''.join(_slice_buffers(buffers, 2, 8)) == b'cdefgh'
+    assert b''.join(_slice_buffers(buffers, 3, 7)) == b'defg'
+    assert b''.join(_slice_buffers(buffers, 4, 4)) == b''
@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from nbdler.handler import FileTempData, Handlers, h
+from nbdler.progress import Progress
+
+KB = 1024
+
+
+def _file_data(high=64 * KB, low=16 * KB):
+    config = SimpleNamespace(buffer_size=16 * KB, memory_high_watermark=high, memory_low_watermark=low,
+                             durability='none', use_mmap=False)
+    file_data = FileTempData()
+    file_data.add_parent(SimpleNamespace(config=config))
+    return file_data
+
+
+async def _written(file_data, length):
+    """ 从释放队列取出缓冲，模拟写入length字节。"""
+    while not file_data._unreleased.empty():
+        file_data._unreleased.get_nowait()
+    file_data._written(length)
+    await asyncio.sleep(0.05)
+
+
+def _run(file_data, coro_func):
+    async def main():
+        with h.enter(Handlers(file_data=file_data), asyncio.get_running_loop()):
+            await file_data.prepare()
+            return await coro_func()
+
+    return asyncio.run(main())
+
+
+def test_high_watermark_blocks_store_until_low_watermark():
+    file_data = _file_data()
+    progress = Progress((0, 1 << 20))
+
+    async def main():
+        for _ in range(3):
+            await file_data.store(b'x' * 16 * KB, progress)
+        # 未写入的数据达到高水位时保存数据的客户端暂停
+        task = asyncio.ensure_future(file_data.store(b'x' * 16 * KB, progress))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        assert file_data.info_getter()['stalled']
+        # 暂停前释放全部缓冲
+        assert file_data._counter == 0
+
+        # 降至低水位之前仍然暂停
+        await _written(file_data, 32 * KB)
+        assert not task.done()
+        await _written(file_data, 16 * KB)
+        assert task.done()
+        assert file_data._pending == 16 * KB
+        return file_data.info_getter()
+
+    info = _run(file_data, main)
+
+    assert not info['stalled']
+    assert file_data._stalls == 1
+    assert info['stall_time'] > 0
+
+
+def test_below_high_watermark_does_not_block():
+    file_data = _file_data()
+    progress = Progress((0, 1 << 20))
+
+    async def main():
+        for _ in range(3):
+            await asyncio.wait_for(file_data.store(b'x' * 16 * KB, progress), 1)
+        return file_data.info_getter()
+
+    info = _run(file_data, main)
+
+    assert info['pending'] == 48 * KB
+    assert file_data._stalls == 0
+
+
+def test_store_threadsafe_blocks_thread():
+    # 线程中保存数据的客户端同样在高水位暂停，事件循环不被阻塞
+    file_data = _file_data()
+    progress = Progress((0, 1 << 20))
+    stored = threading.Event()
+
+    def client(handlers, loop):
+        with h.enter(handlers, loop):
+            for _ in range(4):
+                file_data.store_threadsafe(b'x' * 16 * KB, progress)
+        stored.set()
+
+    async def main():
+        thread = threading.Thread(target=client, args=(h.owner, asyncio.get_running_loop()))
+        thread.start()
+        await asyncio.sleep(0.2)
+        assert not stored.is_set()
+        await _written(file_data, 48 * KB)
+        await asyncio.get_running_loop().run_in_executor(None, thread.join, 5)
+        assert stored.is_set()
+
+    _run(file_data, main)
+    assert file_data._stalls == 1
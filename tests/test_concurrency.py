@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+
+import pytest
+
+from nbdler import handler
+from nbdler.handler import ConcurrencyController, _AIMD
+
+INTERVAL = ConcurrencyController.CONTROL_INTERVAL
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(handler, 'time', lambda: now[0])
+    return now
+
+
+def _tick(clock, aimd, rate, congested=False, busy=True, upper=16, guard=0):
+    clock[0] += INTERVAL
+    aimd.update(rate, congested, busy, upper, guard)
+    return aimd.limit
+
+
+def test_additive_increase(clock):
+    # 并发数用满且速率上升超过容差时每个周期加1
+    aimd = _AIMD(4)
+    rates = [100, 120, 140, 160]
+    assert [_tick(clock, aimd, rate) for rate in rates] == [5, 6, 7, 8]
+
+
+def test_no_increase_within_tolerance_or_idle(clock):
+    aimd = _AIMD(4)
+    _tick(clock, aimd, 100)
+    # 速率变化不超过RATE_TOLERANCE时保持不变
+    assert _tick(clock, aimd, 100 * (1 + ConcurrencyController.RATE_TOLERANCE)) == 5
+    # 并发数未用满时速率上升也不增加
+    assert _tick(clock, aimd, 1000, busy=False) == 5
+
+
+def test_multiplicative_decrease_on_congestion(clock):
+    aimd = _AIMD(16)
+    assert _tick(clock, aimd, 100, congested=True) == 8
+    # 减小后CONTROL_INTERVAL * 2秒内速率随之下降，不再减小
+    assert _tick(clock, aimd, 10) == 8
+    # 速率稳定后下降超过容差时乘性减小
+    assert _tick(clock, aimd, 5) == 4
+    assert _tick(clock, aimd, 5) == 4
+
+
+def test_decrease_guard(clock):
+    # guard秒内同一次拥塞的多个响应只减小一次
+    aimd = _AIMD(16)
+    assert aimd.decrease(guard=1)
+    assert not aimd.decrease(guard=1)
+    assert aimd.limit == 8
+    clock[0] += 1
+    assert aimd.decrease(guard=1)
+    assert aimd.limit == 4
+
+
+def test_bounds(clock):
+    aimd = _AIMD(2)
+    for _ in range(5):
+        aimd.decrease()
+    # 并发数至少为1
+    assert aimd.limit == 1
+    aimd = _AIMD(3)
+    rate = 100
+    for _ in range(5):
+        rate *= 2
+        _tick(clock, aimd, rate, upper=4)
+    # 并发数不超过上限
+    assert aimd.limit == 4
+    assert _tick(clock, aimd, rate, upper=2) == 2
+
+
+def test_history(clock):
+    aimd = _AIMD(4)
+    for i in range(ConcurrencyController.HISTORY_SIZE + 5):
+        _tick(clock, aimd, 100)
+    info = aimd.info()
+
+    assert len(info['history']) == ConcurrencyController.HISTORY_SIZE
+    assert info['history'][-1] == (clock[0], info['limit'], 100)
@@ -0,0 +1,108 @@
+# -*- coding: UTF-8 -*-
+
+import asyncio
+import socket
+import time
+from types import SimpleNamespace
+
+from nbdler.client import get_policy
+from nbdler.handler import URIStatusManager
+from nbdler.uri import URIs
+from nbdler.utils import DNSCache
+
+
+class _Resolver:
+    """ 按调用次数依次返回预设地址的getaddrinfo()。"""
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    async def __call__(self, host, port, type=0):
+        addresses = self.results[min(self.calls, len(self.results) - 1)]
+        self.calls += 1
+        return [(socket.AF_INET6 if ':' in a else socket.AF_INET, type, 6, '', (a, port)) for a in addresses]
+
+
+def _run(coro_func, resolver):
+    async def main():
+        asyncio.get_running_loop().getaddrinfo = resolver
+        return await coro_func()
+
+    return asyncio.run(main())
+
+
+def test_dns_cache_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    resolver = _Resolver(['10.0.0.1', '10.0.0.1', '::1'], ['10.0.0.2'])
+    dns = DNSCache(60)
+
+    async def resolve():
+        return await dns.resolve('example.com', 80)
+
+    assert dns.expired('example.com', 80)
+    # 地址去重并保持解析器返回的顺序
+    assert _run(resolve, resolver) == ['10.0.0.1', '::1']
+    assert not dns.expired('example.com', 80)
+
+    now[0] += 59
+    assert _run(resolve, resolver) == ['10.0.0.1', '::1']
+    assert resolver.calls == 1
+
+    now[0] += 1
+    assert dns.expired('example.com', 80)
+    assert _run(resolve, resolver) == ['10.0.0.2']
+    assert resolver.calls == 2
+    # 记录按主机和端口区分
+    assert dns.expired('example.com', 443)
+
+
+def _manager(dns_ttl):
+    uris = URIs()
+    uri = uris.put('http://example.com/file.bin')
+    config = SimpleNamespace(dns_ttl=dns_ttl, client_policy=get_policy(http='aiohttp'))
+    manager = URIStatusManager()
+    manager.add_parent(SimpleNamespace(config=config, uris=uris))
+    return manager, uri
+
+
+def test_address_rotation(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    resolver = _Resolver(['10.0.0.1', '10.0.0.2'], ['10.0.0.2', '10.0.0.3'], [])
+    manager, uri = _manager(60)
+
+    async def main():
+        await manager.prepare()
+        first = [s.address for s in manager.statuses()]
+        # 记录过期后重新解析，不再出现的地址标记为过期，新地址添加状态
+        now[0] += 60
+        await manager._update_addresses(uri)
+        second = [s.address for s in manager.statuses()]
+        # 解析结果为空时保留现有的状态
+        now[0] += 60
+        await manager._update_addresses(uri)
+        third = [s.address for s in manager.statuses()]
+        return first, second, third
+
+    first, second, third = _run(main, resolver)
+
+    assert first == ['10.0.0.1', '10.0.0.2']
+    assert second == ['10.0.0.2', '10.0.0.3']
+    assert third == second
+    assert resolver.calls == 3
+    statuses = list(manager._uri_status.values())
+    assert len(statuses) == 3
+    assert all(s.group is statuses[0].group for s in statuses)
+
+
+def test_dns_ttl_none_does_not_resolve():
+    resolver = _Resolver(['10.0.0.1'])
+    manager, uri = _manager(None)
+
+    async def main():
+        await manager.prepare()
+        return [s.address for s in manager.statuses()]
+
+    assert _run(main, resolver) == [None]
+    assert resolver.calls == 0
@@ -0,0 +1,22 @@
+# -*- coding: UTF-8 -*-
+
+import asyncio
+
+import pytest
+
+import nbdler
+
+
+@pytest.mark.parametrize('client', ['aiohttp', 'requests'])
+def test_download(http_server, tmp_path, client):
+    file_path = tmp_path / 'file.bin'
+
+    async def main():
+        request = nbdler.Request(http_server.url, file_path=str(file_path), max_concurrent=4,
+                                 client_policy=nbdler.get_policy(http=client))
+        dl = await nbdler.dlopen(request)
+        async with dl:
+            await dl.astart()
+
+    asyncio.run(main())
+    assert file_path.read_bytes() == http_server.data
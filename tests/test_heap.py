@@ -0,0 +1,104 @@
+# -*- coding: UTF-8 -*-
+
+import random
+
+from nbdler.utils import IndexedHeap
+
+
+def _drain(heap):
+    result = []
+    while len(heap):
+        result.append(heap.pop())
+    return result
+
+
+def _check_index(heap):
+    # 位置索引与堆中元素一致，且满足最小堆性质
+    entries = heap._heap
+    assert len(heap._index) == len(entries)
+    for pos, (key, item) in enumerate(entries):
+        assert heap._index[item] == pos
+        if pos:
+            assert not key < entries[(pos - 1) >> 1][0]
+
+
+def test_push_pop_order():
+    heap = IndexedHeap()
+    for item, key in [('a', 5), ('b', 1), ('c', 3), ('d', 4), ('e', 2)]:
+        heap.push(item, key)
+
+    assert heap.peek() == ('b', 1)
+    assert _drain(heap) == [('b', 1), ('e', 2), ('c', 3), ('d', 4), ('a', 5)]
+
+
+def test_update_key():
+    heap = IndexedHeap()
+    for i in range(10):
+        heap.push(i, i)
+    # 已存在的元素更新键值，向上或向下调整位置
+    heap.push(9, -1)
+    heap.push(0, 100)
+    heap.push(5, 5)
+    _check_index(heap)
+
+    assert len(heap) == 10
+    assert [item for item, _ in _drain(heap)] == [9, 1, 2, 3, 4, 5, 6, 7, 8, 0]
+
+
+def test_remove():
+    heap = IndexedHeap()
+    for i in range(10):
+        heap.push(i, i)
+    heap.remove(0)
+    heap.remove(9)
+    heap.remove(4)
+    # 不存在的元素忽略
+    heap.remove(4)
+    heap.remove('x')
+    _check_index(heap)
+
+    assert 4 not in heap and 5 in heap
+    assert [item for item, _ in _drain(heap)] == [1, 2, 3, 5, 6, 7, 8]
+
+
+def test_remove_last_moves_up():
+    # 删除元素后以末尾元素填补，末尾元素可能需要向上调整
+    heap = IndexedHeap()
+    for item, key in [('a', 0), ('b', 10), ('c', 1), ('d', 11), ('e', 12), ('f', 2)]:
+        heap.push(item, key)
+    heap.remove('d')
+    _check_index(heap)
+
+    assert _drain(heap) == [('a', 0), ('c', 1), ('f', 2), ('b', 10), ('e', 12)]
+
+
+def test_random_operations():
+    rnd = random.Random(0)
+    heap = IndexedHeap()
+    keys = {}
+    for _ in range(2000):
+        item = rnd.randrange(50)
+        op = rnd.random()
+        if op < 0.6:
+            key = rnd.randrange(1000)
+            heap.push(item, key)
+            keys[item] = key
+        elif op < 0.9:
+            heap.remove(item)
+            keys.pop(item, None)
+        elif keys:
+            item, key = heap.pop()
+            assert key == min(keys.values())
+            assert keys.pop(item) == key
+        _check_index(heap)
+
+    assert [key for _, key in _drain(heap)] == sorted(keys.values())
+
+
+def test_clear():
+    heap = IndexedHeap()
+    heap.push('a', 1)
+    heap.clear()
+
+    assert len(heap) == 0
+    assert 'a' not in heap
@@ -0,0 +1,140 @@
+# -*- coding: UTF-8 -*-
+
+import pytest
+
+from nbdler import journal
+from nbdler.block import BlockGroup
+from nbdler.journal import Journal, MAGIC
+
+CHUNK_SIZE = 16
+TOTAL_SIZE = 16000
+
+
+def _done(block, length):
+    progress = block.progress
+    progress.walk(length - progress.walk_length)
+    progress.done(length - progress.done_length)
+    block.refresh()
+
+
+@pytest.fixture
+def history():
+    """ 从快照开始的下载历史，返回(快照, 日志数据, 每条记录后的下载状态列表)。"""
+    block_grp = BlockGroup(CHUNK_SIZE, TOTAL_SIZE)
+    first = block_grp.insert((0, TOTAL_SIZE))
+    snapshot = block_grp.dumps()
+
+    jn = Journal()
+    data = jn.snapshot()
+    states = []
+
+    def record(func, *args):
+        func(*args)
+        states.append(block_grp.dumps())
+
+    second = block_grp.insert(first.slice((8000, TOTAL_SIZE)))
+    record(jn.record_slice, first.progress, second.progress)
+    _done(first, 1600)
+    record(jn.record_done, first.progress)
+    third = block_grp.insert(second.slice((12000, TOTAL_SIZE)))
+    record(jn.record_slice, second.progress, third.progress)
+    _done(second, 320)
+    record(jn.record_done, second.progress)
+    _done(first, 4000)
+    record(jn.record_done, first.progress)
+    data += jn.pop()
+    return snapshot, data, states
+
+
+def _replay(tmp_path, snapshot, data):
+    path = tmp_path / 'file.cfg.journal'
+    path.write_bytes(data)
+    block_grp = BlockGroup.loads(snapshot)
+    count = journal.replay(str(path), block_grp)
+    return count, block_grp.dumps()
+
+
+def test_replay(history, tmp_path):
+    snapshot, data, states = history
+    count, state = _replay(tmp_path, snapshot, data)
+
+    assert count == len(states)
+    assert state == states[-1]
+
+
+def test_replay_twice(history, tmp_path):
+    # 快照已包含的记录重放后不改变下载状态
+    snapshot, data, states = history
+    path = tmp_path / 'file.cfg.journal'
+    path.write_bytes(data)
+    block_grp = BlockGroup.loads(snapshot)
+    journal.replay(str(path), block_grp)
+    journal.replay(str(path), block_grp)
+
+    assert block_grp.dumps() == states[-1]
+
+
+@pytest.mark.parametrize('cut', [1, 4, 5, 12])
+def test_replay_torn_tail(history, tmp_path, cut):
+    # 写入中断导致最后一条记录不完整时忽略该记录
+    snapshot, data, states = history
+    count, state = _replay(tmp_path, snapshot, data[:-cut])
+
+    assert count == len(states) - 1
+    assert state == states[-2]
+
+
+def test_replay_crc_failed_tail(history, tmp_path):
+    snapshot, data, states = history
+    data = bytearray(data)
+    data[-6] ^= 0xff
+    count, state = _replay(tmp_path, snapshot, bytes(data))
+
+    assert count == len(states) - 1
+    assert state == states[-2]
+
+
+def test_replay_stops_at_corrupted_record(history, tmp_path):
+    # 校验失败的记录之后的记录都被忽略
+    snapshot, data, states = history
+    data = bytearray(data)
+    data[len(MAGIC) + 1] ^= 0xff
+    count, state = _replay(tmp_path, snapshot, bytes(data))
+
+    assert count == 0
+    assert state == snapshot
+
+
+def test_replay_unknown_record(history, tmp_path):
+    snapshot, data, states = history
+    count, state = _replay(tmp_path, snapshot, data + b'\xff' * 32)
+
+    assert count == len(states)
+    assert state == states[-1]
+
+
+def test_replay_missing_or_foreign(tmp_path):
+    block_grp = BlockGroup(CHUNK_SIZE, TOTAL_SIZE)
+    block_grp.insert((0, TOTAL_SIZE))
+    path = tmp_path / 'file.cfg.journal'
+
+    assert journal.replay(str(path), block_grp) == 0
+    path.write_bytes(b'XXXX' + b'\x00' * 32)
+    assert journal.replay(str(path), block_grp) == 0
+    path.write_bytes(b'')
+    assert journal.replay(str(path), block_grp) == 0
+
+
+def test_journal_compaction():
+    jn = Journal()
+    assert jn.needs_snapshot()
+    assert jn.snapshot() == MAGIC
+    assert not jn.needs_snapshot()
+
+    block_grp = BlockGroup(CHUNK_SIZE, TOTAL_SIZE)
+    block = block_grp.insert((0, TOTAL_SIZE))
+    while not jn.needs_snapshot():
+        jn.record_done(block.progress)
+        jn.pop()
+    assert jn.snapshot() == MAGIC
+    assert jn.pop() == b''
@@ -0,0 +1,170 @@
+# -*- coding: UTF-8 -*-
+
+import os
+
+import pytest
+
+from nbdler.client.base_http import BaseHTTPClient, MultipartByterangesParser
+from nbdler.progress import Progress
+
+DATA = os.urandom(4096)
+
+
+def _body(spans, boundary='BND'):
+    body = b''
+    for begin, end in spans:
+        body += (f'\r\n--{boundary}\r\nContent-Type: application/octet-stream\r\n'
+                 f'Content-Range: bytes {begin}-{end - 1}/{len(DATA)}\r\n\r\n').encode() + DATA[begin:end]
+    return body + f'\r\n--{boundary}--\r\n'.encode()
+
+
+def _feed(parser, body, size):
+    parts = []
+    for i in range(0, len(body), size):
+        parts.extend((offset, bytes(data)) for offset, data in parser.feed(body[i:i + size]))
+    return parts
+
+
+def _merge(parts):
+    """ 合并偏移连续的数据部分。"""
+    merged = []
+    for offset, data in parts:
+        if merged and merged[-1][0] + len(merged[-1][1]) == offset:
+            merged[-1] = (merged[-1][0], merged[-1][1] + data)
+        else:
+            merged.append((offset, data))
+    return merged
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 1000, 1 << 20])
+def test_parser_feed_split(size):
+    # 分隔符、部分头部和数据在任意位置被分割到多次feed()
+    spans = [(0, 100), (1000, 1001), (2048, 4096)]
+    parser = MultipartByterangesParser('BND')
+    parts = _feed(parser, _body(spans), size)
+
+    assert parser.finished
+    assert _merge(parts) == [(begin, DATA[begin:end]) for begin, end in spans]
+
+
+def test_parser_data_containing_delimiter():
+    # 数据中出现分隔符时按Content-Range定位，不截断数据
+    data = b'\r\n--BND\r\n' * 10
+    body = (f'--BND\r\nContent-Range: bytes 10-{9 + len(data)}/1000\r\n\r\n').encode() + data + b'\r\n--BND--'
+    parser = MultipartByterangesParser('BND')
+
+    assert _merge(_feed(parser, body, 5)) == [(10, data)]
+    assert parser.finished
+
+
+def test_parser_ignores_data_after_close_delimiter():
+    parser = MultipartByterangesParser('BND')
+    parts = _feed(parser, _body([(0, 10)]) + b'trailing', 4)
+
+    assert parser.finished
+    assert _merge(parts) == [(0, DATA[:10])]
+
+
+def test_parser_missing_content_range():
+    parser = MultipartByterangesParser('BND')
+    with pytest.raises(ValueError):
+        parser.feed(b'--BND\r\nContent-Type: text/plain\r\n\r\nabc')
+
+
+def test_parser_boundary_not_found():
+    parser = MultipartByterangesParser('BND')
+    with pytest.raises(ValueError):
+        parser.feed(b'x' * (MultipartByterangesParser.MAX_HEADER_SIZE + 1))
+
+
+def _client(ranges):
+    client = BaseHTTPClient(None, None, ranges[0], True)
+    client.ranges = ranges
+    return client
+
+
+def test_route_ranges():
+    ranges = [Progress((0, 100)), Progress((1000, 1001)), Progress((2048, 4096))]
+    client = _client(ranges)
+    parser = MultipartByterangesParser('BND')
+    body = _body([(pg.begin, pg.end) for pg in ranges])
+
+    received = {pg: b'' for pg in ranges}
+    for i in range(0, len(body), 33):
+        for pg, data in client._route_ranges(parser.feed(body[i:i + 33])):
+            received[pg] += data
+
+    for pg in ranges:
+        assert pg.is_walk_finished()
+        assert received[pg] == DATA[pg.begin:pg.end]
+
+
+def test_route_ranges_resumed():
+    # 已接收部分数据的下载进度从剩余的位置请求
+    ranges = [Progress((0, 100)), Progress((200, 300))]
+    ranges[0].walk(40)
+    client = _client(ranges)
+
+    routes = client._route_ranges([(40, memoryview(DATA[40:100])), (200, memoryview(DATA[200:300]))])
+
+    assert [(pg, data) for pg, data in routes] == [(ranges[0], DATA[40:100]), (ranges[1], DATA[200:300])]
+    assert all(pg.is_walk_finished() for pg in ranges)
+
+
+def test_route_ranges_coalesced():
+    # 服务器合并相邻范围时，一个数据部分跨越多个下载进度
+    ranges = [Progress((0, 100)), Progress((100, 250))]
+    client = _client(ranges)
+
+    routes = client._route_ranges([(0, memoryview(DATA[:250]))])
+
+    assert routes == [(ranges[0], DATA[:100]), (ranges[1], DATA[100:250])]
+
+
+def test_route_ranges_unexpected():
+    client = _client([Progress((0, 100))])
+    with pytest.raises(ValueError):
+        client._route_ranges([(500, memoryview(DATA[500:510]))])
+
+
+def test_route_ranges_discontinuous():
+    client = _client([Progress((0, 100))])
+    with pytest.raises(ValueError):
+        client._route_ranges([(10, memoryview(DATA[10:20]))])
+
+
+@pytest.mark.parametrize('bad_offset', [250, 500])
+def test_route_ranges_bad_part_after_good_part(bad_offset):
+    # 同一批数据中后面的数据部分无法分配时，前面的数据部分也不计入下载进度
+    ranges = [Progress((0, 100)), Progress((200, 300))]
+    client = _client(ranges)
+    parts = [(0, memoryview(DATA[:100])), (bad_offset, memoryview(DATA[bad_offset:bad_offset + 10]))]
+
+    with pytest.raises(ValueError):
+        client._route_ranges(parts)
+    assert [pg.walk_length for pg in ranges] == [0, 0]
+
+
+def test_route_ranges_coalesced_across_gap():
+    # 服务器合并范围时数据部分跨越未请求的间隔，间隔中的数据被丢弃
+    ranges = [Progress((0, 100)), Progress((200, 300))]
+    client = _client(ranges)
+    parser = MultipartByterangesParser('BND')
+
+    received = {pg: b'' for pg in ranges}
+    for offset, data in _feed(parser, _body([(0, 300)]), 64):
+        for pg, data in client._route_ranges([(offset, memoryview(data))]):
+            received[pg] += data
+
+    assert [received[pg] for pg in ranges] == [DATA[:100], DATA[200:300]]
+    assert all(pg.is_walk_finished() for pg in ranges)
+
+
+def test_route_ranges_part_inside_gap():
+    ranges = [Progress((0, 100)), Progress((200, 300))]
+    client = _client(ranges)
+
+    routes = client._route_ranges([(0, memoryview(DATA[:100])), (150, memoryview(DATA[150:160]))])
+
+    assert routes == [(ranges[0], DATA[:100])]
+    assert [pg.walk_length for pg in ranges] == [100, 0]
@@ -0,0 +1,63 @@
+# -*- coding: UTF-8 -*-
+
+import asyncio
+
+import pytest
+
+import nbdler
+from nbdler.handler import ConnectionPrewarmer, URIStatus
+from nbdler.uri import URIResponse, URIs
+
+
+def _status(uri, final_uri, address):
+    source_uri = URIs().put(uri)
+    source_uri.set_response(URIResponse(final_uri, {}, 200, 'OK', 100, None, None, True))
+    return URIStatus(source_uri, address)
+
+
+@pytest.mark.parametrize('final_uri,address', [
+    ('http://example.com/file.bin', '10.0.0.1'),
+    ('http://example.com/files/file.bin', '10.0.0.1'),
+    ('http://cdn.example.com/file.bin', None),
+])
+def test_target_uri_is_final_uri(final_uri, address):
+    # 预热重定向后的最终链接，重定向到其他主机时不再固定原主机的地址
+    status = _status('http://example.com/file.bin', final_uri, '10.0.0.1')
+    source_uri = ConnectionPrewarmer()._target_uri(status)
+
+    assert source_uri.uri == final_uri
+    assert source_uri.address == address
+    assert status.source_uri.uri == 'http://example.com/file.bin'
+
+
+@pytest.mark.parametrize('client', ['aiohttp', 'requests'])
+def test_prewarm_download(http_server, tmp_path, client):
+    file_path = tmp_path / 'file.bin'
+
+    async def main():
+        request = nbdler.Request(http_server.url, file_path=str(file_path), max_concurrent=4, timeout=30,
+                                 client_policy=nbdler.get_policy(http=client), prewarm=True)
+        dl = await nbdler.dlopen(request)
+        async with dl:
+            await dl.astart()
+
+    asyncio.run(main())
+
+    assert http_server.heads >= 1
+    assert file_path.read_bytes() == http_server.data
+
+
+def test_prewarm_is_opt_in(http_server, tmp_path):
+    file_path = tmp_path / 'file.bin'
+
+    async def main():
+        request = nbdler.Request(http_server.url, file_path=str(file_path), max_concurrent=4, timeout=30,
+                                 client_policy=nbdler.get_policy(http='aiohttp'))
+        dl = await nbdler.dlopen(request)
+        async with dl:
+            await dl.astart()
+
+    asyncio.run(main())
+
+    assert http_server.heads == 0
+    assert file_path.read_bytes() == http_server.data
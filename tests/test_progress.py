@@ -0,0 +1,96 @@
+# -*- coding: UTF-8 -*-
+
+import threading
+
+import pytest
+
+from nbdler.progress import Progress
+
+
+def _assert_partition(block_range, progress, sliced):
+    # 切片前后两个范围不重叠，合起来覆盖原下载块
+    begin, end = block_range
+    assert progress.begin == begin
+    assert progress.end == sliced[0]
+    assert sliced[1] == end
+    assert progress.begin <= progress.end <= sliced[0] < sliced[1]
+
+
+@pytest.mark.parametrize('put_begin', [1, 100, 4096, 4097, 8000])
+def test_slice_between_claim_and_walk(put_begin):
+    # 客户端申领后、接收前切片，切出的范围在申领的范围之后
+    progress = Progress((0, 10000))
+    progress.walk(100)
+    assert progress.claim(4096) == 4096
+
+    sliced = progress.slice((put_begin, 10000))
+
+    if put_begin <= 100 + 4096:
+        assert sliced is None
+        assert progress.range == (0, 10000)
+    else:
+        _assert_partition((0, 10000), progress, sliced)
+    # 申领的数据全部落在切片后的下载进度内
+    progress.walk(4096)
+    assert progress.walk_length <= progress.total_length
+
+
+def test_slice_after_release():
+    # 客户端退出收回申领后，已接收位置之后的范围可以切出
+    progress = Progress((0, 10000))
+    progress.walk(100)
+    progress.claim(4096)
+    assert progress.slice((2000, 10000)) is None
+
+    progress.release()
+    sliced = progress.slice((2000, 10000))
+
+    _assert_partition((0, 10000), progress, sliced)
+    assert sliced == (2000, 10000)
+
+
+def test_claim_is_bounded_by_slice():
+    # 切片后的申领不超过新的终点
+    progress = Progress((0, 10000))
+    progress.claim(100)
+    progress.walk(100)
+    assert progress.slice((5000, 10000)) == (5000, 10000)
+
+    assert progress.claim(8192) == 4900
+    progress.walk(4900)
+    assert progress.is_walk_finished()
+    assert progress.claim(8192) <= 0
+
+
+def test_concurrent_claim_walk_and_slice():
+    # 接收线程申领并接收的同时另一线程不断切片，接收的数据不超出切片后的范围
+    total = 1 << 20
+    progress = Progress((0, total))
+    slices = []
+    stop = threading.Event()
+
+    def receive():
+        while True:
+            length = progress.claim(1000)
+            if length <= 0:
+                break
+            progress.walk(length)
+        stop.set()
+
+    thread = threading.Thread(target=receive)
+    thread.start()
+    end = total
+    while not stop.is_set():
+        put_begin = progress.begin + (progress.end - progress.begin) // 2
+        result = progress.slice((put_begin, progress.end))
+        if result is not None:
+            assert result[1] == end
+            slices.append(result)
+            end = result[0]
+    thread.join()
+
+    assert progress.walk_length == progress.total_length
+    ranges = sorted([progress.range] + slices)
+    assert ranges[0][0] == 0 and ranges[-1][1] == total
+    for (_, prev_end), (begin, _) in zip(ranges, ranges[1:]):
+        assert prev_end == begin
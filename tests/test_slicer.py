@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+
+from types import SimpleNamespace
+
+import pytest
+
+from nbdler.block import BlockGroup
+from nbdler.handler import BlockSlicer, Handlers, h
+
+CHUNK_SIZE = 1024
+
+
+class _Loop:
+    pass
+
+
+class _FileData:
+    def __init__(self):
+        self.slices = []
+
+    def record_slice(self, source, target):
+        self.slices.append((source.range, target.range))
+
+
+@pytest.fixture
+def slicer():
+    def make(total_size, min_slice_size=None, sequential=False):
+        block_grp = BlockGroup(CHUNK_SIZE, total_size)
+        block_grp.insert((0, total_size))
+        config = SimpleNamespace(min_slice_size=min_slice_size, sequential=sequential)
+        slicer = BlockSlicer()
+        slicer.add_parent(SimpleNamespace(config=config, block_grp=block_grp))
+        for block in block_grp.unfinished_blocks():
+            slicer._update(block)
+        return slicer, block_grp
+
+    loop = _Loop()
+    handlers = Handlers(file_data=_FileData())
+    with h.enter(handlers, loop):
+        yield make
+
+
+@pytest.mark.parametrize('sequential', [False, True])
+def test_refuse_slice_below_min_slice_size(slicer, sequential):
+    # 新下载块小于min_slice_size时拒绝切片，下载块保持不变并计入拒绝次数
+    slicer, block_grp = slicer(64 * CHUNK_SIZE, min_slice_size=33 * CHUNK_SIZE, sequential=sequential)
+
+    assert slicer.steal() is None
+    assert [b.progress.range for b in block_grp.unfinished_blocks()] == [(0, 64 * CHUNK_SIZE)]
+    assert slicer._slices == 0
+    assert slicer._refused == 1
+    assert h.file_data.slices == []
+
+
+@pytest.mark.parametrize('sequential', [False, True])
+def test_slice_at_min_slice_size(slicer, sequential):
+    slicer, block_grp = slicer(64 * CHUNK_SIZE, min_slice_size=32 * CHUNK_SIZE, sequential=sequential)
+
+    block = slicer.steal()
+
+    assert block is not None
+    assert block.progress.range == (32 * CHUNK_SIZE, 64 * CHUNK_SIZE)
+    assert slicer._slices == 1
+    assert slicer._refused == 0
+    # 剩余的下载块切片过小，不再切片
+    assert slicer.steal() is None
+    assert len(block_grp.unfinished_blocks()) == 2
+
+
+def test_min_slice_size_is_at_least_chunk(slicer):
+    slicer, _ = slicer(64 * CHUNK_SIZE, min_slice_size=1)
+
+    assert slicer.min_slice_size() == CHUNK_SIZE
+
+
+def test_estimated_min_slice_size(slicer):
+    # 未配置min_slice_size时按传输速率和连接延迟估计
+    slicer, block_grp = slicer(64 * CHUNK_SIZE)
+    slicer._min_size = 40 * CHUNK_SIZE
+
+    assert slicer.min_slice_size() == 40 * CHUNK_SIZE
+    assert slicer.steal() is None
+    assert slicer._refused == 1
+
+    slicer._min_size = 0
+    assert slicer.steal() is not None
+    assert len(block_grp.unfinished_blocks()) == 2
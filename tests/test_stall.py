@@ -0,0 +1,47 @@
+# -*- coding: UTF-8 -*-
+
+import asyncio
+import time
+
+import nbdler
+
+
+def _download(server, file_path, client, **kwargs):
+    async def main():
+        request = nbdler.Request(server.url, file_path=file_path, max_concurrent=4, timeout=30,
+                                 client_policy=nbdler.get_policy(http=client), **kwargs)
+        dl = await nbdler.dlopen(request)
+        async with dl:
+            start = time.monotonic()
+            await dl.astart()
+            elapsed = time.monotonic() - start
+            info = dl._handlers.client_worker.info_getter()
+        return elapsed, info
+
+    return asyncio.run(main())
+
+
+def test_requests_race_interrupts_stalled_block(http_server, tmp_path):
+    # 停顿的连接在超时前被竞速连接取代，阻塞中的读取应立即返回而不是等到超时
+    http_server.stall_at = len(http_server.data) * 9 // 10
+    http_server.stall_delay = 20
+    file_path = tmp_path / 'file.bin'
+    elapsed, info = _download(http_server, str(file_path), 'requests', endgame_size=4 * 1024 * 1024)
+
+    assert http_server.stalled
+    assert info['race_wins'] >= 1
+    assert elapsed < 10
+    assert file_path.read_bytes() == http_server.data
+
+
+def test_requests_stalled_read_is_interrupted(http_server, tmp_path):
+    # 不竞速时，并发空闲后停滞的读取被中断，下载块以新的连接重试
+    http_server.stall_at = len(http_server.data) * 9 // 10
+    http_server.stall_delay = 20
+    file_path = tmp_path / 'file.bin'
+    elapsed, info = _download(http_server, str(file_path), 'requests')
+
+    assert http_server.stalled
+    assert info['interrupts'] >= 1
+    assert elapsed < 10
+    assert file_path.read_bytes() == http_server.data
@@ -0,0 +1,101 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+from nbdler import state
+from nbdler.block import BlockGroup
+from nbdler.client import get_policy
+from nbdler.download import DownloadConfigure
+from nbdler.file import File
+from nbdler.uri import URIs
+
+CHUNK_SIZE = 16
+
+
+def _normalize(dumpy):
+    return json.loads(json.dumps(dumpy))
+
+
+def _downloader(total_size):
+    uris = URIs()
+    uris.put('http://example.com/file.bin', headers={'X-Token': 'abc'}, max_conn=4)
+    uris.put('http://mirror.example.com/file.bin', name='mirror')
+    config = DownloadConfigure(True, 4, CHUNK_SIZE, 1024, client_policy=get_policy(), sequential=True)
+
+    block_grp = BlockGroup(CHUNK_SIZE, total_size, duration=1.5)
+    first = block_grp.insert((0, total_size))
+    if total_size is not None:
+        second = block_grp.insert(first.slice((total_size // 2, total_size)))
+        second.progress.walk(100)
+        second.progress.done(100)
+        second.refresh()
+    first.progress.walk(1000)
+    first.progress.done(1000)
+    first.refresh()
+    return SimpleNamespace(config=config, file=File('/tmp', 'file.bin', total_size), uris=uris, block_grp=block_grp)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+@pytest.mark.parametrize('total_size', [16000, 16001, None])
+def test_pack_unpack(compress, total_size):
+    downloader = _downloader(total_size)
+    data = state.pack(downloader, compress)
+    dumpy = state.unpack(data)
+
+    assert state.is_packed(data)
+    assert dumpy['config'] == _normalize(downloader.config.dumps())
+    assert dumpy['file'] == downloader.file.dumps()
+    assert dumpy['uris'] == _normalize(downloader.uris.dumps())
+    block_grp = dumpy['block_grp']
+    assert block_grp.dumps() == downloader.block_grp.dumps()
+    assert [b.progress.range for b in block_grp.unfinished_blocks()] == \
+           [b.progress.range for b in downloader.block_grp.unfinished_blocks()]
+
+
+def test_unpack_lazy_chunks():
+    # 块记录在首次访问时才解包
+    downloader = _downloader(16000)
+    block_grp = state.unpack(state.pack(downloader))['block_grp']
+    block = block_grp.unfinished_blocks()[0]
+    expected = downloader.block_grp.unfinished_blocks()[0]
+
+    assert block._chunks is None
+    assert [list(c) for c in block.chunks] == [list(c) for c in expected.chunks]
+    assert block._packed is None
+
+
+def test_unpack_memoryview():
+    downloader = _downloader(16000)
+    data = memoryview(b'\x00' * 8 + state.pack(downloader))[8:]
+
+    assert state.unpack(data)['block_grp'].dumps() == downloader.block_grp.dumps()
+
+
+def test_json_state_is_not_packed():
+    downloader = _downloader(16000)
+    data = json.dumps({'block_grp': downloader.block_grp.dumps()}).encode('utf-8')
+
+    assert not state.is_packed(data)
+    with pytest.raises(ValueError):
+        state.unpack(data + b'\x00' * 16)
+
+
+def test_unpack_newer_version():
+    data = bytearray(state.pack(_downloader(16000)))
+    data[4] = state.VERSION + 1
+    with pytest.raises(ValueError):
+        state.unpack(bytes(data))
+
+
+def test_block_group_pack_header():
+    # 下载块管理器头部在最前，加载时无需解析块记录
+    downloader = _downloader(16000)
+    block_grp = downloader.block_grp
+    data = block_grp.pack()
+    count = len(block_grp.unfinished_blocks())
+
+    assert struct.unpack_from('<QqdI', data) == (CHUNK_SIZE, 16000, 1.5, count)